@@ -4,3 +4,33 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from .logic import metrics
+        from .logic.cache import get_geocode_cache, get_place_cache, get_route_cache
+        from .logic.poi_index import get_poi_index
+        from .logic.resilience import get_ors_guard
+
+        metrics.registry.register_gauge(
+            'geocode_cache_entries', lambda: len(get_geocode_cache().local), 'Entries in the in-process geocode cache.',
+        )
+        metrics.registry.register_gauge(
+            'route_cache_entries', lambda: len(get_route_cache().routes), 'Routes held in the in-process route cache.',
+        )
+        metrics.registry.register_gauge(
+            'route_cache_bytes', lambda: get_route_cache().routes.current_bytes, 'Approximate size of the route cache.',
+        )
+        metrics.registry.register_gauge(
+            'place_cache_entries', lambda: len(get_place_cache().local), 'Grid cells in the in-process place name cache.',
+        )
+        metrics.registry.register_gauge(
+            'poi_index_entries', lambda: len(get_poi_index()), 'Truck stop POIs loaded into the spatial index.',
+        )
+        metrics.registry.register_gauge(
+            'ors_circuit_state', lambda: get_ors_guard().circuit_states(),
+            'ORS circuit breaker state per endpoint (0 closed, 1 half-open, 2 open).',
+        )
+        metrics.registry.register_gauge(
+            'ors_rate_limit_remaining', lambda: get_ors_guard().limiter.remaining() if get_ors_guard().limiter else [],
+            'ORS requests left in the current quota window.',
+        )
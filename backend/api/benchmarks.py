@@ -0,0 +1,299 @@
+"""Benchmark suite for the HOS engine and the trip API.
+
+Run with ``manage.py benchmark``. ORS is replaced by the in-process
+``StandInClient`` so timings measure this code base rather than the
+network, and the API benchmarks run against a throwaway test database.
+Results are plain JSON so runs from different commits can be compared
+with ``compare_results``.
+"""
+import gc
+import json
+import math
+import time
+import platform
+import datetime
+import statistics
+import subprocess
+from contextlib import contextmanager
+
+import django
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from .logic import ors_client
+from .logic.batch_schedule import fuel_stop_times_from_distances, schedule_batch
+from .logic.cache import GeocodeCache, PlaceCache, RouteCache, get_geocode_cache, get_place_cache, get_route_cache
+from .logic.duty_log import DRIVING, OFF_DUTY, ON_DUTY, SLEEPER_BERTH, STATUS_NAMES, DutyLog
+from .logic.hos_calculator import HosCalculator
+from .logic.ors_standin import StandInClient, DETOUR_FACTOR
+from .models import TripHistory
+
+TRIP_MILES = [50, 250, 500, 1000, 2500, 5000]
+CYCLE_HOURS = [0, 35, 69]
+HISTORY_ROWS = 500
+
+# Great-circle miles per degree of longitude along the equator (R = 6371 km)
+MILES_PER_DEGREE = 69.093
+
+
+def trip_points(miles, pickup_share=0.2):
+    """Start/pickup/dropoff coordinate strings whose stand-in road distance is ``miles``."""
+    span = miles / DETOUR_FACTOR / MILES_PER_DEGREE
+    west = -120.0
+    return (
+        f"0.0,{west:.5f}",
+        f"0.0,{west + span * pickup_share:.5f}",
+        f"0.0,{west + span:.5f}",
+    )
+
+
+def measure(fn, repeat=5, number=1, warmup=1):
+    """Time ``fn``; returns per-call statistics in seconds over ``repeat`` rounds of ``number`` calls."""
+    for _ in range(warmup):
+        fn()
+    gc_was_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter_ns()
+            for _ in range(number):
+                fn()
+            samples.append((time.perf_counter_ns() - started) / number / 1e9)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        'min': samples[0],
+        'median': median,
+        'mean': statistics.fmean(samples),
+        'p95': samples[min(len(samples) - 1, math.ceil(0.95 * len(samples)) - 1)],
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'ops_per_sec': 1 / median if median else None,
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+def _clear_shared_caches():
+    get_geocode_cache().local.clear()
+    get_route_cache().routes.clear()
+    get_route_cache().lane_profiles.clear()
+    get_place_cache().local.clear()
+    for alias in {settings.GEOCODE_CACHE_ALIAS, settings.PLACE_CACHE_ALIAS} - {''}:
+        caches[alias].clear()
+
+
+def engine_benchmarks(engine, scale):
+    """``calculate_trip`` with ORS mocked, cold caches, over the trip-length x cycle-hours grid."""
+    for miles in TRIP_MILES:
+        start, pickup, dropoff = trip_points(miles)
+        for cycle_hours in CYCLE_HOURS:
+            def run(start=start, pickup=pickup, dropoff=dropoff, cycle_hours=cycle_hours):
+                calculator = HosCalculator(
+                    'benchmark', geocode_cache=GeocodeCache(alias=''), route_cache=RouteCache(),
+                    place_cache=PlaceCache(alias=''), schedule_engine=engine,
+                )
+                result = calculator.calculate_trip(start, pickup, dropoff, cycle_hours)
+                if 'error' in result:
+                    raise RuntimeError(result['error'])
+            yield f"calculate_trip[miles={miles},cycle={cycle_hours}]", run, max(1, 5 * scale)
+
+
+def micro_benchmarks(scale):
+    """``DutyLog.add``, closing a day and rendering a day log, in isolation."""
+    hos_after = (30000, 40000, 20000, 200000)
+    morning = datetime.datetime(2025, 3, 10, 6, 0)
+    late_evening = datetime.datetime(2025, 3, 10, 23, 0)
+
+    def add_same_day():
+        DutyLog(morning).add(DRIVING, 3 * 3600, 'Driving', 'Denver, CO', hos_after)
+
+    def add_midnight_split():
+        DutyLog(late_evening).add(DRIVING, 2 * 3600, 'Driving', 'Denver, CO', hos_after)
+
+    def day_log(total_hours):
+        durations = [0.25, 5, 0.5, 3, 1, 2.75, total_hours - 12.5]
+        statuses = [ON_DUTY, DRIVING, OFF_DUTY, DRIVING, ON_DUTY, DRIVING, SLEEPER_BERTH]
+        logs = DutyLog(datetime.datetime(2025, 3, 10, 0, 0))
+        for status, hours in zip(statuses, durations):
+            logs.add(status, hours * 3600, STATUS_NAMES[status], 'Denver, CO', hos_after)
+        return logs.days[-1]
+
+    full_day = day_log(24)
+    partial_day = day_log(20)
+
+    def finalize_full_day():
+        full_day.finalize()
+
+    def finalize_partial_day():
+        partial_day.finalize()
+        # Drop the Off Duty filler so every call sees the same 20-hour day
+        filler = partial_day.events.pop()
+        partial_day.seconds -= filler.duration
+        partial_day.totals[filler.status] -= filler.duration / 3600
+
+    full_day.finalize()
+
+    def render_full_day():
+        full_day.render()
+
+    number = max(1, 2000 * scale)
+    yield 'DutyLog.add[same_day]', add_same_day, number
+    yield 'DutyLog.add[midnight_split]', add_midnight_split, number
+    yield 'DayLog.finalize[full_day]', finalize_full_day, number
+    yield 'DayLog.finalize[partial_day]', finalize_partial_day, number
+    yield 'DayLog.render[full_day]', render_full_day, number
+
+
+def batch_benchmarks(scale):
+    """``schedule_batch`` over a fleet of random start/pickup/dropoff trips."""
+    rng = np.random.default_rng(0)
+    for trips in (1000, 100000):
+        leg_seconds = rng.uniform(0, 40 * 3600, (trips, 2))
+        fuel_stop_times = fuel_stop_times_from_distances(leg_seconds, leg_seconds * 25)
+        cycle_hours_used = rng.uniform(0, 70, trips)
+        start_time = datetime.datetime(2025, 3, 10, 6, 0)
+
+        def run(leg_seconds=leg_seconds, fuel_stop_times=fuel_stop_times, cycle_hours_used=cycle_hours_used):
+            schedule_batch(leg_seconds, cycle_hours_used, start_time, fuel_stop_times)
+        yield f"schedule_batch[trips={trips}]", run, max(1, 5 * scale)
+
+
+def api_benchmarks(scale, history_rows):
+    """End-to-end ``TripCalculatorView`` and ``TripHistoryView`` through the Django test client."""
+    client = Client()
+    start, pickup, dropoff = trip_points(1000)
+    body = json.dumps({
+        'start_location': start,
+        'pickup_location': pickup,
+        'dropoff_location': dropoff,
+        'cycle_hours_used': 35,
+    })
+
+    def post_trip():
+        response = client.post('/api/calculate-trip/', body, content_type='application/json')
+        if response.status_code != 200:
+            raise RuntimeError(f"calculate-trip returned {response.status_code}: {response.content[:200]}")
+
+    def post_trip_cold():
+        _clear_shared_caches()
+        post_trip()
+
+    number = max(1, 5 * scale)
+    yield 'TripCalculatorView[miles=1000,cache=warm]', post_trip, number
+    yield 'TripCalculatorView[miles=1000,cache=cold]', post_trip_cold, number
+
+    def seed_history():
+        TripHistory.objects.all().delete()
+        result = HosCalculator('benchmark', ors_client=StandInClient()).calculate_trip(start, pickup, dropoff, 35)
+        rows = []
+        for i in range(history_rows):
+            entry = TripHistory(
+                start_location=f"Start {i}",
+                pickup_location=f"Pickup {i}",
+                dropoff_location=f"Dropoff {i}",
+                cycle_hours_used=i % 70,
+            )
+            entry.store_result(result)
+            rows.append(entry)
+        TripHistory.objects.bulk_create(rows, batch_size=500)
+
+    def get_history():
+        response = client.get('/api/history/')
+        if response.status_code != 200:
+            raise RuntimeError(f"history returned {response.status_code}")
+
+    seed_history()
+    yield f'TripHistoryView.get[rows={history_rows}]', get_history, max(1, 20 * scale)
+
+
+@contextmanager
+def benchmark_environment(engine):
+    """Mock ORS, use a throwaway test database and pin the schedule engine for the duration."""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    ors_client.set_ors_client(StandInClient())
+    try:
+        with override_settings(ORS_API_KEY=settings.ORS_API_KEY or 'benchmark', HOS_SCHEDULE_ENGINE=engine):
+            yield
+    finally:
+        ors_client.set_ors_client(None)
+        _clear_shared_caches()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5, cwd=settings.BASE_DIR,
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_benchmarks(engine=None, name_filter=None, quick=False, history_rows=HISTORY_ROWS, repeat=None, progress=None):
+    """Run every benchmark whose name contains ``name_filter`` and return the results document."""
+    engine = engine or settings.HOS_SCHEDULE_ENGINE
+    scale = 1 if not quick else 0
+    repeat = repeat or (3 if quick else 7)
+    results = {}
+    with benchmark_environment(engine):
+        for group in (engine_benchmarks(engine, scale), micro_benchmarks(scale), batch_benchmarks(scale),
+                      api_benchmarks(scale, history_rows)):
+            for name, fn, number in group:
+                if name_filter and name_filter not in name:
+                    continue
+                results[name] = measure(fn, repeat=repeat, number=number)
+                if progress:
+                    progress(name, results[name])
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'created_at': datetime.datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'platform': platform.platform(),
+            'database': connection.vendor,
+            'schedule_engine': engine,
+            'quick': quick,
+        },
+        'benchmarks': results,
+    }
+
+
+def compare_results(baseline, current, threshold=10.0):
+    """Compare median timings; returns rows of ``(name, base, current, change_pct, verdict)``.
+
+    ``verdict`` is 'regression' or 'improvement' when the median moved by
+    more than ``threshold`` percent, otherwise 'same'; benchmarks present in
+    only one run are reported as 'new' or 'removed'.
+    """
+    base = baseline.get('benchmarks', {})
+    cur = current.get('benchmarks', {})
+    rows = []
+    for name in list(base) + [name for name in cur if name not in base]:
+        if name not in cur:
+            rows.append((name, base[name]['median'], None, None, 'removed'))
+            continue
+        if name not in base:
+            rows.append((name, None, cur[name]['median'], None, 'new'))
+            continue
+        before, after = base[name]['median'], cur[name]['median']
+        change = (after - before) / before * 100 if before else 0.0
+        if change > threshold:
+            verdict = 'regression'
+        elif change < -threshold:
+            verdict = 'improvement'
+        else:
+            verdict = 'same'
+        rows.append((name, before, after, change, verdict))
+    return rows
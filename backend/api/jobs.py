@@ -0,0 +1,254 @@
+"""Background trip calculations and history purges backed by the ``TripJob`` table.
+
+``POST /api/jobs/`` stores a queued job and returns its id at once. A job is
+run by whichever worker claims it first: the in-process thread pool
+(``TRIP_JOB_EXECUTOR='thread'``) or ``manage.py run_trip_worker`` processes,
+which can be scaled separately from the web workers. Claiming is a
+conditional UPDATE on the status, so any number of workers can poll the same
+table without running a job twice.
+"""
+import os
+import time
+import socket
+import logging
+import datetime
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from .logic import metrics
+from .logic.hos_calculator import HosCalculator
+from .models import TripHistory, TripJob
+from .retention import purge_history, purge_queryset
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+
+def claim_job(job_id=None, worker=''):
+    """Mark job ``job_id`` (or the oldest queued job) as running; returns it, or None if already taken."""
+    if job_id is not None:
+        candidates = [job_id]
+    else:
+        candidates = TripJob.objects.filter(
+            status=TripJob.STATUS_QUEUED,
+        ).order_by('created_at').values_list('id', flat=True)[:10]
+    for pk in candidates:
+        claimed = TripJob.objects.filter(pk=pk, status=TripJob.STATUS_QUEUED).update(
+            status=TripJob.STATUS_RUNNING,
+            started_at=timezone.now(),
+            worker=worker[:128],
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return TripJob.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """Run a claimed job and store its outcome."""
+    try:
+        if job.kind == TripJob.KIND_HISTORY_PURGE:
+            _run_history_purge(job)
+        else:
+            _run_trip(job)
+    except Exception as e:
+        logger.error(f"Unexpected error in {job.kind} job {job.id}: {str(e)}", exc_info=True)
+        job.status = TripJob.STATUS_FAILED
+        job.error = 'An unexpected error occurred.'
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=[
+        'status', 'error', 'result_data', 'result_encoding', 'history_entry', 'progress', 'finished_at',
+    ])
+    metrics.inc('trip_jobs_total', kind=job.kind, status=job.status)
+    if job.started_at:
+        metrics.observe('trip_job_seconds', (job.finished_at - job.started_at).total_seconds(), kind=job.kind)
+
+    if job.callback_url:
+        deliver_callback(job)
+    return job
+
+
+def _run_trip(job):
+    """Calculate the job's trip and save it to history, like ``TripCalculatorView`` does."""
+    calculator = HosCalculator(api_key=settings.ORS_API_KEY)
+    result = calculator.calculate_trip(
+        job.start_location,
+        job.pickup_location,
+        job.dropoff_location,
+        job.cycle_hours_used,
+    )
+    if 'error' in result:
+        logger.error(f"Trip job {job.id} failed: {result['error']}")
+        job.status = TripJob.STATUS_FAILED
+        job.error = result['error']
+        return
+
+    job.store_result(result)
+    job.status = TripJob.STATUS_SUCCEEDED
+    try:
+        history_entry = TripHistory(
+            start_location=job.start_location,
+            pickup_location=job.pickup_location,
+            dropoff_location=job.dropoff_location,
+            cycle_hours_used=job.cycle_hours_used,
+        )
+        with metrics.span('db_write'):
+            history_entry.result_data, history_entry.result_encoding = job.result_data, job.result_encoding
+            history_entry.save()
+        job.history_entry = history_entry
+    except Exception as e:
+        logger.error(f"Error saving trip history for job {job.id}: {str(e)}")
+
+
+def _run_history_purge(job):
+    """Delete the history rows selected by the job's parameters, publishing progress per batch."""
+    params = job.request_data
+    queryset = purge_queryset(
+        older_than_days=params.get('older_than_days'),
+        keep_rows=params.get('keep_rows'),
+        before=job.created_at,
+    )
+
+    def progress(deleted, estimate):
+        job.progress = {'deleted': deleted, 'estimated_total': estimate}
+        TripJob.objects.filter(pk=job.pk).update(progress=job.progress)
+
+    progress(0, queryset.count())
+    deleted = purge_history(queryset, progress=progress)
+    job.progress = {'deleted': deleted, 'estimated_total': deleted}
+    job.status = TripJob.STATUS_SUCCEEDED
+
+
+def create_purge_job(older_than_days=None, keep_rows=None):
+    """Queue a history purge; with neither limit it deletes everything written before now."""
+    job = TripJob.objects.create(
+        kind=TripJob.KIND_HISTORY_PURGE,
+        request_data={'older_than_days': older_than_days, 'keep_rows': keep_rows},
+    )
+    enqueue_job(job)
+    return job
+
+
+def callback_host_allowed(url):
+    """True if ``url``'s host may receive callbacks.
+
+    With ``TRIP_JOB_CALLBACK_HOSTS`` set, only those hosts may. Otherwise the
+    host must resolve to public addresses only, so callers can't make workers
+    POST to loopback, private, link-local (cloud metadata) or reserved ones.
+    """
+    parts = urlsplit(url)
+    if settings.TRIP_JOB_CALLBACK_HOSTS:
+        return parts.hostname in settings.TRIP_JOB_CALLBACK_HOSTS
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError, ValueError):
+        return False
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if not ip.is_global or ip.is_multicast:
+            return False
+    return bool(addresses)
+
+
+def deliver_callback(job, attempts=3):
+    """POST ``{id, status, status_url}`` to the job's callback URL; the client then fetches the result."""
+    payload = {
+        'id': str(job.id),
+        'status': job.status,
+        'status_url': reverse('trip-job-detail', args=[job.id]),
+    }
+    # Checked again at delivery: the host may resolve differently than when the job was submitted
+    if not callback_host_allowed(job.callback_url):
+        logger.warning(f"Callback for trip job {job.id} to {job.callback_url} refused: host not allowed")
+        metrics.inc('trip_job_callbacks_total', outcome='refused')
+        TripJob.objects.filter(pk=job.pk).update(callback_status='refused')
+        return
+    outcome = ''
+    for attempt in range(attempts):
+        try:
+            response = requests.post(
+                job.callback_url, json=payload, timeout=settings.TRIP_JOB_CALLBACK_TIMEOUT, allow_redirects=False,
+            )
+            outcome = str(response.status_code)
+            if response.status_code < 500:
+                break
+        except requests.exceptions.RequestException as e:
+            outcome = f"error: {type(e).__name__}"
+        if attempt < attempts - 1:
+            time.sleep(0.5 * 2 ** attempt)
+    if outcome and not outcome.startswith('2'):
+        logger.warning(f"Callback for trip job {job.id} to {job.callback_url} failed: {outcome}")
+    metrics.inc('trip_job_callbacks_total', outcome='ok' if outcome.startswith('2') else 'failed')
+    TripJob.objects.filter(pk=job.pk).update(callback_status=outcome[:64])
+
+
+def process_job(job_id=None, worker=None):
+    """Claim and run one job; returns the finished job, or None if there was nothing to claim."""
+    close_old_connections()
+    try:
+        job = claim_job(job_id, worker or worker_name())
+        if job is None:
+            return None
+        return run_job(job)
+    finally:
+        close_old_connections()
+
+
+def requeue_stale_jobs():
+    """Return jobs whose worker died mid-run to the queue, or fail them after ``TRIP_JOB_MAX_ATTEMPTS``."""
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.TRIP_JOB_TIMEOUT)
+    stale = TripJob.objects.filter(status=TripJob.STATUS_RUNNING, started_at__lt=cutoff)
+    requeued = stale.filter(attempts__lt=settings.TRIP_JOB_MAX_ATTEMPTS).update(
+        status=TripJob.STATUS_QUEUED, worker='',
+    )
+    failed = stale.update(
+        status=TripJob.STATUS_FAILED,
+        error='Trip calculation timed out.',
+        finished_at=timezone.now(),
+    )
+    if requeued or failed:
+        logger.warning(f"Requeued {requeued} and failed {failed} stale trip jobs")
+    return requeued, failed
+
+
+class JobExecutor:
+    """Runs submitted jobs on a thread pool inside the web process."""
+
+    def __init__(self, max_workers):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='trip-job')
+
+    def submit(self, job_id):
+        return self.pool.submit(process_job, job_id)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_job_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = JobExecutor(settings.TRIP_JOB_WORKERS)
+    return _executor
+
+
+def enqueue_job(job):
+    """Hand a newly created job to the in-process pool, unless workers run separately."""
+    metrics.inc('trip_jobs_submitted_total', kind=job.kind)
+    if settings.TRIP_JOB_EXECUTOR == 'thread':
+        transaction.on_commit(lambda: get_job_executor().submit(job.id))
@@ -0,0 +1,168 @@
+"""Vectorized HOS scheduling for many trips at once.
+
+``schedule_batch`` runs the decision hierarchy of
+``HosCalculator._schedule_trip_loop`` over NumPy arrays: every iteration
+takes one duty event (restart, reset, break, stop, fuel stop or drive) for
+each unfinished trip, so a batch costs as many array passes as its longest
+trip has events rather than one Python loop per trip. Only per-trip
+summaries come out (days, arrival, resets, restarts), which is what fleet
+capacity planning needs; use ``HosCalculator`` for the day logs.
+
+Each step does the same floating-point operations as the loop engine, and
+the clock advances in whole microseconds the way ``datetime`` arithmetic
+does, so the summaries match the day logs it would produce.
+"""
+import numpy as np
+
+from .hos_calculator import (
+    DRIVING_LIMIT_BEFORE_BREAK, FUELING_DISTANCE_MILES, FUELING_TIME, MAX_DRIVING_PER_DAY, MAX_ON_DUTY_WINDOW,
+    PICKUP_DROPOFF_TIME, PRE_TRIP_INSPECTION_TIME, REQUIRED_30_MIN_BREAK, REQUIRED_34_HOUR_RESTART,
+    REQUIRED_OFF_DUTY_RESET, WEEKLY_CYCLE_LIMIT,
+)
+from .route_index import METERS_PER_MILE
+
+MICROSECONDS_PER_DAY = 24 * 3600 * 10 ** 6
+
+# Mark for "no more stops": remaining driving time never drops to it
+NO_MARK = -1.0
+
+
+def _left_sum(columns):
+    """Row sums added left to right from 0, as Python's ``sum`` does (keeps results bit-identical)."""
+    total = np.zeros(columns.shape[0])
+    for j in range(columns.shape[1]):
+        total = total + columns[:, j]
+    return total
+
+
+def _next_mark(marks, done):
+    return np.take_along_axis(marks, done[:, None], axis=1)[:, 0]
+
+
+def fuel_stop_times_from_distances(leg_seconds, leg_meters, every_miles=FUELING_DISTANCE_MILES):
+    """Driving seconds at every ``every_miles`` for each trip, NaN-padded to a rectangle.
+
+    Speed is taken as constant within a leg, as ``RouteIndex`` does, so
+    these match ``RouteIndex.milestone_times`` up to float rounding.
+    """
+    leg_seconds = np.asarray(leg_seconds, dtype=float)
+    leg_meters = np.asarray(leg_meters, dtype=float)
+    step = every_miles * METERS_PER_MILE
+    distance_ends = np.cumsum(leg_meters, axis=1)
+    time_ends = np.cumsum(leg_seconds, axis=1)
+    total = distance_ends[:, -1]
+    count = int(total.max() // step) if total.size else 0
+    targets = np.arange(1, count + 1) * step
+    # Leg each milestone falls in, and how far into it
+    leg = (targets[None, :, None] >= distance_ends[:, None, :]).sum(axis=2)
+    leg = np.minimum(leg, leg_meters.shape[1] - 1)
+    rows = np.arange(leg_meters.shape[0])[:, None]
+    leg_start_distance = distance_ends[rows, leg] - leg_meters[rows, leg]
+    leg_start_time = time_ends[rows, leg] - leg_seconds[rows, leg]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = (targets[None, :] - leg_start_distance) / leg_meters[rows, leg]
+    times = leg_start_time + share * leg_seconds[rows, leg]
+    return np.where(targets[None, :] < total[:, None], times, np.nan)
+
+
+def schedule_batch(leg_seconds, cycle_hours_used, start_times, fuel_stop_times=None):
+    """HOS summaries for a batch of trips.
+
+    ``leg_seconds`` is an ``(n, k)`` array of driving times between each
+    trip's ``k + 1`` stops (``k = 2`` for start/pickup/dropoff);
+    ``cycle_hours_used`` and ``start_times`` are scalars or length-``n``
+    sequences (datetimes or ``datetime64``). ``fuel_stop_times`` is an
+    optional ``(n, m)`` array of driving seconds at which fuel stops are
+    due, padded with NaN (see ``fuel_stop_times_from_distances``).
+
+    Returns a dict of length-``n`` arrays: ``total_days`` (day logs),
+    ``arrival_time`` (``datetime64[us]``), ``resets`` (10-hour) and
+    ``restarts`` (34-hour).
+    """
+    legs = np.atleast_2d(np.asarray(leg_seconds, dtype=float))
+    n, k = legs.shape
+    cycle_hours_used = np.broadcast_to(np.asarray(cycle_hours_used, dtype=float), (n,))
+    start = np.broadcast_to(np.asarray(start_times, dtype='datetime64[us]'), (n,))
+
+    # Remaining driving time at each intermediate stop and fuel stop, plus a NO_MARK column
+    T = _left_sum(legs)
+    stop_marks = np.full((n, k), NO_MARK)
+    for i in range(k - 1):
+        stop_marks[:, i] = _left_sum(legs[:, i + 1:])
+    if fuel_stop_times is None:
+        fuel_stop_times = np.empty((n, 0))
+    fuel_times = np.sort(np.atleast_2d(np.asarray(fuel_stop_times, dtype=float)), axis=1)
+    fuel_marks = np.full((n, fuel_times.shape[1] + 1), NO_MARK)
+    fuel_marks[:, :-1] = np.where(np.isnan(fuel_times), NO_MARK, T[:, None] - fuel_times)
+    stops_done = np.zeros(n, dtype=np.intp)
+    fuel_done = np.zeros(n, dtype=np.intp)
+
+    # Pre-trip inspection, then the four banks
+    D = np.full(n, float(MAX_DRIVING_PER_DAY))
+    W = np.full(n, float(MAX_ON_DUTY_WINDOW)) - PRE_TRIP_INSPECTION_TIME
+    B = np.full(n, float(DRIVING_LIMIT_BEFORE_BREAK))
+    C = (WEEKLY_CYCLE_LIMIT - (cycle_hours_used * 3600)) - PRE_TRIP_INSPECTION_TIME
+    started = np.ones(n, dtype=bool)
+
+    cursor = start.astype(np.int64)
+    days = np.ones(n, dtype=np.int64)
+    resets = np.zeros(n, dtype=np.int64)
+    restarts = np.zeros(n, dtype=np.int64)
+
+    def advance(duration, mask):
+        """Move the clock of the ``mask`` trips on by ``duration``, splitting at midnight like ``DutyLog.add``."""
+        until_midnight = ((cursor // MICROSECONDS_PER_DAY + 1) * MICROSECONDS_PER_DAY - cursor)
+        crosses = mask & (duration > until_midnight / 1e6)
+        same_day = cursor + np.rint(duration * 1e6).astype(np.int64)
+        next_day = cursor + until_midnight + np.rint((duration - until_midnight / 1e6) * 1e6).astype(np.int64)
+        cursor[:] = np.where(crosses, next_day, np.where(mask, same_day, cursor))
+        days[:] += crosses
+
+    advance(np.full(n, PRE_TRIP_INSPECTION_TIME), np.ones(n, dtype=bool))
+
+    active = T > 0
+    while active.any():
+        restart = active & (C <= 0)
+        reset = active & ~restart & ((D <= 0) | (started & (W <= 0)))
+        rest_break = active & ~restart & ~reset & (B <= 0)
+        other = active & ~restart & ~reset & ~rest_break
+        stop_mark = _next_mark(stop_marks, stops_done)
+        fuel_mark = _next_mark(fuel_marks, fuel_done)
+        at_stop = other & (T <= stop_mark)
+        at_fuel = other & ~at_stop & (T <= fuel_mark)
+        drive = other & ~at_stop & ~at_fuel
+
+        # Drive up to the next stop or the first exhausted bank (the "Minimum Value" rule)
+        mark = np.maximum(np.maximum(stop_mark, fuel_mark), 0)
+        to_stop = T - mark
+        driven = np.minimum(np.minimum(to_stop, D), np.minimum(np.where(started, W, np.inf), B))
+        task = np.where(at_stop, PICKUP_DROPOFF_TIME, FUELING_TIME)
+
+        duration = np.select(
+            [restart, reset, rest_break, at_stop | at_fuel],
+            [REQUIRED_34_HOUR_RESTART, REQUIRED_OFF_DUTY_RESET, REQUIRED_30_MIN_BREAK, task],
+            driven,
+        )
+        advance(duration, active)
+
+        fresh = restart | reset
+        restarts += restart
+        resets += reset
+        C = np.where(restart, WEEKLY_CYCLE_LIMIT, np.where(at_stop | at_fuel, C - task, np.where(drive, C - driven, C)))
+        D = np.where(fresh, MAX_DRIVING_PER_DAY, np.where(drive, D - driven, D))
+        W = np.where(fresh, MAX_ON_DUTY_WINDOW, np.where(
+            rest_break & started, W - REQUIRED_30_MIN_BREAK, np.where(
+                at_stop | at_fuel, W - task, np.where(drive, W - driven, W))))
+        B = np.where(fresh | rest_break, DRIVING_LIMIT_BEFORE_BREAK, np.where(drive, B - driven, B))
+        started = np.where(fresh, False, started | at_stop | at_fuel | drive)
+        stops_done += at_stop
+        fuel_done += at_fuel
+        T = np.where(drive, np.where(driven == to_stop, mark, T - driven), T)
+        active = T > 0
+
+    return {
+        'total_days': days,
+        'arrival_time': cursor.astype('datetime64[us]'),
+        'resets': resets,
+        'restarts': restarts,
+    }
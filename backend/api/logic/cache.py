@@ -0,0 +1,446 @@
+import re
+import time
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Marker stored in place of a result when ORS reported the location as unknown
+NOT_FOUND = {'__not_found__': True}
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with a per-entry TTL.
+
+    When ``max_bytes`` is set, ``sizeof(value)`` is charged against that
+    budget and the least recently used entries are evicted to stay under it.
+    Expired entries are not served by default, but they stay (until evicted)
+    so ``get(..., allow_stale=True)`` can fall back to them when ORS is down.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _size(self, value):
+        return self.sizeof(value) if self.sizeof else 0
+
+    def _pop_oldest(self):
+        _, (value, _) = self._data.popitem(last=False)
+        self.current_bytes -= self._size(value)
+
+    def get(self, key, default=None, allow_stale=False):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if not allow_stale and expires_at is not None and expires_at <= time.monotonic():
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            previous = self._data.pop(key, _MISSING)
+            if previous is not _MISSING:
+                self.current_bytes -= self._size(previous[0])
+            self._data[key] = (value, expires_at)
+            self.current_bytes += self._size(value)
+            while len(self._data) > self.max_entries:
+                self._pop_oldest()
+            while self.max_bytes is not None and self.current_bytes > self.max_bytes and len(self._data) > 1:
+                self._pop_oldest()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+def normalize_location(location_name):
+    """Normalize a free-text location so trivially different spellings share a cache key."""
+    return re.sub(r'\s+', ' ', str(location_name)).strip().lower()
+
+
+class GeocodeCache:
+    """Two-tier geocode cache.
+
+    Tier 1 is an in-process LRU; tier 2 is the Django cache named by
+    ``GEOCODE_CACHE_ALIAS`` so every worker sharing that backend benefits
+    from a lookup made by any of them. Unknown locations are cached with a
+    shorter TTL so repeated typos don't cost an ORS call each.
+    """
+
+    key_prefix = 'geocode:'
+    metric_name = 'geocode_cache_total'
+    settings_prefix = 'GEOCODE_CACHE'
+
+    def __init__(self, max_entries=None, ttl=None, negative_ttl=None, alias=None):
+        def setting(name):
+            return getattr(settings, f'{self.settings_prefix}_{name}')
+
+        self.ttl = ttl if ttl is not None else setting('TTL')
+        self.negative_ttl = negative_ttl if negative_ttl is not None else setting('NEGATIVE_TTL')
+        self.alias = alias if alias is not None else setting('ALIAS')
+        self.local = LRUCache(
+            max_entries=max_entries if max_entries is not None else setting('MAX_ENTRIES'),
+            ttl=self.ttl,
+        )
+        self._stats_lock = threading.Lock()
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'negative_hits': 0, 'misses': 0}
+
+    def _shared(self):
+        if not self.alias:
+            return None
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _shared_key(self, key):
+        # Hash so arbitrary user text is a valid key for memcached as well
+        return self.key_prefix + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+        metrics.inc(self.metric_name, result=name)
+
+    def _get_local(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self._count('negative_hits' if value is NOT_FOUND else 'local_hits')
+        return value
+
+    def _accept_shared(self, key, value):
+        if value is None:
+            self._count('misses')
+            return None
+        if value == NOT_FOUND:
+            value = NOT_FOUND
+            self.local.set(key, value, ttl=self.negative_ttl)
+            self._count('negative_hits')
+        else:
+            self.local.set(key, value)
+            self._count('shared_hits')
+        return value
+
+    def get(self, location_name):
+        """Return the cached result, ``NOT_FOUND``, or None on a miss."""
+        key = normalize_location(location_name)
+        value = self._get_local(key)
+        if value is not None:
+            return value
+
+        value = None
+        shared = self._shared()
+        if shared is not None:
+            try:
+                value = shared.get(self._shared_key(key))
+            except Exception as e:
+                logger.warning(f"Shared geocode cache unavailable: {str(e)}")
+        return self._accept_shared(key, value)
+
+    async def aget(self, location_name):
+        """Async ``get``; the shared tier goes through the Django cache's async API."""
+        key = normalize_location(location_name)
+        value = self._get_local(key)
+        if value is not None:
+            return value
+
+        value = None
+        shared = self._shared()
+        if shared is not None:
+            try:
+                value = await shared.aget(self._shared_key(key))
+            except Exception as e:
+                logger.warning(f"Shared geocode cache unavailable: {str(e)}")
+        return self._accept_shared(key, value)
+
+    def set(self, location_name, value):
+        key = normalize_location(location_name)
+        ttl = self.negative_ttl if value is NOT_FOUND else self.ttl
+        self.local.set(key, value, ttl=ttl)
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.set(self._shared_key(key), value, timeout=ttl)
+            except Exception as e:
+                logger.warning(f"Shared geocode cache unavailable: {str(e)}")
+
+    async def aset(self, location_name, value):
+        key = normalize_location(location_name)
+        ttl = self.negative_ttl if value is NOT_FOUND else self.ttl
+        self.local.set(key, value, ttl=ttl)
+        shared = self._shared()
+        if shared is not None:
+            try:
+                await shared.aset(self._shared_key(key), value, timeout=ttl)
+            except Exception as e:
+                logger.warning(f"Shared geocode cache unavailable: {str(e)}")
+
+    def set_not_found(self, location_name):
+        self.set(location_name, NOT_FOUND)
+
+    def get_stale(self, location_name):
+        """Return a local result even if expired (never ``NOT_FOUND``), or None."""
+        value = self.local.get(normalize_location(location_name), allow_stale=True)
+        return None if value is None or value is NOT_FOUND else value
+
+    async def aget_stale(self, location_name):
+        return await sync_to_async(self.get_stale, thread_sensitive=False)(location_name)
+
+    def snapshot(self):
+        with self._stats_lock:
+            return dict(self.stats, local_entries=len(self.local))
+
+
+class PlaceCache(GeocodeCache):
+    """Reverse-geocoded place names keyed by grid cell, with the same two tiers as ``GeocodeCache``.
+
+    Points are quantized to cells ``PLACE_GRID_DEGREES`` on a side and every
+    point in a cell shares the name looked up for the cell's centre, so nearby
+    events and repeat trips along the same corridor reuse one lookup. Values
+    are ``{'name': ...}``; ``NOT_FOUND`` marks cells ORS had no name for.
+    """
+
+    key_prefix = 'place:'
+    metric_name = 'place_cache_total'
+    settings_prefix = 'PLACE_CACHE'
+
+    def __init__(self, grid=None, **kwargs):
+        super().__init__(**kwargs)
+        self.grid = grid or settings.PLACE_GRID_DEGREES
+
+    def cell(self, lat, lng):
+        return round(lat / self.grid), round(lng / self.grid)
+
+    def cell_center(self, cell):
+        return round(cell[0] * self.grid, 6), round(cell[1] * self.grid, 6)
+
+    def cell_key(self, cell):
+        # The grid size is part of the key so changing it never serves another grid's names
+        return f'{self.grid}:{cell[0]},{cell[1]}'
+
+
+def _parse_lng_lat(coords):
+    lng, lat = coords.split(',') if isinstance(coords, str) else coords
+    return float(lng), float(lat)
+
+
+def _route_sizeof(value):
+    # distance + duration floats, the geometry buffer and the tuple itself
+    return 2 * 24 + value[2].itemsize * len(value[2]) + 64
+
+
+class RouteCache:
+    """In-process cache of ORS directions results.
+
+    Keys are the rounded ``(start, end)`` coordinate pair plus the routing
+    profile. Geometry is held as a flat ``array('d')`` of lng/lat pairs,
+    which costs 16 bytes per vertex instead of the ~120 of a list of lists,
+    and the whole cache is bounded by ``ROUTE_CACHE_MAX_BYTES``.
+
+    The cache also remembers which profile last succeeded for a lane, so
+    lanes the HGV profile cannot route go straight to the car profile.
+    """
+
+    def __init__(self, max_bytes=None, ttl=None, precision=None, max_entries=None):
+        self.ttl = ttl if ttl is not None else settings.ROUTE_CACHE_TTL
+        self.precision = precision if precision is not None else settings.ROUTE_CACHE_PRECISION
+        max_entries = max_entries if max_entries is not None else settings.ROUTE_CACHE_MAX_ENTRIES
+        self.routes = LRUCache(
+            max_entries=max_entries,
+            ttl=self.ttl,
+            max_bytes=max_bytes if max_bytes is not None else settings.ROUTE_CACHE_MAX_BYTES,
+            sizeof=_route_sizeof,
+        )
+        self.lane_profiles = LRUCache(max_entries=max_entries, ttl=self.ttl)
+        self._stats_lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def lane_key(self, start_coords, end_coords):
+        start_lng, start_lat = _parse_lng_lat(start_coords)
+        end_lng, end_lat = _parse_lng_lat(end_coords)
+        p = self.precision
+        return (round(start_lng, p), round(start_lat, p), round(end_lng, p), round(end_lat, p))
+
+    def get(self, lane, profile, allow_stale=False):
+        value = self.routes.get((lane, profile), allow_stale=allow_stale)
+        if not allow_stale:
+            with self._stats_lock:
+                self.stats['hits' if value is not None else 'misses'] += 1
+            metrics.inc('route_cache_total', result='hits' if value is not None else 'misses')
+        if value is None:
+            return None
+        distance, duration, flat = value
+        return {
+            'distance_meters': distance,
+            'duration_seconds': duration,
+            'geometry': [[flat[i], flat[i + 1]] for i in range(0, len(flat), 2)],
+        }
+
+    def set(self, lane, profile, route):
+        flat = array('d')
+        for point in route['geometry']:
+            flat.append(point[0])
+            flat.append(point[1])
+        self.routes.set((lane, profile), (route['distance_meters'], route['duration_seconds'], flat))
+
+    async def aget(self, lane, profile, allow_stale=False):
+        """Async ``get``, run on a worker thread: a long route's geometry takes milliseconds to rebuild."""
+        return await sync_to_async(self.get, thread_sensitive=False)(lane, profile, allow_stale)
+
+    async def aset(self, lane, profile, route):
+        await sync_to_async(self.set, thread_sensitive=False)(lane, profile, route)
+
+    def get_profile(self, lane):
+        return self.lane_profiles.get(lane)
+
+    def set_profile(self, lane, profile):
+        self.lane_profiles.set(lane, profile)
+
+    async def aget_profile(self, lane):
+        return await sync_to_async(self.get_profile, thread_sensitive=False)(lane)
+
+    async def aset_profile(self, lane, profile):
+        await sync_to_async(self.set_profile, thread_sensitive=False)(lane, profile)
+
+    def snapshot(self):
+        with self._stats_lock:
+            return dict(
+                self.stats,
+                entries=len(self.routes),
+                bytes=self.routes.current_bytes,
+                known_lanes=len(self.lane_profiles),
+            )
+
+
+class MatrixCache:
+    """In-process cache of ORS matrix results, one ``(duration, distance)`` per ordered location pair.
+
+    Pairs are keyed by rounded coordinates (``ROUTE_CACHE_PRECISION``) and
+    profile. Storing pairs rather than whole matrices lets a request reuse
+    what any earlier matrix learned about its stops, whatever the stop set.
+    ORS is only asked again when some pair is missing.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, precision=None):
+        self.precision = precision if precision is not None else settings.ROUTE_CACHE_PRECISION
+        self.pairs = LRUCache(
+            max_entries=max_entries if max_entries is not None else settings.MATRIX_CACHE_MAX_ENTRIES,
+            ttl=ttl if ttl is not None else settings.MATRIX_CACHE_TTL,
+        )
+        self._stats_lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def _point(self, point):
+        return round(point[0], self.precision), round(point[1], self.precision)
+
+    def get(self, points, profiles):
+        """``(durations, distances)`` for ``[lng, lat]`` points from the first of ``profiles`` with every pair cached."""
+        keys = [self._point(point) for point in points]
+        for profile in profiles:
+            matrix = self._matrix(keys, profile)
+            if matrix is not None:
+                self._record('hits')
+                return matrix
+        self._record('misses')
+        return None
+
+    def _matrix(self, keys, profile):
+        durations, distances = [], []
+        for source in keys:
+            duration_row, distance_row = [], []
+            for destination in keys:
+                value = (0.0, 0.0) if source == destination else self.pairs.get((profile, source, destination))
+                if value is None:
+                    return None
+                duration_row.append(value[0])
+                distance_row.append(value[1])
+            durations.append(duration_row)
+            distances.append(distance_row)
+        return durations, distances
+
+    def set(self, points, profile, durations, distances):
+        keys = [self._point(point) for point in points]
+        for i, source in enumerate(keys):
+            for j, destination in enumerate(keys):
+                # Unroutable pairs (None) aren't cached, so they are asked again next time
+                if source != destination and durations[i][j] is not None and distances[i][j] is not None:
+                    self.pairs.set((profile, source, destination), (durations[i][j], distances[i][j]))
+
+    def _record(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+        metrics.inc('matrix_cache_total', result=name)
+
+    def snapshot(self):
+        with self._stats_lock:
+            return dict(self.stats, pairs=len(self.pairs))
+
+
+_geocode_cache = None
+_route_cache = None
+_place_cache = None
+_matrix_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_geocode_cache():
+    """Return the process-wide geocode cache, creating it on first use."""
+    global _geocode_cache
+    if _geocode_cache is None:
+        with _cache_lock:
+            if _geocode_cache is None:
+                _geocode_cache = GeocodeCache()
+    return _geocode_cache
+
+
+def get_route_cache():
+    """Return the process-wide route cache, creating it on first use."""
+    global _route_cache
+    if _route_cache is None:
+        with _cache_lock:
+            if _route_cache is None:
+                _route_cache = RouteCache()
+    return _route_cache
+
+
+def get_place_cache():
+    """Return the process-wide place name cache, creating it on first use."""
+    global _place_cache
+    if _place_cache is None:
+        with _cache_lock:
+            if _place_cache is None:
+                _place_cache = PlaceCache()
+    return _place_cache
+
+
+def get_matrix_cache():
+    """Return the process-wide matrix cache, creating it on first use."""
+    global _matrix_cache
+    if _matrix_cache is None:
+        with _cache_lock:
+            if _matrix_cache is None:
+                _matrix_cache = MatrixCache()
+    return _matrix_cache
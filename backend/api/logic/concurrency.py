@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=settings.ORS_CONCURRENCY_POOL_SIZE, thread_name_prefix='ors-call')
+    return _pool
+
+
+def _call_in_worker(fn, args):
+    _local.in_pool = True
+    try:
+        return fn(*args)
+    finally:
+        # Pool threads may have opened DB connections (e.g. a DatabaseCache
+        # lookup); close them so they aren't held between calls.
+        connections.close_all()
+
+
+def _capture(fn, args):
+    try:
+        return fn(*args)
+    except Exception as e:
+        return e
+
+
+def run_concurrently(calls, concurrent=True, max_workers=None, return_exceptions=False):
+    """Run independent ``(fn, *args)`` calls and return their results in order.
+
+    Results and errors keep sequential semantics: if several calls fail, the
+    exception of the earliest one in ``calls`` is the one raised. With
+    ``return_exceptions=True`` each failure is returned in its call's slot
+    instead, so one bad call doesn't discard the rest of a batch. Calls
+    share one bounded pool per process.
+    """
+    if return_exceptions:
+        calls = [(_capture, fn, args) for fn, *args in calls]
+    # A pool thread waiting on calls queued behind it could deadlock a full pool, so nested calls run inline
+    if not concurrent or len(calls) < 2 or getattr(_local, 'in_pool', False):
+        return [fn(*args) for fn, *args in calls]
+
+    pool = _get_pool()
+    # At most ``max_workers`` of these calls hold pool threads at once
+    slots = threading.BoundedSemaphore(max_workers or len(calls))
+    futures = []
+    for fn, *args in calls:
+        slots.acquire()
+        # Run each call in a copy of the caller's context so request-scoped state (timing spans) follows it
+        future = pool.submit(contextvars.copy_context().run, _call_in_worker, fn, args)
+        future.add_done_callback(lambda _: slots.release())
+        futures.append(future)
+    return [future.result() for future in futures]
+
+
+async def gather_in_order(*aws):
+    """``asyncio.gather`` that, like ``run_concurrently``, raises the earliest failing awaitable's error."""
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
@@ -0,0 +1,154 @@
+"""Compact duty-status log built by the HOS engines.
+
+Events are ``DutyEvent`` objects with ``__slots__``: raw seconds, an integer
+status, the start ``datetime`` and the four bank balances as a tuple. Each
+day keeps its total and per-status hours up to date as events arrive, so
+closing a day is one subtraction. The API's day-log dicts (ISO timestamps,
+remarks, ``(Part 1)``/``(Part 2)`` labels, ``hos_after`` in rounded hours)
+are only built by ``DutyLog.render`` once the trip is scheduled.
+"""
+import datetime
+
+OFF_DUTY, SLEEPER_BERTH, DRIVING, ON_DUTY = range(4)
+STATUS_NAMES = ('Off Duty', 'Sleeper Berth', 'Driving', 'On Duty')
+
+# How an event sits in its day: whole, either side of midnight, or the end-of-day filler
+WHOLE, FIRST_PART, SECOND_PART, FILLER = range(4)
+
+DAY_SECONDS = 24 * 3600
+ONE_DAY = datetime.timedelta(days=1)
+
+
+class DutyEvent:
+    __slots__ = ('status', 'duration', 'start', 'description', 'location', 'hos_after', 'part', 'lat', 'lng', 'facility')
+
+    def __init__(self, status, duration, start, description, location, hos_after=None, part=WHOLE):
+        self.status = status
+        self.duration = duration
+        self.start = start
+        self.description = description
+        self.location = location
+        # (daily driving, on-duty window, break cycle, weekly cycle) seconds left after the event
+        self.hos_after = hos_after
+        self.part = part
+        self.lat = None
+        self.lng = None
+        self.facility = None
+
+    def render(self):
+        if self.part == FILLER:
+            event = {
+                'status': STATUS_NAMES[self.status],
+                'duration': self.duration,
+                'start_time': None,  # Will be calculated during rendering
+                'start_time_hours': None,
+                'description': 'Off Duty',
+                'location': 'End of Day',
+                'remarks': 'Remaining time to complete 24-hour log'
+            }
+        else:
+            description = self.description
+            remarks = f"{description} at {self.location}"
+            if self.part == FIRST_PART:
+                description = f"{description} (Part 1)"
+                remarks = f"{remarks} (continues to next day)"
+            elif self.part == SECOND_PART:
+                description = f"{description} (Part 2)"
+                remarks = f"{remarks} (continued from previous day)"
+            start = self.start
+            event = {
+                'status': STATUS_NAMES[self.status],
+                'duration': self.duration,
+                'start_time': start.isoformat(),
+                'start_time_hours': 0 if self.part == SECOND_PART else start.hour + start.minute / 60,
+                'description': description,
+                'location': self.location,
+                'remarks': remarks
+            }
+            if self.hos_after is not None:
+                daily, window, brk, weekly = self.hos_after
+                event['hos_after'] = {
+                    'dailyDrivingRemaining': round(daily / 3600, 2),
+                    'onDutyWindowRemaining': round(window / 3600, 2),
+                    'breakCycleRemaining': round(brk / 3600, 2),
+                    'weeklyCycleRemaining': round(weekly / 3600, 2)
+                }
+        if self.lat is not None:
+            event['lat'] = self.lat
+            event['lng'] = self.lng
+        if self.facility is not None:
+            event['facility'] = self.facility
+        return event
+
+
+class DayLog:
+    __slots__ = ('day', 'events', 'seconds', 'totals')
+
+    def __init__(self, day):
+        self.day = day
+        self.events = []
+        self.seconds = 0
+        self.totals = [0, 0, 0, 0]  # hours per status, in STATUS_NAMES order
+
+    def append(self, event):
+        self.events.append(event)
+        self.seconds += event.duration
+        self.totals[event.status] += event.duration / 3600
+
+    def finalize(self):
+        """Fill the rest of the 24 hours with Off Duty time."""
+        remaining_seconds = DAY_SECONDS - self.seconds
+        if remaining_seconds > 0:
+            self.append(DutyEvent(OFF_DUTY, remaining_seconds, None, 'Off Duty', 'End of Day', part=FILLER))
+
+    def render(self):
+        status_totals = dict(zip(STATUS_NAMES, self.totals))
+        return {
+            'day': self.day,
+            'events': [event.render() for event in self.events],
+            'status_totals': status_totals,
+            'total_hours': sum(status_totals.values()),
+        }
+
+
+class DutyLog:
+    """A trip's day logs, filled in order from ``start_time``."""
+    __slots__ = ('days', 'cursor')
+
+    def __init__(self, start_time):
+        self.days = [DayLog(1)]
+        self.cursor = start_time
+
+    def __len__(self):
+        return len(self.days)
+
+    def add(self, status, duration, description, location, hos_after=None):
+        """Log an event at the cursor, splitting it in two if it crosses midnight; returns the new cursor."""
+        cursor = self.cursor
+        end_of_day = (cursor + ONE_DAY).replace(hour=0, minute=0, second=0, microsecond=0)
+        seconds_until_midnight = (end_of_day - cursor).total_seconds()
+        if duration <= seconds_until_midnight:
+            self.days[-1].append(DutyEvent(status, duration, cursor, description, location, hos_after))
+            self.cursor = cursor + datetime.timedelta(seconds=duration)
+            return self.cursor
+
+        second_day_duration = duration - seconds_until_midnight
+        self.days[-1].append(DutyEvent(status, seconds_until_midnight, cursor, description, location, hos_after, FIRST_PART))
+        self.days[-1].finalize()
+        day_log = DayLog(len(self.days) + 1)
+        day_log.append(DutyEvent(status, second_day_duration, end_of_day, description, location, hos_after, SECOND_PART))
+        self.days.append(day_log)
+        self.cursor = end_of_day + datetime.timedelta(seconds=second_day_duration)
+        return self.cursor
+
+    def finish(self):
+        self.days[-1].finalize()
+        return self
+
+    def events(self):
+        for day_log in self.days:
+            yield from day_log.events
+
+    def render(self):
+        """The day logs as the API returns them."""
+        return [day_log.render() for day_log in self.days]
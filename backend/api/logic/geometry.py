@@ -0,0 +1,134 @@
+import math
+
+GEOMETRY_FORMATS = ('coordinates', 'polyline')
+POLYLINE_PRECISION = 5
+MAX_ZOOM = 22
+
+
+def encode_polyline(coordinates, precision=POLYLINE_PRECISION):
+    """Encode ORS ``[lng, lat]`` pairs as a Google encoded polyline (lat/lng order)."""
+    factor = 10 ** precision
+    output = []
+    prev_lat = prev_lng = 0
+    for lng, lat in ((point[0], point[1]) for point in coordinates):
+        lat_i = int(round(lat * factor))
+        lng_i = int(round(lng * factor))
+        for delta in (lat_i - prev_lat, lng_i - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                output.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            output.append(chr(value + 63))
+        prev_lat, prev_lng = lat_i, lng_i
+    return ''.join(output)
+
+
+def tolerance_for_zoom(zoom):
+    """Douglas-Peucker tolerance in degrees: about one 256px web-mercator tile pixel at ``zoom``."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def simplify(coordinates, tolerance):
+    """Douglas-Peucker simplification of ``[lng, lat]`` pairs (iterative, keeps both endpoints)."""
+    n = len(coordinates)
+    if n < 3 or tolerance <= 0:
+        return list(coordinates)
+
+    # Measure in a locally equirectangular plane so east-west offsets aren't overweighted
+    mean_lat = sum(point[1] for point in coordinates) / n
+    x_scale = math.cos(math.radians(mean_lat))
+    xs = [point[0] * x_scale for point in coordinates]
+    ys = [point[1] for point in coordinates]
+    tolerance_sq = tolerance * tolerance
+
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xs[first], ys[first]
+        dx, dy = xs[last] - ax, ys[last] - ay
+        seg_len_sq = dx * dx + dy * dy
+        max_dist_sq = 0.0
+        index = None
+        for i in range(first + 1, last):
+            px, py = xs[i] - ax, ys[i] - ay
+            if seg_len_sq:
+                t = max(0.0, min(1.0, (px * dx + py * dy) / seg_len_sq))
+                ex, ey = px - t * dx, py - t * dy
+            else:
+                ex, ey = px, py
+            dist_sq = ex * ex + ey * ey
+            if dist_sq > max_dist_sq:
+                max_dist_sq, index = dist_sq, i
+        if index is not None and max_dist_sq > tolerance_sq:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [point for point, kept in zip(coordinates, keep) if kept]
+
+
+def shape_geometry(coordinates, geometry_format='coordinates', zoom=None):
+    """Simplify for ``zoom`` (if given) and encode in ``geometry_format``."""
+    if zoom is not None:
+        coordinates = simplify(coordinates, tolerance_for_zoom(zoom))
+    if geometry_format == 'polyline':
+        return encode_polyline(coordinates)
+    return coordinates
+
+
+def parse_geometry_options(data):
+    """Read ``geometry_format``/``zoom``/``per_leg`` from request data.
+
+    Returns ``(options, None)`` or ``(None, error_message)``; ``options`` is
+    None when the client asked for the default full-resolution coordinates.
+    """
+    geometry_format = data.get('geometry_format') or 'coordinates'
+    if geometry_format not in GEOMETRY_FORMATS:
+        return None, f"geometry_format must be one of: {', '.join(GEOMETRY_FORMATS)}."
+
+    zoom = data.get('zoom')
+    if zoom in (None, ''):
+        zoom = None
+    else:
+        try:
+            zoom = int(zoom)
+        except (ValueError, TypeError):
+            return None, 'zoom must be a whole number.'
+        if zoom < 0 or zoom > MAX_ZOOM:
+            return None, f'zoom must be between 0 and {MAX_ZOOM}.'
+
+    per_leg = data.get('per_leg')
+    per_leg = per_leg is True or str(per_leg).lower() in ('1', 'true', 'yes')
+
+    if geometry_format == 'coordinates' and zoom is None and not per_leg:
+        return None, None
+    return {'format': geometry_format, 'zoom': zoom, 'per_leg': per_leg}, None
+
+
+def apply_geometry_options(result, options):
+    """Return a copy of a trip result with ``route_geometry`` shaped per ``options``.
+
+    Works on both fresh and stored results, using the per-leg point counts
+    in ``route_legs`` to split the concatenated geometry. With ``per_leg``
+    each leg carries its own geometry and ``route_geometry`` is dropped.
+    The input result is never mutated, so shared/cached results stay intact.
+    """
+    if not options or not isinstance(result.get('route_geometry'), list):
+        return result
+    shaped = {**result, 'route_geometry_format': 'polyline5' if options['format'] == 'polyline' else 'coordinates'}
+    legs = result.get('route_legs')
+    if options['per_leg'] and legs:
+        geometry = result['route_geometry']
+        shaped_legs = []
+        offset = 0
+        for leg in legs:
+            count = leg['point_count']
+            shaped_legs.append({**leg, 'geometry': shape_geometry(geometry[offset:offset + count], options['format'], options['zoom'])})
+            offset += count
+        shaped.pop('route_geometry')
+        shaped['route_legs'] = shaped_legs
+    else:
+        shaped['route_geometry'] = shape_geometry(result['route_geometry'], options['format'], options['zoom'])
+    return shaped
@@ -1,7 +1,27 @@
+import re
+import json
+import asyncio
+import hashlib
+import httpx
 import requests
 import datetime
 import math
 import logging
+import contextlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cache import NOT_FOUND, get_geocode_cache, get_matrix_cache, get_place_cache, get_route_cache, normalize_location
+from . import metrics
+from .concurrency import gather_in_order, run_concurrently
+from .duty_log import DRIVING, OFF_DUTY, ON_DUTY, SLEEPER_BERTH, DutyLog
+from .ors_client import RETRY_STATUSES, get_async_ors_client, get_ors_client
+from .poi_index import get_poi_index
+from .resilience import OrsUnavailable
+from .route_index import RouteIndex
+from .singleflight import get_trip_coalescer
+from .stop_order import UNREACHABLE, order_stops
 
 logger = logging.getLogger(__name__)
 
@@ -19,84 +39,257 @@ PICKUP_DROPOFF_TIME = 1 * 3600
 FUELING_TIME = 0.5 * 3600
 FUELING_DISTANCE_MILES = 1000
 
+# POI kinds a stop may snap to: fuel at any fuel station, resets only where a truck can park overnight
+FUEL_POI_KINDS = ('truck_stop', 'fuel')
+REST_POI_KINDS = ('truck_stop', 'rest_area')
+
+# ORS refuses routes over ~6,000 km of road. Road detours add up to half again to the straight line,
+# so a call's straight-line length stays under this margin; longer legs are routed in parts
+SPLIT_LEG_METERS = 4_000_000
+
+# On-duty task logged on arriving at each stop of a multi-stop trip
+STOP_DESCRIPTIONS = {'pickup': 'Pickup Stop', 'dropoff': 'Dropoff Stop'}
+
+
+# Shown when ORS was skipped (quota exhausted / circuit open) and nothing cached could stand in
+SERVICE_UNAVAILABLE_MESSAGE = "Map service is temporarily unavailable. Please try again in a few minutes."
+
+
+class MapServiceError(ValueError):
+    """ORS failed or was skipped; the message is safe to show. Expired cached data may stand in."""
+
+
+class LocationNotFound(ValueError):
+    """ORS answered the geocode search but had no match for the location."""
+
+
 class HosCalculator:
-    def __init__(self, api_key):
+    def __init__(self, api_key, geocode_cache=None, route_cache=None, concurrent=None, ors_client=None,
+                 schedule_engine=None, async_ors_client=None, place_cache=None, poi_index=None, matrix_cache=None):
         self.api_key = api_key
+        self.async_ors_client = async_ors_client
+        self.schedule_engine = schedule_engine or settings.HOS_SCHEDULE_ENGINE
+        self.ors_client = ors_client if ors_client is not None else get_ors_client(api_key)
+        self.concurrent = settings.ORS_CONCURRENT_REQUESTS if concurrent is None else concurrent
+        self.geocode_cache = geocode_cache if geocode_cache is not None else get_geocode_cache()
+        self.route_cache = route_cache if route_cache is not None else get_route_cache()
+        self.place_cache = place_cache if place_cache is not None else get_place_cache()
+        self.poi_index = poi_index if poi_index is not None else get_poi_index()
+        self.matrix_cache = matrix_cache if matrix_cache is not None else get_matrix_cache()
 
     def _reverse_geocode_snap(self, lat, lng):
         """Snap raw coordinates to a nearby address/road using ORS reverse geocoding.
         Returns (snapped_lat, snapped_lng, formatted_name) or (lat, lng, None) on failure.
         """
         try:
-            url = (
-                "https://api.openrouteservice.org/geocode/reverse"
-                f"?api_key={self.api_key}&point.lon={lng}&point.lat={lat}&size=1"
-            )
-            res = requests.get(url, timeout=10)
+            with metrics.span('reverse_geocode'):
+                res = self.ors_client.geocode_reverse(lat, lng)
             res.raise_for_status()
-            data = res.json()
-            features = data.get('features') or []
-            if features:
-                feature = features[0]
-                coords = feature['geometry']['coordinates']
-                snapped_lng, snapped_lat = coords[0], coords[1]
-                name = feature.get('properties', {}).get('label') or feature.get('properties', {}).get('name')
-                return snapped_lat, snapped_lng, name
+            return self._parse_reverse_geocode(res.json(), lat, lng)
         except Exception:
             # Best-effort; ignore errors and fall back to original point
             pass
         return lat, lng, None
 
+    def _parse_reverse_geocode(self, data, lat, lng):
+        features = data.get('features') or []
+        if features:
+            feature = features[0]
+            coords = feature['geometry']['coordinates']
+            snapped_lng, snapped_lat = coords[0], coords[1]
+            name = feature.get('properties', {}).get('label') or feature.get('properties', {}).get('name')
+            return snapped_lat, snapped_lng, name
+        return lat, lng, None
+
+    def _parse_place_name(self, data):
+        """Short "Locality, Region" name of the first reverse geocode result, else its label."""
+        features = data.get('features') or []
+        if not features:
+            return None
+        properties = features[0].get('properties', {})
+        locality = properties.get('locality') or properties.get('county')
+        region = properties.get('region_a') or properties.get('region')
+        if locality and region:
+            return f"{locality}, {region}"
+        return properties.get('label') or properties.get('name')
+
+    def _lookup_place(self, cell):
+        """Reverse geocode the centre of a place grid cell; None when ORS has nothing there."""
+        lat, lng = self.place_cache.cell_center(cell)
+        with metrics.span('reverse_geocode'):
+            res = self.ors_client.geocode_reverse(lat, lng)
+        res.raise_for_status()
+        return self._parse_place_name(res.json())
+
+    def _place_cells(self, results):
+        """Located events of ``results`` grouped by place grid cell; events at a stop or facility take its name."""
+        cells = {}
+        for result in results:
+            if 'error' in result:
+                continue
+            stops = {
+                location['formatted_name']
+                for location in [result[key] for key in ('start_location', 'pickup_location', 'dropoff_location') if key in result]
+                + result.get('stops', [])
+            }
+            for day_log in result['logs']:
+                for event in day_log['events']:
+                    if event['location'] in stops:
+                        event['place'] = event['location']
+                    elif 'facility' in event:
+                        event['place'] = event['facility']['name']
+                    elif 'lat' in event:
+                        cells.setdefault(self.place_cache.cell(event['lat'], event['lng']), []).append(event)
+        return cells
+
+    def _cached_places(self, cells, cached):
+        """Split cache answers per cell into ``(names, misses)``."""
+        names = {}
+        misses = []
+        for cell, value in zip(cells, cached):
+            if value is None:
+                misses.append(cell)
+            elif value is not NOT_FOUND:
+                names[cell] = value['name']
+        return names, misses
+
+    def _resolved_places(self, misses, found, names):
+        """Merge looked-up names into ``names``; returns what to cache per cell (failed lookups aren't cached)."""
+        to_cache = {}
+        for cell, name in zip(misses, found):
+            if isinstance(name, Exception):
+                logger.warning(f"Reverse geocode failed for place cell {cell}: {str(name)}")
+                continue
+            if name:
+                names[cell] = name
+            to_cache[self.place_cache.cell_key(cell)] = {'name': name} if name else NOT_FOUND
+        return to_cache
+
+    def _apply_place_names(self, cells, names):
+        for cell, events in cells.items():
+            name = names.get(cell)
+            if name:
+                for event in events:
+                    event['place'] = name
+
+    def _name_event_places(self, results):
+        """Give located events a human-readable ``place``, best-effort.
+
+        Event points are quantized to the place cache grid and deduplicated
+        across all of ``results``, and only cells missing from the cache are
+        reverse geocoded, concurrently. At most ``PLACE_LOOKUPS_PER_REQUEST``
+        lookups are made however many trips ``results`` holds; events in the
+        cells left over simply go without a name until the cache has them.
+        """
+        if not settings.EVENT_PLACE_NAMES:
+            return
+        try:
+            cells = self._place_cells(results)
+            cached = [self.place_cache.get(self.place_cache.cell_key(cell)) for cell in cells]
+            names, misses = self._cached_places(cells, cached)
+            misses = misses[:settings.PLACE_LOOKUPS_PER_REQUEST]
+            with metrics.span('place_names'):
+                found = run_concurrently(
+                    [(self._lookup_place, cell) for cell in misses],
+                    concurrent=self.concurrent, max_workers=settings.BATCH_WORKERS, return_exceptions=True,
+                )
+            for key, value in self._resolved_places(misses, found, names).items():
+                self.place_cache.set(key, value)
+            self._apply_place_names(cells, names)
+        except Exception as e:
+            logger.warning(f"Could not name event places: {str(e)}")
+
     def _get_coordinates(self, location_name):
+        """Resolve a location through the geocode cache, falling back to ORS on a miss."""
+        cached = self.geocode_cache.get(location_name)
+        if cached is NOT_FOUND:
+            raise LocationNotFound(f"Location '{location_name}' could not be found.")
+        if cached is not None:
+            return {**cached, 'name': location_name}
+
+        try:
+            location_data = self._lookup_coordinates(location_name)
+        except LocationNotFound:
+            self.geocode_cache.set_not_found(location_name)
+            raise
+        except MapServiceError as e:
+            return self._stale_location(location_name, e)
+        self.geocode_cache.set(location_name, location_data)
+        return location_data
+
+    def _stale_location(self, location_name, error):
+        """Serve an expired cached geocode when ORS failed, otherwise re-raise ``error``."""
+        return self._serve_stale_location(location_name, self.geocode_cache.get_stale(location_name), error)
+
+    def _serve_stale_location(self, location_name, stale, error):
+        if stale is None:
+            raise error
+        logger.warning(f"Serving cached geocode for {location_name} while ORS is failing")
+        metrics.inc('ors_stale_served_total', kind='geocode')
+        return {**stale, 'name': location_name}
+
+    def _parse_coordinate_input(self, location_name):
+        """Return ``(lat, lng)`` if the location is a coordinate string, else None."""
         # Fast-path: accept direct coordinate strings from the client (e.g., 'lat, lng')
         # or labels containing coordinates like 'Location at 39.1234, -84.5678'
         try:
             if isinstance(location_name, str) and ',' in location_name:
-                import re
                 match = re.search(r'(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)', location_name)
                 if match:
                     lat = float(match.group(1))
                     lng = float(match.group(2))
                     # Basic range validation
                     if -90 <= lat <= 90 and -180 <= lng <= 180:
-                        # Snap to nearest road/address for better routability
-                        snapped_lat, snapped_lng, label = self._reverse_geocode_snap(lat, lng)
-                        formatted = label or f"{snapped_lat:.4f}, {snapped_lng:.4f}"
-                        return {
-                            'coordinates': f"{snapped_lng},{snapped_lat}",  # ORS expects 'lng,lat'
-                            'lat': snapped_lat,
-                            'lng': snapped_lng,
-                            'name': location_name,
-                            'formatted_name': formatted
-                        }
+                        return lat, lng
         except Exception:
             # If parsing fails, fall back to geocoding
             pass
+        return None
+
+    def _snapped_location(self, location_name, snapped_lat, snapped_lng, label):
+        formatted = label or f"{snapped_lat:.4f}, {snapped_lng:.4f}"
+        return {
+            'coordinates': f"{snapped_lng},{snapped_lat}",  # ORS expects 'lng,lat'
+            'lat': snapped_lat,
+            'lng': snapped_lng,
+            'name': location_name,
+            'formatted_name': formatted
+        }
+
+    def _parse_geocode_search(self, location_name, data):
+        if not data.get('features'):
+            raise LocationNotFound(f"Location '{location_name}' could not be found.")
+        
+        feature = data['features'][0]
+        coords = feature['geometry']['coordinates']
+        return {
+            'coordinates': f"{coords[0]},{coords[1]}",
+            'lat': coords[1],
+            'lng': coords[0],
+            'name': location_name,
+            'formatted_name': feature.get('properties', {}).get('name', location_name)
+        }
+
+    def _lookup_coordinates(self, location_name):
+        point = self._parse_coordinate_input(location_name)
+        if point:
+            # Snap to nearest road/address for better routability
+            return self._snapped_location(location_name, *self._reverse_geocode_snap(*point))
 
         try:
-            url = f"https://api.openrouteservice.org/geocode/search?api_key={self.api_key}&text={location_name}"
-            res = requests.get(url, timeout=10)
+            with metrics.span('geocode_search'):
+                res = self.ors_client.geocode_search(location_name)
             res.raise_for_status()
-            data = res.json()
-            
-            if not data.get('features'):
-                raise ValueError(f"Location '{location_name}' could not be found.")
-            
-            feature = data['features'][0]
-            coords = feature['geometry']['coordinates']
-            return {
-                'coordinates': f"{coords[0]},{coords[1]}",
-                'lat': coords[1],
-                'lng': coords[0],
-                'name': location_name,
-                'formatted_name': feature.get('properties', {}).get('name', location_name)
-            }
+            return self._parse_geocode_search(location_name, res.json())
+        except OrsUnavailable as e:
+            logger.error(f"ORS unavailable while geocoding {location_name}: {str(e)}")
+            raise MapServiceError(SERVICE_UNAVAILABLE_MESSAGE)
         except requests.exceptions.Timeout:
             logger.error(f"Timeout while geocoding location: {location_name}")
-            raise ValueError(f"Map service timeout while searching for '{location_name}'. Please try again.")
+            raise MapServiceError(f"Map service timeout while searching for '{location_name}'. Please try again.")
         except requests.exceptions.RequestException as e:
             logger.error(f"Request error while geocoding {location_name}: {str(e)}")
-            raise ValueError(f"Map service error while searching for '{location_name}'. Please try again.")
+            raise MapServiceError(f"Map service error while searching for '{location_name}'. Please try again.")
         except ValueError:
             # Re-raise ValueError as-is
             raise
@@ -117,21 +310,96 @@ class HosCalculator:
         except Exception:
             return float('inf')
 
+    def _great_circle_points(self, lat1, lng1, lat2, lng2, parts):
+        """The ``parts - 1`` points that split the great circle between two points into equal arcs, as ``(lat, lng)``."""
+        phi1, lmb1, phi2, lmb2 = map(math.radians, (lat1, lng1, lat2, lng2))
+        delta = self._haversine_meters(lat1, lng1, lat2, lng2) / 6371000.0
+        if math.sin(delta) < 1e-9:
+            raise ValueError("No route found between the specified locations.")
+        points = []
+        for k in range(1, parts):
+            a = math.sin((1 - k / parts) * delta) / math.sin(delta)
+            b = math.sin(k / parts * delta) / math.sin(delta)
+            x = a * math.cos(phi1) * math.cos(lmb1) + b * math.cos(phi2) * math.cos(lmb2)
+            y = a * math.cos(phi1) * math.sin(lmb1) + b * math.cos(phi2) * math.sin(lmb2)
+            z = a * math.sin(phi1) + b * math.sin(phi2)
+            points.append((math.degrees(math.atan2(z, math.hypot(x, y))), math.degrees(math.atan2(y, x))))
+        return points
+
+    def _split_waypoints(self, origin, destination):
+        """Coordinates from ``origin`` to ``destination`` via road points near the great circle, no two over ``SPLIT_LEG_METERS`` apart."""
+        meters = self._haversine_meters(origin['lat'], origin['lng'], destination['lat'], destination['lng'])
+        points = self._great_circle_points(
+            origin['lat'], origin['lng'], destination['lat'], destination['lng'], math.ceil(meters / SPLIT_LEG_METERS),
+        )
+        # ORS only routes from points near a road; snap each one (best-effort) with a reverse geocode
+        snapped = run_concurrently([(self._reverse_geocode_snap, lat, lng) for lat, lng in points], concurrent=self.concurrent)
+        return [origin['coordinates']] + [f"{lng},{lat}" for lat, lng, _ in snapped] + [destination['coordinates']]
+
+    def _stitch_legs(self, parts):
+        """Join consecutive routed parts into one leg."""
+        geometry = []
+        for part in parts:
+            points = part['geometry']
+            geometry += points[1:] if geometry and points and points[0] == geometry[-1] else points
+        return {
+            'distance_meters': sum(part['distance_meters'] for part in parts),
+            'duration_seconds': sum(part['duration_seconds'] for part in parts),
+            'geometry': geometry,
+        }
+
+    def _cache_split_leg(self, lane, sub_lanes, leg):
+        # The whole leg counts as car-routed if any part fell back to the car profile
+        profiles = {self.route_cache.get_profile(sub_lane) for sub_lane in sub_lanes}
+        profile = 'driving-car' if 'driving-car' in profiles else 'driving-hgv'
+        self.route_cache.set(lane, profile, leg)
+        self.route_cache.set_profile(lane, profile)
+
+    def _route_lane(self, origin, destination):
+        """Route one leg between two locations; a leg too long for ORS is routed in parts and stitched.
+
+        The parts run between road points near the great circle and are
+        routed concurrently; the stitched leg is cached like any other.
+        """
+        meters = self._haversine_meters(origin['lat'], origin['lng'], destination['lat'], destination['lng'])
+        if meters <= SPLIT_LEG_METERS:
+            return self._get_route(origin['coordinates'], destination['coordinates'])
+
+        lane = self.route_cache.lane_key(origin['coordinates'], destination['coordinates'])
+        profile = self.route_cache.get_profile(lane) or 'driving-hgv'
+        cached = self.route_cache.get(lane, profile)
+        if cached is not None:
+            return cached
+        try:
+            waypoints = self._split_waypoints(origin, destination)
+            logger.info(f"Routing a {int(meters / 1000)} km leg in {len(waypoints) - 1} parts")
+            metrics.inc('route_leg_splits_total')
+            parts = run_concurrently(
+                [(self._get_route, a, b) for a, b in zip(waypoints, waypoints[1:])], concurrent=self.concurrent,
+            )
+        except MapServiceError as e:
+            return self._stale_route(lane, profile, e)
+        leg = self._stitch_legs(parts)
+        self._cache_split_leg(lane, [self.route_cache.lane_key(a, b) for a, b in zip(waypoints, waypoints[1:])], leg)
+        return leg
+
     def _get_route(self, start_coords, end_coords):
+        lane = self.route_cache.lane_key(start_coords, end_coords)
+        # Lanes where the truck profile failed before go straight to the car profile
+        profile = self.route_cache.get_profile(lane) or 'driving-hgv'
+        cached = self.route_cache.get(lane, profile)
+        if cached is not None:
+            return cached
+
         try:
-            headers = {'Authorization': self.api_key}
             def request_profile(profile):
-                url = f"https://api.openrouteservice.org/v2/directions/{profile}"
-                res = requests.get(url, headers=headers, params={
-                    'start': start_coords,
-                    'end': end_coords,
-                }, timeout=15)
-                return res
-
-            # Try truck profile first
-            res = request_profile('driving-hgv')
-            if not res.ok:
-                # Fallback to car profile for wider availability
+                with metrics.span('route_hgv' if profile == 'driving-hgv' else 'route_car'):
+                    return self.ors_client.directions(profile, start_coords, end_coords)
+
+            res = request_profile(profile)
+            # Fallback to car profile for wider availability, unless ORS itself is throttling or failing
+            if not res.ok and profile == 'driving-hgv' and res.status_code not in RETRY_STATUSES:
+                metrics.inc('ors_route_fallbacks_total')
                 fallback = request_profile('driving-car')
                 if not fallback.ok:
                     # Prefer showing the first error payload if available
@@ -143,23 +411,25 @@ class HosCalculator:
                         f"Routing failed (hgv={res.status_code}, car={fallback.status_code}). {err_text[:200]}"
                     )
                 res = fallback
+                profile = 'driving-car'
+            elif not res.ok:
+                raise requests.exceptions.RequestException(
+                    f"Routing failed ({profile}={res.status_code}). {(res.text or '')[:200]}"
+                )
 
-            data = res.json()
-            if not data.get('features'):
-                raise ValueError("No route found between the specified locations.")
-
-            route_data = data['features'][0]
-            return {
-                "distance_meters": route_data['properties']['summary']['distance'],
-                "duration_seconds": route_data['properties']['summary']['duration'],
-                "geometry": route_data['geometry']['coordinates']
-            }
+            route = self._parse_route(res.json())
+            self.route_cache.set(lane, profile, route)
+            self.route_cache.set_profile(lane, profile)
+            return route
+        except OrsUnavailable as e:
+            logger.error(f"ORS unavailable while calculating route: {str(e)}")
+            return self._stale_route(lane, profile, MapServiceError(SERVICE_UNAVAILABLE_MESSAGE))
         except requests.exceptions.Timeout:
             logger.error(f"Timeout while calculating route from {start_coords} to {end_coords}")
-            raise ValueError("Route calculation timed out. Please try again.")
+            return self._stale_route(lane, profile, MapServiceError("Route calculation timed out. Please try again."))
         except requests.exceptions.RequestException as e:
             logger.error(f"Request error while calculating route: {str(e)}")
-            raise ValueError("Map service error while calculating route. Please try again.")
+            return self._stale_route(lane, profile, MapServiceError("Map service error while calculating route. Please try again."))
         except ValueError:
             # Re-raise ValueError as-is
             raise
@@ -167,135 +437,647 @@ class HosCalculator:
             logger.error(f"Unexpected error while calculating route: {str(e)}")
             raise ValueError("Unable to calculate route between the specified locations. Please verify the addresses and try again.")
 
-    def _add_event(self, logs, status, duration, description, time_cursor, location, hos_status=None):
-        """Add an event to the current day's log, handling midnight crossing when needed."""
-        current_day_log = logs[-1]
-        
-        # Calculate end of current day (midnight)
-        end_of_day = (time_cursor + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-        seconds_until_midnight = (end_of_day - time_cursor).total_seconds()
-        
-        if duration <= seconds_until_midnight:
-            # Event fits entirely in current day
-            event_data = {
-                'status': status,
-                'duration': duration,
-                'start_time': time_cursor.isoformat(),
-                'start_time_hours': time_cursor.hour + time_cursor.minute / 60,
-                'description': description,
-                'location': location,
-                'remarks': f"{description} at {location}"
-            }
-            
-            # Add HOS status information if provided
-            if hos_status:
-                event_data['hos_after'] = {
-                    'dailyDrivingRemaining': round(hos_status.get('daily_driving', 0) / 3600, 2),
-                    'onDutyWindowRemaining': round(hos_status.get('on_duty_window', 0) / 3600, 2),
-                    'breakCycleRemaining': round(hos_status.get('break_cycle', 0) / 3600, 2),
-                    'weeklyCycleRemaining': round(hos_status.get('weekly_cycle', 0) / 3600, 2)
-                }
-            
-            current_day_log['events'].append(event_data)
-            return time_cursor + datetime.timedelta(seconds=duration)
+    def _stale_route(self, lane, profile, error):
+        """Serve an expired cached route when ORS failed, otherwise raise ``error``."""
+        stale = self.route_cache.get(lane, profile, allow_stale=True)
+        if stale is None:
+            raise error
+        logger.warning("Serving cached route while ORS is failing")
+        metrics.inc('ors_stale_served_total', kind='route')
+        return stale
+
+    def _parse_route(self, data):
+        if not data.get('features'):
+            raise ValueError("No route found between the specified locations.")
+
+        route_data = data['features'][0]
+        return {
+            "distance_meters": route_data['properties']['summary']['distance'],
+            "duration_seconds": route_data['properties']['summary']['duration'],
+            "geometry": route_data['geometry']['coordinates']
+        }
+
+    def _request_profiles(self, request, what):
+        """Call ``request(profile)`` with the truck profile, then the car one as ``_get_route`` does; returns ``(res, profile)``."""
+        res = request('driving-hgv')
+        if not res.ok and res.status_code not in RETRY_STATUSES:
+            metrics.inc('ors_route_fallbacks_total')
+            fallback = request('driving-car')
+            if not fallback.ok:
+                raise requests.exceptions.RequestException(
+                    f"{what} failed (hgv={res.status_code}, car={fallback.status_code}). {(res.text or fallback.text or '')[:200]}"
+                )
+            return fallback, 'driving-car'
+        if not res.ok:
+            raise requests.exceptions.RequestException(f"{what} failed (driving-hgv={res.status_code}). {(res.text or '')[:200]}")
+        return res, 'driving-hgv'
+
+    @contextlib.contextmanager
+    def _routing_errors(self, context):
+        """Turn ORS failures inside the block into the same ``MapServiceError`` messages as ``_get_route``."""
+        try:
+            yield
+        except OrsUnavailable as e:
+            logger.error(f"ORS unavailable while calculating {context}: {str(e)}")
+            raise MapServiceError(SERVICE_UNAVAILABLE_MESSAGE)
+        except requests.exceptions.Timeout:
+            logger.error(f"Timeout while calculating {context}")
+            raise MapServiceError("Route calculation timed out. Please try again.")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Request error while calculating {context}: {str(e)}")
+            raise MapServiceError("Map service error while calculating route. Please try again.")
+
+    def _get_matrix(self, locations):
+        """Driving seconds between every pair of ``locations``: from the matrix cache, else one ORS matrix call."""
+        points = [[location['lng'], location['lat']] for location in locations]
+        cached = self.matrix_cache.get(points, ('driving-hgv', 'driving-car'))
+        if cached is not None:
+            durations = cached[0]
         else:
-            # Event crosses midnight: split into two parts
-            
-            first_day_duration = seconds_until_midnight
-            second_day_duration = duration - seconds_until_midnight
-            
-            event_data_part1 = {
-                'status': status,
-                'duration': first_day_duration,
-                'start_time': time_cursor.isoformat(),
-                'start_time_hours': time_cursor.hour + time_cursor.minute / 60,
-                'description': f"{description} (Part 1)",
-                'location': location,
-                'remarks': f"{description} at {location} (continues to next day)"
+            with self._routing_errors('matrix'), metrics.span('matrix'):
+                res, profile = self._request_profiles(lambda profile: self.ors_client.matrix(profile, points), 'Matrix')
+                data = res.json()
+            durations = data.get('durations')
+            if not durations or len(durations) != len(points):
+                raise ValueError("Unable to calculate route between the specified locations. Please verify the addresses and try again.")
+            if data.get('distances'):
+                self.matrix_cache.set(points, profile, durations, data['distances'])
+        return [[UNREACHABLE if value is None else value for value in row] for row in durations]
+
+    def _get_route_legs(self, locations):
+        """Routed legs between consecutive ``locations``, from as few multi-waypoint ORS calls as its limits allow.
+
+        Legs go through the route cache both ways, so a fully cached route
+        costs no call at all. Consecutive stops at the same point become
+        zero-length legs that ORS never sees. Runs of legs share a call while
+        their straight-line total stays within ``SPLIT_LEG_METERS``; a leg
+        longer than that goes through ``_route_lane`` on its own.
+        """
+        lanes = [self.route_cache.lane_key(a['coordinates'], b['coordinates']) for a, b in zip(locations, locations[1:])]
+        same_point = [lane[:2] == lane[2:] for lane in lanes]
+        cached = [
+            None if same else self.route_cache.get(lane, self.route_cache.get_profile(lane) or 'driving-hgv')
+            for lane, same in zip(lanes, same_point)
+        ]
+        runs, long_legs = [], []
+        run_meters = None  # straight-line length of the open run, None when there is none
+        for i, (a, b) in enumerate(zip(locations, locations[1:])):
+            if same_point[i]:
+                continue
+            meters = self._haversine_meters(a['lat'], a['lng'], b['lat'], b['lng'])
+            if meters > SPLIT_LEG_METERS:
+                long_legs.append(i)
+                run_meters = None
+            elif run_meters is None or run_meters + meters > SPLIT_LEG_METERS:
+                runs.append([i])
+                run_meters = meters
+            else:
+                runs[-1].append(i)
+                run_meters += meters
+
+        # One call per run with an uncached leg, one _route_lane per uncached long leg; all concurrent
+        calls, long_indices = [], []
+        for run in runs:
+            if any(cached[i] is None for i in run):
+                calls.append((self._route_waypoints, locations, run))
+                long_indices.append(None)
+        for i in long_legs:
+            if cached[i] is None:
+                calls.append((self._route_lane, locations[i], locations[i + 1]))
+                long_indices.append(i)
+        routed = {}
+        for i, result in zip(long_indices, run_concurrently(calls, concurrent=self.concurrent)):
+            routed.update(result if i is None else {i: result})
+
+        legs = []
+        for i, (same, location, leg) in enumerate(zip(same_point, locations[1:], cached)):
+            if same:
+                legs.append({'distance_meters': 0, 'duration_seconds': 0, 'geometry': [[location['lng'], location['lat']]]})
+            else:
+                legs.append(leg if leg is not None else routed[i])
+        return legs
+
+    def _route_waypoints(self, locations, run):
+        """Route the legs ``run`` (indices into consecutive ``locations``) with one ORS call; returns ``{index: leg}``."""
+        waypoints = [[locations[run[0]]['lng'], locations[run[0]]['lat']]] + [
+            [locations[i + 1]['lng'], locations[i + 1]['lat']] for i in run
+        ]
+        with self._routing_errors('route'):
+            res, profile = self._request_profiles(
+                lambda profile: self.ors_client.directions_route(profile, waypoints), 'Routing',
+            )
+            legs = self._parse_route_legs(res.json(), len(waypoints) - 1)
+        for i, leg in zip(run, legs):
+            lane = self.route_cache.lane_key(locations[i]['coordinates'], locations[i + 1]['coordinates'])
+            self.route_cache.set(lane, profile, leg)
+            self.route_cache.set_profile(lane, profile)
+        return dict(zip(run, legs))
+
+    def _parse_route_legs(self, data, count):
+        """Split a multi-waypoint route into ``count`` legs using its ``segments`` and ``way_points``."""
+        if not data.get('features'):
+            raise ValueError("No route found between the specified locations.")
+        feature = data['features'][0]
+        coordinates = feature['geometry']['coordinates']
+        segments = feature['properties'].get('segments') or []
+        way_points = feature['properties'].get('way_points') or []
+        if len(segments) != count or len(way_points) != count + 1:
+            raise ValueError("No route found between the specified locations.")
+        return [
+            {
+                'distance_meters': segment.get('distance', 0),
+                'duration_seconds': segment.get('duration', 0),
+                'geometry': coordinates[way_points[i]:way_points[i + 1] + 1],
             }
+            for i, segment in enumerate(segments)
+        ]
+
+    def _schedule_trip_loop(self, locations, leg_seconds, stop_descriptions, fuel_stop_times,
+                            cycle_hours_used, start_time):
+        """Reference HOS engine: simulate the decision hierarchy one event at a time.
+
+        ``locations`` are the trip's stops in driving order and ``leg_seconds``
+        the driving time between consecutive ones. Every stop between the first
+        and the last is an on-duty task described by ``stop_descriptions``
+        (``['Pickup Stop']`` for a start/pickup/dropoff trip).
+        ``fuel_stop_times`` are the driving seconds from the start at which a
+        fuel stop is due; drives end exactly there and at every stop.
+        Returns the trip's ``DutyLog``.
+        """
+        names = [location['formatted_name'] for location in locations]
+        # Total driving time needed (master "Time to Destination" value)
+        total_driving_time_needed = sum(leg_seconds)
+
+        # PART 1: INITIALIZE THE FOUR TIME BANKS
+        daily_driving_bank = MAX_DRIVING_PER_DAY  # 11 hours
+        daily_on_duty_window = MAX_ON_DUTY_WINDOW  # 14 hours (starts on first On-Duty task)
+        break_cycle_bank = DRIVING_LIMIT_BEFORE_BREAK  # 8 hours
+        weekly_cycle_bank = WEEKLY_CYCLE_LIMIT - (cycle_hours_used * 3600)  # 70 - user input
+        
+        # Initialize logs and time tracking
+        logs = DutyLog(start_time)
+        on_duty_window_started = False
+        
+        # Track remaining driving time to destination
+        time_to_destination = total_driving_time_needed
+        
+        # Fuel stops, as the remaining driving time at which each is due
+        fuel_marks = [total_driving_time_needed - seconds for seconds in fuel_stop_times]
+        fuel_done = 0
+        
+        # Stop tasks along the way, and the remaining driving time on arriving at each
+        stop_tasks = [
+            {'type': ON_DUTY, 'duration': PICKUP_DROPOFF_TIME, 'description': description, 'location': names[i + 1]}
+            for i, description in enumerate(stop_descriptions)
+        ]
+        stop_marks = [sum(leg_seconds[i + 1:]) for i in range(len(stop_tasks))]
+        stops_done = 0
+        
+        # Track current location for geographical context, and the leg being driven
+        current_location = names[0]
+        leg = 0
+        while leg < len(stop_marks) and time_to_destination <= stop_marks[leg]:
+            leg += 1
+        
+        # PART 3: THE ENGINE - THE DECISION-MAKING HIERARCHY LOOP
+        logger.info("Starting HOS calculation loop...")
+        
+        # Execute pre-trip inspection first
+        logs.add(ON_DUTY, PRE_TRIP_INSPECTION_TIME, 'Pre-Trip Inspection', current_location, (
+            daily_driving_bank,
+            daily_on_duty_window - PRE_TRIP_INSPECTION_TIME,
+            break_cycle_bank,
+            weekly_cycle_bank - PRE_TRIP_INSPECTION_TIME
+        ))
+        on_duty_window_started = True
+        daily_on_duty_window -= PRE_TRIP_INSPECTION_TIME
+        weekly_cycle_bank -= PRE_TRIP_INSPECTION_TIME
+        
+        # Main simulation loop
+        while time_to_destination > 0:
             
-            # Add HOS status to part 1 if provided
-            if hos_status:
-                event_data_part1['hos_after'] = {
-                    'dailyDrivingRemaining': round(hos_status.get('daily_driving', 0) / 3600, 2),
-                    'onDutyWindowRemaining': round(hos_status.get('on_duty_window', 0) / 3600, 2),
-                    'breakCycleRemaining': round(hos_status.get('break_cycle', 0) / 3600, 2),
-                    'weeklyCycleRemaining': round(hos_status.get('weekly_cycle', 0) / 3600, 2)
-                }
+            # CHECK 1: IS A WEEKLY RESET REQUIRED?
+            if weekly_cycle_bank <= 0:
+                logger.info("Weekly reset required - logging 34-hour restart")
+                logs.add(OFF_DUTY, REQUIRED_34_HOUR_RESTART, '34-hour Restart', current_location, (
+                    MAX_DRIVING_PER_DAY,
+                    MAX_ON_DUTY_WINDOW,
+                    DRIVING_LIMIT_BEFORE_BREAK,
+                    WEEKLY_CYCLE_LIMIT
+                ))
+                # Reset all banks after 34-hour restart
+                weekly_cycle_bank = WEEKLY_CYCLE_LIMIT
+                daily_driving_bank = MAX_DRIVING_PER_DAY
+                daily_on_duty_window = MAX_ON_DUTY_WINDOW
+                break_cycle_bank = DRIVING_LIMIT_BEFORE_BREAK
+                on_duty_window_started = False
+                continue
             
-            current_day_log['events'].append(event_data_part1)
+            # CHECK 2: IS THE WORK DAY OVER?
+            if daily_driving_bank <= 0 or (on_duty_window_started and daily_on_duty_window <= 0):
+                logger.info("Daily reset required - logging 10-hour break")
+                logs.add(SLEEPER_BERTH, REQUIRED_OFF_DUTY_RESET, '10-hour Reset', current_location, (
+                    MAX_DRIVING_PER_DAY,
+                    MAX_ON_DUTY_WINDOW,
+                    DRIVING_LIMIT_BEFORE_BREAK,
+                    weekly_cycle_bank
+                ))
+                # Reset daily banks after 10-hour break
+                daily_driving_bank = MAX_DRIVING_PER_DAY
+                daily_on_duty_window = MAX_ON_DUTY_WINDOW
+                break_cycle_bank = DRIVING_LIMIT_BEFORE_BREAK
+                on_duty_window_started = False
+                continue
             
-            self._finalize_day_log(current_day_log)
+            # CHECK 3: IS A DRIVING BREAK REQUIRED?
+            if break_cycle_bank <= 0 and time_to_destination > 0:
+                logger.info("30-minute break required")
+                logs.add(OFF_DUTY, REQUIRED_30_MIN_BREAK, '30-minute Break', current_location, (
+                    daily_driving_bank,
+                    daily_on_duty_window - REQUIRED_30_MIN_BREAK if on_duty_window_started else daily_on_duty_window,
+                    DRIVING_LIMIT_BEFORE_BREAK,
+                    weekly_cycle_bank
+                ))
+                # Reset break cycle bank after 30-minute break
+                break_cycle_bank = DRIVING_LIMIT_BEFORE_BREAK
+                # 14-hour window continues to count down during break (it never pauses)
+                if on_duty_window_started:
+                    daily_on_duty_window -= REQUIRED_30_MIN_BREAK
+                continue
             
-            new_day_number = len(logs) + 1
-            logs.append({'day': new_day_number, 'events': []})
+            # CHECK 4: IS A PLANNED TASK NEXT?
+            task_to_execute = None
             
-            new_time_cursor = end_of_day
-            event_data_part2 = {
-                'status': status,
-                'duration': second_day_duration,
-                'start_time': new_time_cursor.isoformat(),
-                'start_time_hours': 0,  # Starts at midnight
-                'description': f"{description} (Part 2)",
-                'location': location,
-                'remarks': f"{description} at {location} (continued from previous day)"
-            }
+            # Check if we need to do the next stop (when we've driven to its location)
+            if stops_done < len(stop_marks) and time_to_destination <= stop_marks[stops_done]:
+                task_to_execute = stop_tasks[stops_done]
+                stops_done += 1  # Mark as completed
+                current_location = task_to_execute['location']
             
-            # Add HOS status to part 2 if provided
-            if hos_status:
-                event_data_part2['hos_after'] = {
-                    'dailyDrivingRemaining': round(hos_status.get('daily_driving', 0) / 3600, 2),
-                    'onDutyWindowRemaining': round(hos_status.get('on_duty_window', 0) / 3600, 2),
-                    'breakCycleRemaining': round(hos_status.get('break_cycle', 0) / 3600, 2),
-                    'weeklyCycleRemaining': round(hos_status.get('weekly_cycle', 0) / 3600, 2)
+            # Check for fueling stops (the truck has reached the next fuel mark)
+            elif fuel_marks and time_to_destination <= fuel_marks[0]:
+                fuel_marks.pop(0)
+                fuel_done += 1
+                task_to_execute = {
+                    'type': ON_DUTY,
+                    'duration': FUELING_TIME,
+                    'description': f'Fueling Stop {fuel_done}',
+                    'location': f'En Route - Fuel Stop {fuel_done}'
                 }
+                current_location = task_to_execute['location']
             
-            logs[-1]['events'].append(event_data_part2)
+            if task_to_execute:
+                logger.info(f"Executing planned task: {task_to_execute['description']}")
+                logs.add(task_to_execute['type'], task_to_execute['duration'],
+                         task_to_execute['description'], task_to_execute['location'], (
+                    daily_driving_bank,
+                    daily_on_duty_window - task_to_execute['duration'],
+                    break_cycle_bank,
+                    weekly_cycle_bank - task_to_execute['duration']
+                ))
+                
+                # Start on-duty window if not already started
+                if not on_duty_window_started:
+                    on_duty_window_started = True
+                
+                # Update banks for On-Duty time
+                daily_on_duty_window -= task_to_execute['duration']
+                weekly_cycle_bank -= task_to_execute['duration']
+                continue
             
-            return new_time_cursor + datetime.timedelta(seconds=second_day_duration)
-
-    def _finalize_day_log(self, day_log):
-        """Finalize a day's log: ensure total equals 24h and compute status totals."""
-        total_seconds = sum(event['duration'] for event in day_log['events'])
-        remaining_seconds = 24 * 3600 - total_seconds
+            # DEFAULT ACTION: DRIVE
+            if time_to_destination > 0:
+                # PART 4: THE CORE MATHEMATICS - CALCULATING DRIVING TIME
+                # Drive no further than the next planned stop (trip stop or fuel mark)
+                stop_mark = max(
+                    stop_marks[stops_done] if stops_done < len(stop_marks) else 0,
+                    fuel_marks[0] if fuel_marks else 0
+                )
+                time_to_stop = time_to_destination - stop_mark
+                # The "Minimum Value" Rule
+                driving_duration = min(
+                    time_to_stop,         # Time remaining to the next stop or the destination
+                    daily_driving_bank,   # Time remaining in Daily Driving Bank
+                    daily_on_duty_window if on_duty_window_started else float('inf'),  # Time remaining in On-Duty Window
+                    break_cycle_bank      # Time remaining in Break-Cycle Bank
+                )
+                
+                logger.info(f"Driving for {driving_duration/3600:.2f} hours (minimum of: next_stop={time_to_stop/3600:.2f}h, daily_driving={daily_driving_bank/3600:.2f}h, on_duty_window={daily_on_duty_window/3600:.2f}h, break_cycle={break_cycle_bank/3600:.2f}h)")
+                
+                # Determine current driving segment description
+                drive_description = f"Drive from {names[leg]} toward {names[leg + 1]}"
+                
+                # PART 5: LOGGING AND UPDATING THE BANKS
+                logs.add(DRIVING, driving_duration, drive_description, current_location, (
+                    daily_driving_bank - driving_duration,
+                    daily_on_duty_window - driving_duration,
+                    break_cycle_bank - driving_duration,
+                    weekly_cycle_bank - driving_duration
+                ))
+                
+                # Start on-duty window if this is the first driving event
+                if not on_duty_window_started:
+                    on_duty_window_started = True
+                
+                # Update all relevant time banks
+                daily_driving_bank -= driving_duration      # Driving reduces Daily Driving Bank
+                daily_on_duty_window -= driving_duration    # Driving reduces On-Duty Window
+                break_cycle_bank -= driving_duration        # Driving reduces Break-Cycle Bank
+                weekly_cycle_bank -= driving_duration       # Driving reduces Weekly Cycle Bank
+                # Reduce remaining driving time (landing exactly on the stop mark when it was the limit)
+                time_to_destination = stop_mark if driving_duration == time_to_stop else time_to_destination - driving_duration
+                
+                # Update current location approximation
+                while leg < len(stop_marks) and time_to_destination <= stop_marks[leg]:
+                    leg += 1
+                current_location = f"En route to {names[leg + 1]}"
         
-        if remaining_seconds > 0:
-            # Add Off Duty time to complete the 24-hour accounting
-            day_log['events'].append({
-                'status': 'Off Duty',
-                'duration': remaining_seconds,
-                'start_time': None,  # Will be calculated during rendering
-                'start_time_hours': None,
-                'description': 'Off Duty',
-                'location': 'End of Day',
-                'remarks': 'Remaining time to complete 24-hour log'
-            })
+        # Finalize the last day's log
+        return logs.finish()
+
+    def _plan_closed_form(self, names, leg_seconds, stop_descriptions, fuel_stop_times, cycle_hours_used):
+        """Closed-form HOS engine: return the trip's duty events without simulating each decision.
+
+        Once the driver is coming off a reset with nothing scheduled for the
+        day, every duty day has the same shape: drive until the 8-hour break,
+        take 30 minutes, drive out the rest of the 11-hour bank, and sleep 10
+        hours. Those days are emitted whole, after one O(1) check that no
+        stop, fuel stop, weekly restart or arrival falls inside them. Only the
+        irregular days go through the event-by-event decision hierarchy.
+
+        Events are ``(status, duration, description, location, hos_after)``
+        tuples, where ``hos_after`` holds the four banks in seconds. Added to
+        a ``DutyLog`` they are identical to ``_schedule_trip_loop``, whose
+        arguments these are (with ``names`` for the locations).
+        """
+        T = sum(leg_seconds)
+        # Remaining driving time at each trip stop and fuel stop, as in the loop engine
+        stop_marks = [sum(leg_seconds[i + 1:]) for i in range(len(stop_descriptions))]
+        stop_count = len(stop_marks)
+        stops_done = 0
+        fuel_marks = [T - seconds for seconds in fuel_stop_times]
+        fuel_count = len(fuel_marks)
+        fuel_done = 0
+        drive_descriptions = [f"Drive from {names[i]} toward {names[i + 1]}" for i in range(len(names) - 1)]
+        en_route = [f"En route to {name}" for name in names[1:]]
+        leg = 0
+        while leg < stop_count and T <= stop_marks[leg]:
+            leg += 1
+
+        D = MAX_DRIVING_PER_DAY
+        W = MAX_ON_DUTY_WINDOW
+        B = DRIVING_LIMIT_BEFORE_BREAK
+        C = WEEKLY_CYCLE_LIMIT - (cycle_hours_used * 3600)
+        location = names[0]
+        events = [(ON_DUTY, PRE_TRIP_INSPECTION_TIME, 'Pre-Trip Inspection', location,
+                   (D, W - PRE_TRIP_INSPECTION_TIME, B, C - PRE_TRIP_INSPECTION_TIME))]
+        started = True
+        W -= PRE_TRIP_INSPECTION_TIME
+        C -= PRE_TRIP_INSPECTION_TIME
+        append = events.append
+        # A day only takes the fast path if no stop lies within its driving (plus a second of slack)
+        clear_day = MAX_DRIVING_PER_DAY + 1
+
+        while T > 0:
+            # Whole regular duty days straight after a reset
+            while (not started and D == MAX_DRIVING_PER_DAY and W == MAX_ON_DUTY_WINDOW
+                   and B == DRIVING_LIMIT_BEFORE_BREAK and T > MAX_DRIVING_PER_DAY
+                   and C - MAX_DRIVING_PER_DAY > 0
+                   and (stops_done == stop_count or T - stop_marks[stops_done] > clear_day)
+                   and (fuel_done == fuel_count or T - fuel_marks[fuel_done] > clear_day)):
+                d = min(T, D, B)
+                append((DRIVING, d, drive_descriptions[leg], location, (D - d, W - d, B - d, C - d)))
+                D -= d
+                W -= d
+                B -= d
+                C -= d
+                T -= d
+                location = en_route[leg]
+                append((OFF_DUTY, REQUIRED_30_MIN_BREAK, '30-minute Break', location,
+                        (D, W - REQUIRED_30_MIN_BREAK, DRIVING_LIMIT_BEFORE_BREAK, C)))
+                B = DRIVING_LIMIT_BEFORE_BREAK
+                W -= REQUIRED_30_MIN_BREAK
+                d = min(T, D, W, B)
+                append((DRIVING, d, drive_descriptions[leg], location, (D - d, W - d, B - d, C - d)))
+                D -= d
+                W -= d
+                B -= d
+                C -= d
+                T -= d
+                location = en_route[leg]
+                append((SLEEPER_BERTH, REQUIRED_OFF_DUTY_RESET, '10-hour Reset', location,
+                        (MAX_DRIVING_PER_DAY, MAX_ON_DUTY_WINDOW, DRIVING_LIMIT_BEFORE_BREAK, C)))
+                D = MAX_DRIVING_PER_DAY
+                W = MAX_ON_DUTY_WINDOW
+                B = DRIVING_LIMIT_BEFORE_BREAK
+
+            if C <= 0:
+                append((OFF_DUTY, REQUIRED_34_HOUR_RESTART, '34-hour Restart', location,
+                        (MAX_DRIVING_PER_DAY, MAX_ON_DUTY_WINDOW, DRIVING_LIMIT_BEFORE_BREAK, WEEKLY_CYCLE_LIMIT)))
+                C = WEEKLY_CYCLE_LIMIT
+                D = MAX_DRIVING_PER_DAY
+                W = MAX_ON_DUTY_WINDOW
+                B = DRIVING_LIMIT_BEFORE_BREAK
+                started = False
+            elif D <= 0 or (started and W <= 0):
+                append((SLEEPER_BERTH, REQUIRED_OFF_DUTY_RESET, '10-hour Reset', location,
+                        (MAX_DRIVING_PER_DAY, MAX_ON_DUTY_WINDOW, DRIVING_LIMIT_BEFORE_BREAK, C)))
+                D = MAX_DRIVING_PER_DAY
+                W = MAX_ON_DUTY_WINDOW
+                B = DRIVING_LIMIT_BEFORE_BREAK
+                started = False
+            elif B <= 0:
+                append((OFF_DUTY, REQUIRED_30_MIN_BREAK, '30-minute Break', location,
+                        (D, W - REQUIRED_30_MIN_BREAK if started else W, DRIVING_LIMIT_BEFORE_BREAK, C)))
+                B = DRIVING_LIMIT_BEFORE_BREAK
+                if started:
+                    W -= REQUIRED_30_MIN_BREAK
+            elif (stops_done < stop_count and T <= stop_marks[stops_done]) or (fuel_done < fuel_count and T <= fuel_marks[fuel_done]):
+                if stops_done < stop_count and T <= stop_marks[stops_done]:
+                    duration, description, location = PICKUP_DROPOFF_TIME, stop_descriptions[stops_done], names[stops_done + 1]
+                    stops_done += 1
+                else:
+                    fuel_done += 1
+                    duration = FUELING_TIME
+                    description = f'Fueling Stop {fuel_done}'
+                    location = f'En Route - Fuel Stop {fuel_done}'
+                append((ON_DUTY, duration, description, location, (D, W - duration, B, C - duration)))
+                started = True
+                W -= duration
+                C -= duration
+            else:
+                stop = max(stop_marks[stops_done] if stops_done < stop_count else 0,
+                           fuel_marks[fuel_done] if fuel_done < fuel_count else 0)
+                to_stop = T - stop
+                d = min(to_stop, D, W if started else float('inf'), B)
+                append((DRIVING, d, drive_descriptions[leg], location, (D - d, W - d, B - d, C - d)))
+                started = True
+                D -= d
+                W -= d
+                B -= d
+                C -= d
+                T = stop if d == to_stop else T - d
+                while leg < stop_count and T <= stop_marks[leg]:
+                    leg += 1
+                location = en_route[leg]
+
+        return events
+
+    def _schedule_trip_closed_form(self, locations, leg_seconds, stop_descriptions, fuel_stop_times,
+                                   cycle_hours_used, start_time):
+        """Log ``_plan_closed_form`` events into a ``DutyLog`` (same log as ``_schedule_trip_loop``)."""
+        events = self._plan_closed_form(
+            [location['formatted_name'] for location in locations], leg_seconds, stop_descriptions,
+            fuel_stop_times, cycle_hours_used,
+        )
+        logs = DutyLog(start_time)
+        add = logs.add
+        for event in events:
+            add(*event)
+        return logs.finish()
+
+    def _locate_events(self, logs, route_index):
+        """Give every event the ``lat``/``lng`` where it starts, from the driving time before it."""
+        driven = 0
+        for event in logs.events():
+            position = route_index.position_at_time(driven)
+            if position is not None:
+                event.lat = round(position[0], 6)
+                event.lng = round(position[1], 6)
+            if event.status == DRIVING:
+                driven += event.duration
+
+    def _snap_stops_to_pois(self, logs):
+        """Attach the nearest known facility within ``POI_CORRIDOR_METERS`` of the route to fuel stops and resets."""
+        if not len(self.poi_index):
+            return
+        corridor = settings.POI_CORRIDOR_METERS
+        for event in logs.events():
+            if event.lat is None:
+                continue
+            if event.description.startswith('Fueling Stop'):
+                kinds = FUEL_POI_KINDS
+            elif event.description.startswith(('10-hour Reset', '34-hour Restart')):
+                kinds = REST_POI_KINDS
+            else:
+                continue
+            event.facility = self.poi_index.nearest(event.lat, event.lng, corridor, kinds)
+
+    def _schedule_legs(self, locations, legs, stop_descriptions, cycle_hours_used, start_time=None):
+        """Run the HOS engine over routed legs in driving order; returns ``(logs, fuel_stop_times)``.
+
+        The trip departs at ``start_time``, by default 6 AM (UTC) today.
+        ``logs`` are the rendered day-log dicts of the engine's ``DutyLog``.
+        """
+        # Schedule Fixed Tasks: fuel every FUELING_DISTANCE_MILES along the actual route
+        route_index = RouteIndex(legs)
+        fuel_stop_times = route_index.milestone_times(FUELING_DISTANCE_MILES)
         
-        # Calculate totals for each status (for log sheet display)
-        status_totals = {'Off Duty': 0, 'Sleeper Berth': 0, 'Driving': 0, 'On Duty': 0}
-        for event in day_log['events']:
-            status = event['status']
-            duration_hours = event['duration'] / 3600
-            if status in status_totals:
-                status_totals[status] += duration_hours
+        # PART 1 & 3-6: run the HOS engine from 6 AM today
+        time_cursor = start_time or datetime.datetime.utcnow().replace(hour=6, minute=0, second=0, microsecond=0)  # Start at 6 AM
+        schedule = self._schedule_trip_closed_form if self.schedule_engine == 'closed_form' else self._schedule_trip_loop
+        with metrics.span('hos_schedule'):
+            logs = schedule(
+                locations, [leg['duration_seconds'] for leg in legs], stop_descriptions,
+                fuel_stop_times, cycle_hours_used, time_cursor,
+            )
+            self._locate_events(logs, route_index)
+            self._snap_stops_to_pois(logs)
+            logs = logs.render()
         
-        day_log['status_totals'] = status_totals
-        day_log['total_hours'] = sum(status_totals.values())
+        logger.info(f"Trip calculation completed. Generated {len(logs)} day(s) of logs.")
+        return logs, fuel_stop_times
 
-    def _calculate_minimum_driving_time(self, remaining_driving_time, daily_driving_bank, daily_on_duty_window, break_cycle_bank):
-        """Calculate the minimum driving time based on all time banks"""
-        return min(
-            remaining_driving_time,
-            daily_driving_bank,
-            daily_on_duty_window,
-            break_cycle_bank
+    def _trip_totals(self, legs, logs, fuel_stop_times):
+        """``(total_distance_miles, total_driving_hours, trip_summary)`` over all legs."""
+        total_driving_time_needed = sum(leg['duration_seconds'] for leg in legs)
+        total_distance_miles = sum(leg['distance_meters'] for leg in legs) / 1609.34
+        return total_distance_miles, total_driving_time_needed / 3600, {
+            'total_days': len(logs),
+            'total_driving_hours': total_driving_time_needed / 3600,
+            'total_distance_miles': total_distance_miles,
+            'fueling_stops': len(fuel_stop_times)
+        }
+
+    def _route_legs(self, named_legs):
+        # Per-leg summary; point_count splits route_geometry back into legs
+        return [
+            {
+                'leg': name,
+                'distance_meters': leg['distance_meters'],
+                'duration_seconds': leg['duration_seconds'],
+                'point_count': len(leg['geometry']),
+            }
+            for name, leg in named_legs
+        ]
+
+    def _build_trip_result(self, start_location_data, pickup_location_data, dropoff_location_data,
+                           start_to_pickup, pickup_to_dropoff, cycle_hours_used, start_time=None):
+        """Run the HOS engine over resolved locations and routed legs and assemble the API result."""
+        legs = [start_to_pickup, pickup_to_dropoff]
+        logs, fuel_stop_times = self._schedule_legs(
+            [start_location_data, pickup_location_data, dropoff_location_data], legs, ['Pickup Stop'], cycle_hours_used,
+            start_time,
+        )
+        total_distance_miles, total_driving_hours, trip_summary = self._trip_totals(legs, logs, fuel_stop_times)
+        return {
+            'route_geometry': start_to_pickup['geometry'] + pickup_to_dropoff['geometry'],
+            'route_legs': self._route_legs((('start_to_pickup', start_to_pickup), ('pickup_to_dropoff', pickup_to_dropoff))),
+            'logs': logs,
+            'total_distance_miles': total_distance_miles,
+            'total_driving_time_hours': total_driving_hours,
+            'start_location': start_location_data,
+            'pickup_location': pickup_location_data,
+            'dropoff_location': dropoff_location_data,
+            'trip_summary': trip_summary
+        }
+
+    def _build_multi_stop_result(self, locations, order, stops, legs, cycle_hours_used):
+        """Schedule a multi-stop trip routed in ``order`` (indices into ``[start] + stops``) and assemble its result."""
+        visits = [stops[i - 1] for i in order[1:]]
+        logs, fuel_stop_times = self._schedule_legs(
+            locations, legs, [STOP_DESCRIPTIONS[visit['type']] for visit in visits[:-1]], cycle_hours_used,
         )
+        total_distance_miles, total_driving_hours, trip_summary = self._trip_totals(legs, logs, fuel_stop_times)
+        labels = ['start'] + [f"stop_{i - 1}" for i in order[1:]]
+        return {
+            'route_geometry': [point for leg in legs for point in leg['geometry']],
+            'route_legs': self._route_legs(zip([f"{a}_to_{b}" for a, b in zip(labels, labels[1:])], legs)),
+            'logs': logs,
+            'total_distance_miles': total_distance_miles,
+            'total_driving_time_hours': total_driving_hours,
+            'start_location': locations[0],
+            # Stops in visiting order; stop_index points back into the request's list
+            'stops': [
+                {**location, 'stop_index': i - 1, 'type': stops[i - 1]['type']}
+                for location, i in zip(locations[1:], order[1:])
+            ],
+            'stop_order': [i - 1 for i in order[1:]],
+            'trip_summary': {**trip_summary, 'total_stops': len(stops)}
+        }
+
+    def _error_result(self, error, context='calculate_trip'):
+        metrics.inc('trip_calculation_errors_total', kind='validation' if isinstance(error, ValueError) else 'unexpected')
+        if isinstance(error, ValueError):
+            logger.error(f"Validation error in {context}: {str(error)}")
+            return {'error': str(error)}
+        logger.error(f"Unexpected error in {context}: {str(error)}", exc_info=error)
+        return {'error': 'An unexpected error occurred while calculating the trip. Please try again.'}
 
-    def _calculate_fueling_stops(self, total_distance_miles):
-        """Calculate the number of fueling stops needed"""
-        return max(0, int(total_distance_miles / FUELING_DISTANCE_MILES))
+    def _trip_key(self, start_location, pickup_location, dropoff_location, cycle_hours_used):
+        # Same normalization as the geocode cache, so trivially different spellings coalesce too
+        parts = [normalize_location(start_location), normalize_location(pickup_location),
+                 normalize_location(dropoff_location), str(cycle_hours_used), self.schedule_engine]
+        return hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest()
 
     def calculate_trip(self, start_location, pickup_location, dropoff_location, cycle_hours_used):
+        """Calculate a trip, sharing the work with any identical calculation already in flight."""
+        args = (start_location, pickup_location, dropoff_location, cycle_hours_used)
+        if not settings.TRIP_COALESCE_ENABLED:
+            return self._calculate_trip(*args)
+        return get_trip_coalescer().do(self._trip_key(*args), lambda: self._calculate_trip(*args))
+
+    def _calculate_trip(self, start_location, pickup_location, dropoff_location, cycle_hours_used):
         """
         Calculate trip following the exact HOS specifications:
         Part 1: Initialize Time Banks
@@ -307,248 +1089,371 @@ class HosCalculator:
         """
         try:
             # PART 2: THE BLUEPRINT - INITIAL CALCULATIONS
+            plan = self._resolve_trip(start_location, pickup_location, dropoff_location)
+            return self._schedule_plan(plan, cycle_hours_used)
             
-            # Map the Journey
+        except Exception as e:
+            return self._error_result(e)
+
+    def _resolve_trip(self, start_location, pickup_location, dropoff_location):
+        """Geocode the three locations and route both legs; returns the plan ``schedule_plan`` takes."""
+        # Map the Journey (the three lookups are independent, so they run side by side)
+        logger.info("Mapping journey locations...")
+        with metrics.span('geocode'):
+            start_location_data, pickup_location_data, dropoff_location_data = run_concurrently([
+                (self._get_coordinates, start_location),
+                (self._get_coordinates, pickup_location),
+                (self._get_coordinates, dropoff_location),
+            ], concurrent=self.concurrent)
+        
+        # Calculate route segments (legs too long for ORS are routed in parts)
+        with metrics.span('route'):
+            start_to_pickup, pickup_to_dropoff = run_concurrently([
+                (self._route_lane, start_location_data, pickup_location_data),
+                (self._route_lane, pickup_location_data, dropoff_location_data),
+            ], concurrent=self.concurrent)
+        return {
+            'locations': [start_location_data, pickup_location_data, dropoff_location_data],
+            'legs': [start_to_pickup, pickup_to_dropoff],
+        }
+
+    def _schedule_plan(self, plan, cycle_hours_used, start_time=None):
+        result = self._build_trip_result(*plan['locations'], *plan['legs'], cycle_hours_used, start_time)
+        self._name_event_places([result])
+        return result
+
+    def plan_trip(self, start_location, pickup_location, dropoff_location):
+        """Resolve a trip's locations and route legs once, for ``schedule_plan`` to re-use.
+
+        Returns ``{'locations', 'legs'}`` (plain JSON, so it can be stored)
+        or ``{'error': ...}``.
+        """
+        try:
+            return self._resolve_trip(start_location, pickup_location, dropoff_location)
+        except Exception as e:
+            return self._error_result(e, 'plan_trip')
+
+    def schedule_plan(self, plan, cycle_hours_used, start_time=None):
+        """Run only the HOS scheduling phase over a ``plan_trip`` plan; same result as ``calculate_trip``."""
+        try:
+            return self._schedule_plan(plan, cycle_hours_used, start_time)
+        except Exception as e:
+            return self._error_result(e, 'schedule_plan')
+
+    def calculate_trips(self, trips, max_workers=None):
+        """Calculate many trips at once, returning one result (or ``{'error': ...}``) per trip.
+
+        Each distinct location and each distinct lane is resolved against ORS
+        only once for the whole batch, on a worker pool, then the HOS engine
+        runs for every trip in turn. ``trips`` are dicts with the
+        ``calculate_trip`` fields.
+        """
+        max_workers = max_workers or settings.BATCH_WORKERS
+
+        # 1. Geocode every distinct location once
+        names = {}
+        for trip in trips:
+            for field in ('start_location', 'pickup_location', 'dropoff_location'):
+                names.setdefault(normalize_location(trip[field]), trip[field])
+        keys = list(names)
+        with metrics.span('geocode'):
+            resolved = run_concurrently(
+                [(self._get_coordinates, names[key]) for key in keys],
+                concurrent=self.concurrent, max_workers=max_workers, return_exceptions=True,
+            )
+        locations = dict(zip(keys, resolved))
+
+        # 2. Route every distinct lane once, for trips whose locations all resolved
+        prepared = []
+        lanes = {}
+        for trip in trips:
+            try:
+                trip_locations = []
+                for field in ('start_location', 'pickup_location', 'dropoff_location'):
+                    location_data = locations[normalize_location(trip[field])]
+                    if isinstance(location_data, Exception):
+                        raise location_data
+                    trip_locations.append({**location_data, 'name': trip[field]})
+            except Exception as e:
+                prepared.append(e)
+                continue
+            trip_lanes = []
+            for origin, destination in zip(trip_locations, trip_locations[1:]):
+                lane = (origin['coordinates'], destination['coordinates'])
+                lanes.setdefault(lane, (origin, destination))
+                trip_lanes.append(lane)
+            prepared.append((trip_locations, trip_lanes))
+        lane_keys = list(lanes)
+        with metrics.span('route'):
+            routed = run_concurrently(
+                [(self._route_lane, *lanes[lane]) for lane in lane_keys],
+                concurrent=self.concurrent, max_workers=max_workers, return_exceptions=True,
+            )
+        routes = dict(zip(lane_keys, routed))
+
+        # 3. Run the HOS engine for every trip that made it this far. This is CPU
+        # work, which threads would only interleave under the GIL, so it runs serially.
+        def build(trip, entry):
+            if isinstance(entry, Exception):
+                return self._error_result(entry, 'calculate_trips')
+            trip_locations, trip_lanes = entry
+            try:
+                legs = [routes[lane] for lane in trip_lanes]
+                for leg in legs:
+                    if isinstance(leg, Exception):
+                        raise leg
+                return self._build_trip_result(*trip_locations, *legs, trip['cycle_hours_used'])
+            except Exception as e:
+                return self._error_result(e, 'calculate_trips')
+
+        results = [build(trip, entry) for trip, entry in zip(trips, prepared)]
+
+        # 4. Name event places, one lookup per uncached grid cell across the whole batch
+        self._name_event_places(results)
+        return results
+
+
+    def calculate_multi_stop_trip(self, start_location, stops, cycle_hours_used):
+        """Plan one trip through many pickups and dropoffs, visited in a near-optimal order.
+
+        ``stops`` are dicts with ``location``, ``type`` (``'pickup'`` or
+        ``'dropoff'``) and ``after``, the indices of stops that must be
+        visited first. Every pair of stops is priced by one ORS matrix call
+        (or the matrix cache), ``order_stops`` picks the order, and a single
+        multi-waypoint directions call routes it.
+        """
+        try:
+            names = [start_location] + [stop['location'] for stop in stops]
+            unique = {}
+            for name in names:
+                unique.setdefault(normalize_location(name), name)
+            keys = list(unique)
+            with metrics.span('geocode'):
+                resolved = dict(zip(keys, run_concurrently(
+                    [(self._get_coordinates, unique[key]) for key in keys],
+                    concurrent=self.concurrent, max_workers=settings.BATCH_WORKERS,
+                )))
+            locations = [{**resolved[normalize_location(name)], 'name': name} for name in names]
+
+            durations = self._get_matrix(locations)
+            before = {i + 1: [j + 1 for j in stop['after']] for i, stop in enumerate(stops) if stop.get('after')}
+            with metrics.span('stop_order'):
+                order = order_stops(durations, before)
+            for a, b in zip(order, order[1:]):
+                if durations[a][b] == UNREACHABLE:
+                    raise ValueError(f"No route found between {names[a]} and {names[b]}.")
+
+            ordered = [locations[i] for i in order]
+            with metrics.span('route'):
+                legs = self._get_route_legs(ordered)
+
+            result = self._build_multi_stop_result(ordered, order, stops, legs, cycle_hours_used)
+            self._name_event_places([result])
+            return result
+        except Exception as e:
+            return self._error_result(e, 'calculate_multi_stop_trip')
+
+
+    # Async path (ASGI): the same pipeline on asyncio with the httpx-based ORS client.
+
+    async def _async_client(self):
+        return self.async_ors_client or await get_async_ors_client(self.api_key)
+
+    async def _areverse_geocode_snap(self, lat, lng):
+        try:
+            with metrics.span('reverse_geocode'):
+                res = await (await self._async_client()).geocode_reverse(lat, lng)
+            res.raise_for_status()
+            return self._parse_reverse_geocode(res.json(), lat, lng)
+        except Exception:
+            # Best-effort; ignore errors and fall back to original point
+            pass
+        return lat, lng, None
+
+    async def _alookup_place(self, cell):
+        lat, lng = self.place_cache.cell_center(cell)
+        with metrics.span('reverse_geocode'):
+            res = await (await self._async_client()).geocode_reverse(lat, lng)
+        res.raise_for_status()
+        return self._parse_place_name(res.json())
+
+    async def _aname_event_places(self, results):
+        """Async ``_name_event_places``: the cache misses are reverse geocoded with ``asyncio.gather``."""
+        if not settings.EVENT_PLACE_NAMES:
+            return
+        try:
+            cells = self._place_cells(results)
+            cached = [await self.place_cache.aget(self.place_cache.cell_key(cell)) for cell in cells]
+            names, misses = self._cached_places(cells, cached)
+            misses = misses[:settings.PLACE_LOOKUPS_PER_REQUEST]
+            with metrics.span('place_names'):
+                found = await asyncio.gather(*(self._alookup_place(cell) for cell in misses), return_exceptions=True)
+            for key, value in self._resolved_places(misses, found, names).items():
+                await self.place_cache.aset(key, value)
+            self._apply_place_names(cells, names)
+        except Exception as e:
+            logger.warning(f"Could not name event places: {str(e)}")
+
+    async def _aget_coordinates(self, location_name):
+        cached = await self.geocode_cache.aget(location_name)
+        if cached is NOT_FOUND:
+            raise LocationNotFound(f"Location '{location_name}' could not be found.")
+        if cached is not None:
+            return {**cached, 'name': location_name}
+
+        try:
+            location_data = await self._alookup_coordinates(location_name)
+        except LocationNotFound:
+            await self.geocode_cache.aset(location_name, NOT_FOUND)
+            raise
+        except MapServiceError as e:
+            return await self._astale_location(location_name, e)
+        await self.geocode_cache.aset(location_name, location_data)
+        return location_data
+
+    async def _astale_location(self, location_name, error):
+        return self._serve_stale_location(location_name, await self.geocode_cache.aget_stale(location_name), error)
+
+    async def _alookup_coordinates(self, location_name):
+        point = self._parse_coordinate_input(location_name)
+        if point:
+            return self._snapped_location(location_name, *(await self._areverse_geocode_snap(*point)))
+
+        try:
+            with metrics.span('geocode_search'):
+                res = await (await self._async_client()).geocode_search(location_name)
+            res.raise_for_status()
+            return self._parse_geocode_search(location_name, res.json())
+        except OrsUnavailable as e:
+            logger.error(f"ORS unavailable while geocoding {location_name}: {str(e)}")
+            raise MapServiceError(SERVICE_UNAVAILABLE_MESSAGE)
+        except httpx.TimeoutException:
+            logger.error(f"Timeout while geocoding location: {location_name}")
+            raise MapServiceError(f"Map service timeout while searching for '{location_name}'. Please try again.")
+        except httpx.HTTPError as e:
+            logger.error(f"Request error while geocoding {location_name}: {str(e)}")
+            raise MapServiceError(f"Map service error while searching for '{location_name}'. Please try again.")
+        except ValueError:
+            # Re-raise ValueError as-is
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error while geocoding {location_name}: {str(e)}")
+            raise ValueError(f"Unable to find location '{location_name}'. Please check the spelling and try again.")
+
+    async def _astale_route(self, lane, profile, error):
+        stale = await self.route_cache.aget(lane, profile, allow_stale=True)
+        if stale is None:
+            raise error
+        logger.warning("Serving cached route while ORS is failing")
+        metrics.inc('ors_stale_served_total', kind='route')
+        return stale
+
+    async def _aget_route(self, start_coords, end_coords):
+        lane = self.route_cache.lane_key(start_coords, end_coords)
+        profile = await self.route_cache.aget_profile(lane) or 'driving-hgv'
+        cached = await self.route_cache.aget(lane, profile)
+        if cached is not None:
+            return cached
+
+        try:
+            client = await self._async_client()
+            with metrics.span('route_hgv' if profile == 'driving-hgv' else 'route_car'):
+                res = await client.directions(profile, start_coords, end_coords)
+            if not res.is_success and profile == 'driving-hgv' and res.status_code not in RETRY_STATUSES:
+                # Fallback to car profile for wider availability
+                metrics.inc('ors_route_fallbacks_total')
+                with metrics.span('route_car'):
+                    fallback = await client.directions('driving-car', start_coords, end_coords)
+                if not fallback.is_success:
+                    logger.error(
+                        f"Request error while calculating route: Routing failed "
+                        f"(hgv={res.status_code}, car={fallback.status_code}). {(res.text or fallback.text)[:200]}"
+                    )
+                    raise MapServiceError("Map service error while calculating route. Please try again.")
+                res = fallback
+                profile = 'driving-car'
+            elif not res.is_success:
+                logger.error(f"Request error while calculating route: Routing failed ({profile}={res.status_code}). {res.text[:200]}")
+                raise MapServiceError("Map service error while calculating route. Please try again.")
+
+            route = self._parse_route(res.json())
+            await self.route_cache.aset(lane, profile, route)
+            await self.route_cache.aset_profile(lane, profile)
+            return route
+        except MapServiceError as e:
+            return await self._astale_route(lane, profile, e)
+        except OrsUnavailable as e:
+            logger.error(f"ORS unavailable while calculating route: {str(e)}")
+            return await self._astale_route(lane, profile, MapServiceError(SERVICE_UNAVAILABLE_MESSAGE))
+        except httpx.TimeoutException:
+            logger.error(f"Timeout while calculating route from {start_coords} to {end_coords}")
+            return await self._astale_route(lane, profile, MapServiceError("Route calculation timed out. Please try again."))
+        except httpx.HTTPError as e:
+            logger.error(f"Request error while calculating route: {str(e)}")
+            return await self._astale_route(lane, profile, MapServiceError("Map service error while calculating route. Please try again."))
+        except ValueError:
+            # Re-raise ValueError as-is
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error while calculating route: {str(e)}")
+            raise ValueError("Unable to calculate route between the specified locations. Please verify the addresses and try again.")
+
+    async def _aroute_lane(self, origin, destination):
+        """Async ``_route_lane``: the parts of an over-long leg are snapped and routed concurrently."""
+        meters = self._haversine_meters(origin['lat'], origin['lng'], destination['lat'], destination['lng'])
+        if meters <= SPLIT_LEG_METERS:
+            return await self._aget_route(origin['coordinates'], destination['coordinates'])
+
+        lane = self.route_cache.lane_key(origin['coordinates'], destination['coordinates'])
+        profile = await self.route_cache.aget_profile(lane) or 'driving-hgv'
+        cached = await self.route_cache.aget(lane, profile)
+        if cached is not None:
+            return cached
+        try:
+            points = self._great_circle_points(
+                origin['lat'], origin['lng'], destination['lat'], destination['lng'], math.ceil(meters / SPLIT_LEG_METERS),
+            )
+            snapped = await asyncio.gather(*(self._areverse_geocode_snap(lat, lng) for lat, lng in points))
+            waypoints = [origin['coordinates']] + [f"{lng},{lat}" for lat, lng, _ in snapped] + [destination['coordinates']]
+            logger.info(f"Routing a {int(meters / 1000)} km leg in {len(waypoints) - 1} parts")
+            metrics.inc('route_leg_splits_total')
+            parts = await gather_in_order(*(self._aget_route(a, b) for a, b in zip(waypoints, waypoints[1:])))
+        except MapServiceError as e:
+            return await self._astale_route(lane, profile, e)
+        leg = self._stitch_legs(parts)
+        await sync_to_async(self._cache_split_leg, thread_sensitive=False)(
+            lane, [self.route_cache.lane_key(a, b) for a, b in zip(waypoints, waypoints[1:])], leg,
+        )
+        return leg
+
+    async def acalculate_trip(self, start_location, pickup_location, dropoff_location, cycle_hours_used):
+        """Async ``calculate_trip``, coalesced the same way."""
+        args = (start_location, pickup_location, dropoff_location, cycle_hours_used)
+        if not settings.TRIP_COALESCE_ENABLED:
+            return await self._acalculate_trip(*args)
+        return await get_trip_coalescer().ado(self._trip_key(*args), lambda: self._acalculate_trip(*args))
+
+    async def _acalculate_trip(self, start_location, pickup_location, dropoff_location, cycle_hours_used):
+        """Geocodes, then both legs, are awaited concurrently."""
+        try:
             logger.info("Mapping journey locations...")
-            start_location_data = self._get_coordinates(start_location)
-            pickup_location_data = self._get_coordinates(pickup_location)
-            dropoff_location_data = self._get_coordinates(dropoff_location)
-            
-            # Calculate route segments with pre-check to avoid overly long routes that ORS rejects
-            # ORS free tier hard-limit ~6,000,000 meters. We'll estimate distances via haversine first.
-            approx_s_p_m = self._haversine_meters(start_location_data['lat'], start_location_data['lng'], pickup_location_data['lat'], pickup_location_data['lng'])
-            approx_p_d_m = self._haversine_meters(pickup_location_data['lat'], pickup_location_data['lng'], dropoff_location_data['lat'], dropoff_location_data['lng'])
-            max_meters = 5_800_000  # safety margin below ~6,000,000m
-            if approx_s_p_m > max_meters:
-                raise ValueError(
-                    f"Start to Pickup leg is too long for this service plan (approx {int(approx_s_p_m/1000)} km > {int(max_meters/1000)} km). "
-                    "Please pick closer locations or split the trip."
+            with metrics.span('geocode'):
+                start_location_data, pickup_location_data, dropoff_location_data = await gather_in_order(
+                    self._aget_coordinates(start_location),
+                    self._aget_coordinates(pickup_location),
+                    self._aget_coordinates(dropoff_location),
                 )
-            if approx_p_d_m > max_meters:
-                raise ValueError(
-                    f"Pickup to Dropoff leg is too long for this service plan (approx {int(approx_p_d_m/1000)} km > {int(max_meters/1000)} km). "
-                    "Please pick closer locations or split the trip."
+            with metrics.span('route'):
+                start_to_pickup, pickup_to_dropoff = await gather_in_order(
+                    self._aroute_lane(start_location_data, pickup_location_data),
+                    self._aroute_lane(pickup_location_data, dropoff_location_data),
                 )
-
-            start_to_pickup = self._get_route(start_location_data['coordinates'], pickup_location_data['coordinates'])
-            pickup_to_dropoff = self._get_route(pickup_location_data['coordinates'], dropoff_location_data['coordinates'])
-            
-            # Total driving time needed (master "Time to Destination" value)
-            total_driving_time_needed = start_to_pickup['duration_seconds'] + pickup_to_dropoff['duration_seconds']
-            total_distance_miles = (start_to_pickup['distance_meters'] + pickup_to_dropoff['distance_meters']) / 1609.34
-            
-            # Schedule Fixed Tasks
-            fueling_stops_needed = self._calculate_fueling_stops(total_distance_miles)
-            
-            # PART 1: INITIALIZE THE FOUR TIME BANKS
-            daily_driving_bank = MAX_DRIVING_PER_DAY  # 11 hours
-            daily_on_duty_window = MAX_ON_DUTY_WINDOW  # 14 hours (starts on first On-Duty task)
-            break_cycle_bank = DRIVING_LIMIT_BEFORE_BREAK  # 8 hours
-            weekly_cycle_bank = WEEKLY_CYCLE_LIMIT - (cycle_hours_used * 3600)  # 70 - user input
-            
-            # Initialize logs and time tracking
-            logs = [{'day': 1, 'events': []}]
-            time_cursor = datetime.datetime.utcnow().replace(hour=6, minute=0, second=0, microsecond=0)  # Start at 6 AM
-            on_duty_window_started = False
-            
-            # Track remaining driving time to destination
-            time_to_destination = total_driving_time_needed
-            
-            # Create task queue with exact order
-            task_queue = [
-                {'type': 'On Duty', 'duration': PRE_TRIP_INSPECTION_TIME, 'description': 'Pre-Trip Inspection', 'location': start_location_data['formatted_name']},
-            ]
-            
-            # Add fueling stops to queue (will be inserted based on distance)
-            fueling_tasks = []
-            for i in range(fueling_stops_needed):
-                fueling_tasks.append({
-                    'type': 'On Duty', 
-                    'duration': FUELING_TIME, 
-                    'description': f'Fueling Stop {i+1}', 
-                    'location': f'En Route - Fuel Stop {i+1}'
-                })
-            
-            # Add pickup and dropoff tasks
-            pickup_task = {'type': 'On Duty', 'duration': PICKUP_DROPOFF_TIME, 'description': 'Pickup Stop', 'location': pickup_location_data['formatted_name']}
-            dropoff_task = {'type': 'On Duty', 'duration': PICKUP_DROPOFF_TIME, 'description': 'Dropoff Stop', 'location': dropoff_location_data['formatted_name']}
-            
-            # Track current location for geographical context
-            current_location = start_location_data['formatted_name']
-            
-            # PART 3: THE ENGINE - THE DECISION-MAKING HIERARCHY LOOP
-            logger.info("Starting HOS calculation loop...")
-            
-            # Execute pre-trip inspection first
-            time_cursor = self._add_event(logs, 'On Duty', PRE_TRIP_INSPECTION_TIME, 'Pre-Trip Inspection', time_cursor, current_location, {
-                'daily_driving': daily_driving_bank,
-                'on_duty_window': daily_on_duty_window - PRE_TRIP_INSPECTION_TIME,
-                'break_cycle': break_cycle_bank,
-                'weekly_cycle': weekly_cycle_bank - PRE_TRIP_INSPECTION_TIME
-            })
-            on_duty_window_started = True
-            daily_on_duty_window -= PRE_TRIP_INSPECTION_TIME
-            weekly_cycle_bank -= PRE_TRIP_INSPECTION_TIME
-            
-            # Main simulation loop
-            while time_to_destination > 0:
-                
-                # CHECK 1: IS A WEEKLY RESET REQUIRED?
-                if weekly_cycle_bank <= 0:
-                    logger.info("Weekly reset required - logging 34-hour restart")
-                    time_cursor = self._add_event(logs, 'Off Duty', REQUIRED_34_HOUR_RESTART, '34-hour Restart', time_cursor, current_location, {
-                        'daily_driving': MAX_DRIVING_PER_DAY,
-                        'on_duty_window': MAX_ON_DUTY_WINDOW,
-                        'break_cycle': DRIVING_LIMIT_BEFORE_BREAK,
-                        'weekly_cycle': WEEKLY_CYCLE_LIMIT
-                    })
-                    # Reset all banks after 34-hour restart
-                    weekly_cycle_bank = WEEKLY_CYCLE_LIMIT
-                    daily_driving_bank = MAX_DRIVING_PER_DAY
-                    daily_on_duty_window = MAX_ON_DUTY_WINDOW
-                    break_cycle_bank = DRIVING_LIMIT_BEFORE_BREAK
-                    on_duty_window_started = False
-                    continue
-                
-                # CHECK 2: IS THE WORK DAY OVER?
-                if daily_driving_bank <= 0 or (on_duty_window_started and daily_on_duty_window <= 0):
-                    logger.info("Daily reset required - logging 10-hour break")
-                    time_cursor = self._add_event(logs, 'Sleeper Berth', REQUIRED_OFF_DUTY_RESET, '10-hour Reset', time_cursor, current_location, {
-                        'daily_driving': MAX_DRIVING_PER_DAY,
-                        'on_duty_window': MAX_ON_DUTY_WINDOW,
-                        'break_cycle': DRIVING_LIMIT_BEFORE_BREAK,
-                        'weekly_cycle': weekly_cycle_bank
-                    })
-                    # Reset daily banks after 10-hour break
-                    daily_driving_bank = MAX_DRIVING_PER_DAY
-                    daily_on_duty_window = MAX_ON_DUTY_WINDOW
-                    break_cycle_bank = DRIVING_LIMIT_BEFORE_BREAK
-                    on_duty_window_started = False
-                    continue
-                
-                # CHECK 3: IS A DRIVING BREAK REQUIRED?
-                if break_cycle_bank <= 0 and time_to_destination > 0:
-                    logger.info("30-minute break required")
-                    time_cursor = self._add_event(logs, 'Off Duty', REQUIRED_30_MIN_BREAK, '30-minute Break', time_cursor, current_location, {
-                        'daily_driving': daily_driving_bank,
-                        'on_duty_window': daily_on_duty_window - REQUIRED_30_MIN_BREAK if on_duty_window_started else daily_on_duty_window,
-                        'break_cycle': DRIVING_LIMIT_BEFORE_BREAK,
-                        'weekly_cycle': weekly_cycle_bank
-                    })
-                    # Reset break cycle bank after 30-minute break
-                    break_cycle_bank = DRIVING_LIMIT_BEFORE_BREAK
-                    # 14-hour window continues to count down during break (it never pauses)
-                    if on_duty_window_started:
-                        daily_on_duty_window -= REQUIRED_30_MIN_BREAK
-                    continue
-                
-                # CHECK 4: IS A PLANNED TASK NEXT?
-                task_to_execute = None
-                
-                # Check if we need to do pickup (when we've driven to pickup location)
-                if time_to_destination <= pickup_to_dropoff['duration_seconds'] and pickup_task:
-                    task_to_execute = pickup_task
-                    pickup_task = None  # Mark as completed
-                    current_location = pickup_location_data['formatted_name']
-                
-                # Check if we need to do dropoff (when we've reached destination)
-                elif time_to_destination <= 0 and dropoff_task:
-                    task_to_execute = dropoff_task
-                    dropoff_task = None  # Mark as completed
-                    current_location = dropoff_location_data['formatted_name']
-                
-                # Check for fueling stops (simplified - insert at strategic points)
-                elif fueling_tasks and time_to_destination < (total_driving_time_needed * 0.5):
-                    task_to_execute = fueling_tasks.pop(0)
-                    current_location = task_to_execute['location']
-                
-                if task_to_execute:
-                    logger.info(f"Executing planned task: {task_to_execute['description']}")
-                    time_cursor = self._add_event(logs, task_to_execute['type'], task_to_execute['duration'], 
-                                                task_to_execute['description'], time_cursor, task_to_execute['location'], {
-                        'daily_driving': daily_driving_bank,
-                        'on_duty_window': daily_on_duty_window - task_to_execute['duration'],
-                        'break_cycle': break_cycle_bank,
-                        'weekly_cycle': weekly_cycle_bank - task_to_execute['duration']
-                    })
-                    
-                    # Start on-duty window if not already started
-                    if not on_duty_window_started:
-                        on_duty_window_started = True
-                    
-                    # Update banks for On-Duty time
-                    daily_on_duty_window -= task_to_execute['duration']
-                    weekly_cycle_bank -= task_to_execute['duration']
-                    continue
-                
-                # DEFAULT ACTION: DRIVE
-                if time_to_destination > 0:
-                    # PART 4: THE CORE MATHEMATICS - CALCULATING DRIVING TIME
-                    # The "Minimum Value" Rule
-                    driving_duration = min(
-                        time_to_destination,  # Time remaining to reach destination
-                        daily_driving_bank,   # Time remaining in Daily Driving Bank
-                        daily_on_duty_window if on_duty_window_started else float('inf'),  # Time remaining in On-Duty Window
-                        break_cycle_bank      # Time remaining in Break-Cycle Bank
-                    )
-                    
-                    logger.info(f"Driving for {driving_duration/3600:.2f} hours (minimum of: destination={time_to_destination/3600:.2f}h, daily_driving={daily_driving_bank/3600:.2f}h, on_duty_window={daily_on_duty_window/3600:.2f}h, break_cycle={break_cycle_bank/3600:.2f}h)")
-                    
-                    # Determine current driving segment description
-                    if time_to_destination > pickup_to_dropoff['duration_seconds']:
-                        drive_description = f"Drive from {start_location_data['formatted_name']} toward {pickup_location_data['formatted_name']}"
-                    else:
-                        drive_description = f"Drive from {pickup_location_data['formatted_name']} toward {dropoff_location_data['formatted_name']}"
-                    
-                    # PART 5: LOGGING AND UPDATING THE BANKS
-                    time_cursor = self._add_event(logs, 'Driving', driving_duration, drive_description, time_cursor, current_location, {
-                        'daily_driving': daily_driving_bank - driving_duration,
-                        'on_duty_window': daily_on_duty_window - driving_duration,
-                        'break_cycle': break_cycle_bank - driving_duration,
-                        'weekly_cycle': weekly_cycle_bank - driving_duration
-                    })
-                    
-                    # Start on-duty window if this is the first driving event
-                    if not on_duty_window_started:
-                        on_duty_window_started = True
-                    
-                    # Update all relevant time banks
-                    daily_driving_bank -= driving_duration      # Driving reduces Daily Driving Bank
-                    daily_on_duty_window -= driving_duration    # Driving reduces On-Duty Window
-                    break_cycle_bank -= driving_duration        # Driving reduces Break-Cycle Bank
-                    weekly_cycle_bank -= driving_duration       # Driving reduces Weekly Cycle Bank
-                    time_to_destination -= driving_duration     # Reduce remaining driving time
-                    
-                    # Update current location approximation
-                    if time_to_destination <= pickup_to_dropoff['duration_seconds']:
-                        current_location = f"En route to {dropoff_location_data['formatted_name']}"
-                    else:
-                        current_location = f"En route to {pickup_location_data['formatted_name']}"
-            
-            # Finalize the last day's log
-            self._finalize_day_log(logs[-1])
-            
-            logger.info(f"Trip calculation completed. Generated {len(logs)} day(s) of logs.")
-            
-            return {
-                'route_geometry': start_to_pickup['geometry'] + pickup_to_dropoff['geometry'],
-                'logs': logs,
-                'total_distance_miles': total_distance_miles,
-                'total_driving_time_hours': total_driving_time_needed / 3600,
-                'start_location': start_location_data,
-                'pickup_location': pickup_location_data,
-                'dropoff_location': dropoff_location_data,
-                'trip_summary': {
-                    'total_days': len(logs),
-                    'total_driving_hours': total_driving_time_needed / 3600,
-                    'total_distance_miles': total_distance_miles,
-                    'fueling_stops': fueling_stops_needed
-                }
-            }
-            
-        except ValueError as e:
-            logger.error(f"Validation error in calculate_trip: {str(e)}")
-            return {'error': str(e)}
+            # HOS scheduling and POI snapping are CPU work; keep them off the event loop
+            result = await sync_to_async(self._build_trip_result, thread_sensitive=False)(
+                start_location_data, pickup_location_data, dropoff_location_data,
+                start_to_pickup, pickup_to_dropoff, cycle_hours_used,
+            )
+            await self._aname_event_places([result])
+            return result
         except Exception as e:
-            logger.error(f"Unexpected error in calculate_trip: {str(e)}", exc_info=True)
-            return {'error': 'An unexpected error occurred while calculating the trip. Please try again.'}
\ No newline at end of file
+            return self._error_result(e, 'acalculate_trip')
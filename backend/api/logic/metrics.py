@@ -0,0 +1,214 @@
+"""In-process counters, histograms and per-request timing spans.
+
+``span(name)`` times a phase of a trip request. The duration feeds the
+``request_phase_seconds`` histogram and, when a request is being traced
+(see ``ServerTimingMiddleware``), that request's ``Server-Timing`` header.
+``registry.render()`` produces the Prometheus text exposition served at
+``/metrics``. Values are per process; scrape every worker.
+"""
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'request_phase_seconds': ('histogram', 'Time spent in each phase of handling a trip request.'),
+    'http_requests_total': ('counter', 'API requests by view and response status.'),
+    'http_request_seconds': ('histogram', 'API request latency by view.'),
+    'ors_requests_total': ('counter', 'OpenRouteService HTTP calls by endpoint and outcome.'),
+    'ors_request_seconds': ('histogram', 'OpenRouteService call latency by endpoint, including retries.'),
+    'ors_route_fallbacks_total': ('counter', 'Directions requests retried with the car profile after the HGV profile failed.'),
+    'ors_rate_limited_total': ('counter', 'ORS calls refused locally because the plan quota was used up.'),
+    'ors_circuit_rejections_total': ('counter', 'ORS calls refused locally because the endpoint circuit was open.'),
+    'ors_circuit_transitions_total': ('counter', 'ORS circuit breaker state changes by endpoint and new state.'),
+    'route_leg_splits_total': ('counter', 'Legs too long for one ORS route request, routed in parts.'),
+    'ors_stale_served_total': ('counter', 'Expired cached geocodes/routes served while ORS was unavailable.'),
+    'geocode_cache_total': ('counter', 'Geocode cache lookups by result.'),
+    'route_cache_total': ('counter', 'Route cache lookups by result.'),
+    'place_cache_total': ('counter', 'Place name cache lookups by result.'),
+    'matrix_cache_total': ('counter', 'Matrix cache lookups (whole matrices) by result.'),
+    'trip_calculation_errors_total': ('counter', 'Failed trip calculations by kind.'),
+    'trip_coalesced_total': ('counter', 'Trip calculations answered by an identical in-flight calculation.'),
+    'trip_jobs_submitted_total': ('counter', 'Background jobs queued, by kind.'),
+    'trip_jobs_total': ('counter', 'Finished background jobs by kind and final status.'),
+    'trip_job_seconds': ('histogram', 'Time from a worker claiming a background job to its outcome being stored.'),
+    'history_rows_purged_total': ('counter', 'Trip history rows deleted by purges and retention.'),
+    'trip_plans_purged_total': ('counter', 'Expired trip plans deleted by purge_trip_history.'),
+    'trip_jobs_purged_total': ('counter', 'Finished background jobs deleted by purge_trip_history.'),
+    'trip_job_callbacks_total': ('counter', 'Trip job completion callbacks by outcome.'),
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Thread-safe store of labelled counters and histograms."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def register_gauge(self, name, fn, help_text=''):
+        """Sample ``fn()`` at render time; it returns a number or ``[(labels, value), ...]``."""
+        self._gauges[name] = (fn, help_text)
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def _header(self, lines, name, kind=None, help_text=None):
+        known_kind, known_help = METRIC_HELP.get(name, (kind, help_text))
+        if help_text or known_help:
+            lines.append(f"# HELP {name} {help_text or known_help}")
+        lines.append(f"# TYPE {name} {kind or known_kind or 'untyped'}")
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, ([*h[0]], h[1], h[2])) for key, h in self._histograms.items())
+
+        lines = []
+        current = None
+        for (name, label_key), value in counters:
+            if name != current:
+                self._header(lines, name, 'counter')
+                current = name
+            lines.append(f"{name}{_format_labels(label_key)} {_format_value(value)}")
+
+        current = None
+        for (name, label_key), (bucket_counts, total, count) in histograms:
+            if name != current:
+                self._header(lines, name, 'histogram')
+                current = name
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f"{name}_bucket{_format_labels(label_key, [('le', _format_value(float(bound)))])} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(label_key, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(label_key)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(label_key)} {count}")
+
+        for name, (fn, help_text) in sorted(self._gauges.items()):
+            try:
+                sample = fn()
+            except Exception:
+                continue
+            self._header(lines, name, 'gauge', help_text)
+            if isinstance(sample, (int, float)):
+                sample = [({}, sample)]
+            for labels, value in sample:
+                lines.append(f"{name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+# Timings collected for the request being handled; None outside a traced request
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def inc(name, amount=1, **labels):
+    registry.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+
+def record_phase(name, seconds):
+    """Record a phase duration measured elsewhere, exactly as ``span`` would."""
+    registry.observe('request_phase_seconds', seconds, phase=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as phase ``name``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
+
+
+def begin_request():
+    """Start collecting timings for the current context; returns ``(timings, token)``."""
+    timings = []
+    return timings, _request_timings.set(timings)
+
+
+def end_request(token):
+    _request_timings.reset(token)
+
+
+def server_timing_header(timings, total=None):
+    """Render collected ``(name, seconds)`` pairs as a ``Server-Timing`` value.
+
+    Repeated phases (e.g. three geocodes) are summed and their count given
+    in ``desc``; concurrent phases can therefore add up to more than
+    ``total``.
+    """
+    merged = {}
+    for name, seconds in timings:
+        entry = merged.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    parts = []
+    for name, (seconds, count) in merged.items():
+        part = f"{name};dur={seconds * 1000:.1f}"
+        if count > 1:
+            part += f';desc="x{count}"'
+        parts.append(part)
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(parts)
@@ -0,0 +1,268 @@
+import time
+import asyncio
+import threading
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+from .resilience import get_ors_guard
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def _record_call(endpoint, outcome, started):
+    metrics.inc('ors_requests_total', endpoint=endpoint, status=outcome)
+    metrics.observe('ors_request_seconds', time.perf_counter() - started, endpoint=endpoint)
+
+
+def _retry_delay(backoff_factor, attempt, res=None):
+    """Seconds to wait before retrying, or None if ``Retry-After`` asks for longer than a caller may wait.
+
+    Waits are capped at ``ORS_RATE_LIMIT_MAX_WAIT``, like waits for the
+    shared quota, so a throttled call fails fast instead of holding a worker.
+    """
+    max_wait = settings.ORS_RATE_LIMIT_MAX_WAIT
+    retry_after = res.headers.get('Retry-After') if res is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after) if float(retry_after) <= max_wait else None
+    return min(backoff_factor * (2 ** attempt), max_wait)
+
+
+class OrsClient:
+    """Keep-alive HTTP client for all OpenRouteService traffic.
+
+    One instance is shared per process (see ``get_ors_client``) so TCP/TLS
+    connections are pooled across requests. 429/5xx responses and connection
+    errors are retried with exponential backoff, each attempt going through
+    the rate limiter and circuit breaker; the final response is returned
+    rather than raised so callers can still inspect ``res.ok`` and fall back.
+    """
+
+    def __init__(self, api_key, base_url=None, pool_size=None, retries=None, backoff_factor=None, timeouts=None):
+        self.api_key = api_key
+        self.base_url = (base_url or settings.ORS_BASE_URL).rstrip('/')
+        self.timeouts = {
+            'geocode': settings.ORS_TIMEOUT_GEOCODE,
+            'reverse': settings.ORS_TIMEOUT_REVERSE,
+            'directions': settings.ORS_TIMEOUT_DIRECTIONS,
+            'matrix': settings.ORS_TIMEOUT_MATRIX,
+            **(timeouts or {}),
+        }
+        self.retries = settings.ORS_RETRIES if retries is None else retries
+        self.backoff_factor = settings.ORS_RETRY_BACKOFF if backoff_factor is None else backoff_factor
+        pool_size = pool_size or settings.ORS_POOL_SIZE
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/json, application/geo+json',
+            'Accept-Encoding': 'gzip, deflate',
+        })
+
+    def _get(self, path, endpoint, **kwargs):
+        return self._send('GET', path, endpoint, **kwargs)
+
+    def _send(self, method, path, endpoint, **kwargs):
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                res = self._send_once(method, path, endpoint, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if last_attempt:
+                    raise
+                time.sleep(_retry_delay(self.backoff_factor, attempt))
+                continue
+            if res.status_code not in RETRY_STATUSES or last_attempt:
+                return res
+            delay = _retry_delay(self.backoff_factor, attempt, res)
+            if delay is None:
+                return res
+            time.sleep(delay)
+
+    def _send_once(self, method, path, endpoint, **kwargs):
+        guard = get_ors_guard()
+        guard.before(endpoint)
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            res = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeouts[endpoint], **kwargs)
+            outcome = res.status_code
+            return res
+        finally:
+            guard.after(endpoint, outcome not in RETRY_STATUSES and outcome != 'error')
+            _record_call(endpoint, outcome, started)
+
+    def geocode_search(self, text):
+        return self._get('/geocode/search', 'geocode', params={'api_key': self.api_key, 'text': text})
+
+    def geocode_reverse(self, lat, lng):
+        return self._get('/geocode/reverse', 'reverse', params={
+            'api_key': self.api_key,
+            'point.lon': lng,
+            'point.lat': lat,
+            'size': 1,
+        })
+
+    def directions(self, profile, start_coords, end_coords):
+        return self._get(f'/v2/directions/{profile}', 'directions', headers={'Authorization': self.api_key}, params={
+            'start': start_coords,
+            'end': end_coords,
+        })
+
+    def directions_route(self, profile, coordinates):
+        """One route through every ``[lng, lat]`` waypoint in order; ``segments`` hold the per-leg figures."""
+        return self._send('POST', f'/v2/directions/{profile}/geojson', 'directions',
+                          headers={'Authorization': self.api_key}, json={'coordinates': coordinates})
+
+    def matrix(self, profile, locations):
+        """Durations and distances between every pair of ``[lng, lat]`` locations, in one request."""
+        return self._send('POST', f'/v2/matrix/{profile}', 'matrix', headers={'Authorization': self.api_key}, json={
+            'locations': locations,
+            'metrics': ['duration', 'distance'],
+        })
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncOrsClient:
+    """asyncio counterpart of ``OrsClient`` built on ``httpx.AsyncClient``.
+
+    Same endpoints, timeouts and retry policy; responses are
+    ``httpx.Response`` objects. httpx connection pools are bound to the
+    event loop that created them, so ``get_async_ors_client`` keeps one
+    client per loop and closes it when the loop shuts down.
+    """
+
+    def __init__(self, api_key, base_url=None, pool_size=None, retries=None, backoff_factor=None, timeouts=None):
+        self.api_key = api_key
+        self.base_url = (base_url or settings.ORS_BASE_URL).rstrip('/')
+        self.timeouts = {
+            'geocode': settings.ORS_TIMEOUT_GEOCODE,
+            'reverse': settings.ORS_TIMEOUT_REVERSE,
+            'directions': settings.ORS_TIMEOUT_DIRECTIONS,
+            **(timeouts or {}),
+        }
+        self.retries = settings.ORS_RETRIES if retries is None else retries
+        self.backoff_factor = settings.ORS_RETRY_BACKOFF if backoff_factor is None else backoff_factor
+        pool_size = pool_size or settings.ORS_POOL_SIZE
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            headers={
+                'Accept': 'application/json, application/geo+json',
+                'Accept-Encoding': 'gzip, deflate',
+            },
+        )
+
+    async def _get(self, path, endpoint, **kwargs):
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                res = await self._get_once(path, endpoint, **kwargs)
+            except httpx.TransportError:
+                if last_attempt:
+                    raise
+                await asyncio.sleep(_retry_delay(self.backoff_factor, attempt))
+                continue
+            if res.status_code not in RETRY_STATUSES or last_attempt:
+                return res
+            delay = _retry_delay(self.backoff_factor, attempt, res)
+            if delay is None:
+                return res
+            await asyncio.sleep(delay)
+
+    async def _get_once(self, path, endpoint, **kwargs):
+        guard = get_ors_guard()
+        await guard.abefore(endpoint)
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            res = await self.client.get(f"{self.base_url}{path}", timeout=self.timeouts[endpoint], **kwargs)
+            outcome = res.status_code
+            return res
+        finally:
+            await guard.aafter(endpoint, outcome not in RETRY_STATUSES and outcome != 'error')
+            _record_call(endpoint, outcome, started)
+
+    async def geocode_search(self, text):
+        return await self._get('/geocode/search', 'geocode', params={'api_key': self.api_key, 'text': text})
+
+    async def geocode_reverse(self, lat, lng):
+        return await self._get('/geocode/reverse', 'reverse', params={
+            'api_key': self.api_key,
+            'point.lon': lng,
+            'point.lat': lat,
+            'size': 1,
+        })
+
+    async def directions(self, profile, start_coords, end_coords):
+        return await self._get(f'/v2/directions/{profile}', 'directions', headers={'Authorization': self.api_key}, params={
+            'start': start_coords,
+            'end': end_coords,
+        })
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()
+_override = None
+_async_override = None
+_clients_lock = threading.Lock()
+
+
+def get_ors_client(api_key):
+    """Return the shared client for ``api_key`` (or the test override, if set)."""
+    if _override is not None:
+        return _override
+    client = _clients.get(api_key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(api_key)
+            if client is None:
+                client = _clients[api_key] = OrsClient(api_key)
+    return client
+
+
+def set_ors_client(client):
+    """Swap in a client for every HosCalculator (e.g. a fake in tests); pass None to reset."""
+    global _override
+    _override = client
+
+
+async def _client_lifetime(client):
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+async def get_async_ors_client(api_key):
+    """Return the async client for ``api_key`` on the running event loop (or the test override).
+
+    Each client is tied to a started async generator whose ``finally``
+    closes it. The loop's ``shutdown_asyncgens()``, which ``asyncio.run``,
+    asgiref and ASGI servers call before closing a loop, runs that.
+    """
+    if _async_override is not None:
+        return _async_override
+    loop_clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    entry = loop_clients.get(api_key)
+    if entry is None:
+        client = AsyncOrsClient(api_key)
+        lifetime = _client_lifetime(client)
+        entry = loop_clients[api_key] = (client, lifetime)
+        await lifetime.asend(None)
+    return entry[0]
+
+
+def set_async_ors_client(client):
+    """Async counterpart of ``set_ors_client``."""
+    global _async_override
+    _async_override = client
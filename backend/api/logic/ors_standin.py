@@ -0,0 +1,397 @@
+"""Local stand-in for the OpenRouteService endpoints HosCalculator uses.
+
+Serves ``/geocode/search``, ``/geocode/reverse``,
+``/v2/directions/{profile}`` (GET, and POST ``.../geojson`` with waypoints)
+and ``/v2/matrix/{profile}`` so the backend can be benchmarked and
+load-tested without network access or an API key (point ``ORS_BASE_URL``
+at it). Responses come from recorded fixtures when available and are
+otherwise synthesized deterministically from the request, with optional
+latency and error injection. Run it with ``manage.py ors_standin``.
+"""
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_METERS = 6371000.0
+
+# Well-known places so synthetic trips look plausible; anything else is hashed into the lower 48
+KNOWN_PLACES = {
+    'atlanta': (-84.388, 33.749),
+    'boston': (-71.059, 42.360),
+    'chicago': (-87.630, 41.878),
+    'dallas': (-96.797, 32.777),
+    'denver': (-104.990, 39.739),
+    'houston': (-95.370, 29.760),
+    'kansas city': (-94.579, 39.100),
+    'los angeles': (-118.244, 34.052),
+    'memphis': (-90.049, 35.150),
+    'miami': (-80.192, 25.762),
+    'nashville': (-86.781, 36.163),
+    'new york': (-74.006, 40.713),
+    'phoenix': (-112.074, 33.448),
+    'salt lake city': (-111.891, 40.761),
+    'san francisco': (-122.419, 37.775),
+    'seattle': (-122.332, 47.606),
+}
+US_BOUNDS = (-124.0, 25.5, -67.5, 48.5)
+
+# Queries starting with this prefix geocode to nothing, to exercise not-found handling
+NOT_FOUND_PREFIX = 'nowhere'
+
+# Road distance / great-circle distance, and average speeds per profile (m/s)
+DETOUR_FACTOR = 1.2
+PROFILE_SPEEDS = {'driving-hgv': 24.0, 'driving-car': 28.0}
+POINT_SPACING_METERS = 1000.0
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _haversine_meters(lng1, lat1, lng2, lat2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+
+def _parse_point(value):
+    lng, lat = value.split(',')
+    return float(lng), float(lat)
+
+
+def synthetic_search(text):
+    key = ' '.join(text.lower().replace(',', ' ').split())
+    if not key or key.startswith(NOT_FOUND_PREFIX):
+        return {'type': 'FeatureCollection', 'features': []}
+    city = next((name for name in KNOWN_PLACES if key.startswith(name)), None)
+    if city:
+        lng, lat = KNOWN_PLACES[city]
+    else:
+        h = int(_digest(key)[:12], 16)
+        min_lng, min_lat, max_lng, max_lat = US_BOUNDS
+        lng = round(min_lng + (h % 100000) / 100000 * (max_lng - min_lng), 5)
+        lat = round(min_lat + (h // 100000 % 100000) / 100000 * (max_lat - min_lat), 5)
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+            'properties': {'name': text.strip().title(), 'label': text.strip().title()},
+        }],
+    }
+
+
+def synthetic_reverse(lat, lng):
+    # Snap to a ~100 m grid, the way a real reverse geocode moves the point onto an address
+    snapped_lng, snapped_lat = round(lng, 3), round(lat, 3)
+    label = f"Near {snapped_lat:.3f}, {snapped_lng:.3f}"
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [snapped_lng, snapped_lat]},
+            'properties': {'name': label, 'label': label},
+        }],
+    }
+
+
+def synthetic_directions(profile, start, end):
+    start_lng, start_lat = _parse_point(start)
+    end_lng, end_lat = _parse_point(end)
+    straight = _haversine_meters(start_lng, start_lat, end_lng, end_lat)
+    distance = round(straight * DETOUR_FACTOR, 1)
+    duration = round(distance / PROFILE_SPEEDS.get(profile, PROFILE_SPEEDS['driving-car']), 1)
+    # About one vertex per road kilometre, which is the density ORS returns for highway routes
+    steps = max(1, int(distance // POINT_SPACING_METERS))
+    geometry = [
+        [round(start_lng + (end_lng - start_lng) * i / steps, 6), round(start_lat + (end_lat - start_lat) * i / steps, 6)]
+        for i in range(steps + 1)
+    ]
+    return {
+        'type': 'FeatureCollection',
+        'bbox': [min(start_lng, end_lng), min(start_lat, end_lat), max(start_lng, end_lng), max(start_lat, end_lat)],
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': geometry},
+            'properties': {
+                'summary': {'distance': distance, 'duration': duration},
+                'segments': [{'distance': distance, 'duration': duration, 'steps': []}],
+            },
+        }],
+    }
+
+
+def synthetic_directions_route(profile, coordinates):
+    """Multi-waypoint route: synthetic legs joined end to end, with ``segments`` and ``way_points``."""
+    geometry = []
+    segments = []
+    way_points = [0]
+    for start, end in zip(coordinates, coordinates[1:]):
+        leg = synthetic_directions(profile, f"{start[0]},{start[1]}", f"{end[0]},{end[1]}")['features'][0]
+        points = leg['geometry']['coordinates']
+        geometry += points if not geometry else points[1:]
+        way_points.append(len(geometry) - 1)
+        segments.append({**leg['properties']['summary'], 'steps': []})
+    return {
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': geometry},
+            'properties': {
+                'summary': {
+                    'distance': round(sum(segment['distance'] for segment in segments), 1),
+                    'duration': round(sum(segment['duration'] for segment in segments), 1),
+                },
+                'segments': segments,
+                'way_points': way_points,
+            },
+        }],
+    }
+
+
+def synthetic_matrix(profile, locations):
+    speed = PROFILE_SPEEDS.get(profile, PROFILE_SPEEDS['driving-car'])
+    distances = [
+        [round(_haversine_meters(a[0], a[1], b[0], b[1]) * DETOUR_FACTOR, 2) for b in locations]
+        for a in locations
+    ]
+    return {
+        'durations': [[round(distance / speed, 2) for distance in row] for row in distances],
+        'distances': distances,
+    }
+
+
+class FixtureStore:
+    """Recorded ORS responses on disk, one JSON file per request.
+
+    Files are keyed by endpoint and query parameters (minus the API key), so
+    a directory recorded once against the real service replays identically.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(path, params):
+        query = '&'.join(f"{name}={value}" for name, value in sorted(params.items()) if name != 'api_key')
+        return _digest(f"{path}?{query}")
+
+    def _path(self, path, params):
+        return os.path.join(self.directory, f"{self.key(path, params)}.json")
+
+    def load(self, path, params):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(path, params)) as fh:
+                fixture = json.load(fh)
+        except FileNotFoundError:
+            return None
+        return fixture['status'], fixture['body']
+
+    def save(self, path, params, status, body):
+        if not self.directory:
+            return
+        # The key only authenticates the recording; it must not end up in files that get shared or committed
+        params = {name: value for name, value in params.items() if name != 'api_key'}
+        fixture = {'request': {'path': path, 'params': params}, 'status': status, 'body': body}
+        with self._lock:
+            with open(self._path(path, params), 'w') as fh:
+                json.dump(fixture, fh)
+
+
+class OrsStandIn:
+    """Resolves one ORS request to ``(status, body)``.
+
+    Lookup order is recorded fixture, then (when ``record_from`` is set) the
+    upstream service, whose answer is saved as a new fixture, then a
+    synthetic response unless ``strict`` is set. ``latency`` and ``jitter``
+    (seconds) delay every response; ``error_rate`` of requests fail with
+    ``error_status``. The error sequence is reproducible for a given ``seed``.
+    """
+
+    def __init__(self, fixtures=None, record_from=None, record_key=None, strict=False,
+                 latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, seed=0):
+        self.fixtures = FixtureStore(fixtures)
+        self.record_from = record_from.rstrip('/') if record_from else None
+        self.record_key = record_key
+        self.strict = strict
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.stats = {'requests': 0, 'fixture_hits': 0, 'recorded': 0, 'synthetic': 0, 'errors': 0}
+
+    def _draw(self):
+        with self._random_lock:
+            self.stats['requests'] += 1
+            return self._random.random(), self._random.random()
+
+    def _count(self, name):
+        with self._random_lock:
+            self.stats[name] += 1
+
+    def delay(self, draw):
+        return max(0.0, self.latency + (draw * 2 - 1) * self.jitter)
+
+    def _record(self, path, params):
+        headers = {'Authorization': self.record_key} if path.startswith('/v2/') else {}
+        if 'body' in params:
+            # POST endpoints: the JSON body travels as the single "body" parameter
+            res = requests.post(f"{self.record_from}{path}", data=params['body'], timeout=30,
+                                headers={**headers, 'Content-Type': 'application/json'})
+            return res.status_code, res.json()
+        params = {**params, 'api_key': self.record_key} if path.startswith('/geocode') else params
+        res = requests.get(f"{self.record_from}{path}", params=params, headers=headers, timeout=30)
+        return res.status_code, res.json()
+
+    def _synthesize(self, path, params):
+        if path == '/geocode/search':
+            return 200, synthetic_search(params.get('text', ''))
+        if path == '/geocode/reverse':
+            return 200, synthetic_reverse(float(params['point.lat']), float(params['point.lon']))
+        if path.startswith('/v2/directions/') and path.endswith('/geojson'):
+            profile = path.split('/')[3]
+            return 200, synthetic_directions_route(profile, json.loads(params['body'])['coordinates'])
+        if path.startswith('/v2/directions/'):
+            profile = path.rsplit('/', 1)[-1]
+            return 200, synthetic_directions(profile, params['start'], params['end'])
+        if path.startswith('/v2/matrix/'):
+            profile = path.rsplit('/', 1)[-1]
+            return 200, synthetic_matrix(profile, json.loads(params['body'])['locations'])
+        return 404, {'error': {'code': 404, 'message': f"Unknown endpoint {path}"}}
+
+    def handle(self, path, params):
+        """Return ``(status, body, delay_seconds)`` for one request."""
+        error_draw, latency_draw = self._draw()
+        delay = self.delay(latency_draw)
+        if error_draw < self.error_rate:
+            self._count('errors')
+            return self.error_status, {'error': {'code': self.error_status, 'message': 'Injected error'}}, delay
+        try:
+            fixture = self.fixtures.load(path, params)
+            if fixture is not None:
+                self._count('fixture_hits')
+                return fixture[0], fixture[1], delay
+            if self.record_from:
+                status, body = self._record(path, params)
+                self.fixtures.save(path, params, status, body)
+                self._count('recorded')
+                return status, body, delay
+            if self.strict:
+                return 404, {'error': {'code': 404, 'message': 'No recorded fixture for this request'}}, delay
+            self._count('synthetic')
+            return (*self._synthesize(path, params), delay)
+        except (KeyError, ValueError) as e:
+            return 400, {'error': {'code': 400, 'message': f"Invalid request: {str(e)}"}}, delay
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Recording from {self.record_from} failed: {str(e)}")
+            return 502, {'error': {'code': 502, 'message': 'Upstream ORS request failed'}}, delay
+
+
+class StandInClient:
+    """In-process ``OrsClient`` replacement answering from an ``OrsStandIn``.
+
+    Skips the socket entirely, for benchmarks and tests that want ORS
+    mocked out. Injected latency is honoured with ``time.sleep``.
+    """
+
+    def __init__(self, standin=None, **options):
+        self.standin = standin or OrsStandIn(**options)
+
+    def _get(self, path, params):
+        return self._respond(path, {name: str(value) for name, value in params.items()})
+
+    def _post(self, path, body):
+        return self._respond(path, {'body': json.dumps(body, sort_keys=True, separators=(',', ':'))})
+
+    def _respond(self, path, params):
+        status, body, delay = self.standin.handle(path, params)
+        if delay:
+            time.sleep(delay)
+        res = requests.Response()
+        res.status_code = status
+        res._content = json.dumps(body).encode('utf-8')
+        res.headers['Content-Type'] = 'application/json'
+        res.url = path
+        return res
+
+    def geocode_search(self, text):
+        return self._get('/geocode/search', {'text': text})
+
+    def geocode_reverse(self, lat, lng):
+        return self._get('/geocode/reverse', {'point.lon': lng, 'point.lat': lat, 'size': 1})
+
+    def directions(self, profile, start_coords, end_coords):
+        return self._get(f'/v2/directions/{profile}', {'start': start_coords, 'end': end_coords})
+
+    def directions_route(self, profile, coordinates):
+        return self._post(f'/v2/directions/{profile}/geojson', {'coordinates': coordinates})
+
+    def matrix(self, profile, locations):
+        return self._post(f'/v2/matrix/{profile}', {'locations': locations, 'metrics': ['duration', 'distance']})
+
+    def close(self):
+        pass
+
+
+class OrsStandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    standin = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self._answer(url.path, dict(parse_qsl(url.query)))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            body = {}
+        self._answer(urlsplit(self.path).path, {'body': json.dumps(body, sort_keys=True, separators=(',', ':'))})
+
+    def _answer(self, path, params):
+        if not params.get('api_key') and not self.headers.get('Authorization'):
+            status, body, delay = 403, {'error': 'Access to this API has been disallowed'}, 0
+        else:
+            status, body, delay = self.standin.handle(path, params)
+        if delay:
+            time.sleep(delay)
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def make_server(host='127.0.0.1', port=8081, **options):
+    """Build a threaded stand-in server; call ``serve_forever()`` on the result."""
+    handler = type('BoundOrsStandInHandler', (OrsStandInHandler,), {'standin': OrsStandIn(**options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,127 @@
+"""In-memory spatial index of truck stops and fuel stations.
+
+The dataset is read once from ``TRUCK_STOP_POI_FILE`` (CSV with ``name``,
+``lat``, ``lng`` and optional ``kind`` columns, or a GeoJSON FeatureCollection
+of points with ``name``/``kind`` properties) and bucketed into a grid of
+``POI_BUCKET_DEGREES`` cells. A nearest-facility query only scans the few
+cells around the point, so it costs microseconds and never leaves the process.
+"""
+import csv
+import json
+import math
+import logging
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_METERS = 6371000
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_METERS / 180
+
+DEFAULT_KIND = 'truck_stop'
+
+
+def _haversine_meters(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+
+class PoiIndex:
+    def __init__(self, pois=(), bucket_degrees=None):
+        """Index ``(lat, lng, name, kind)`` tuples."""
+        self.bucket_degrees = bucket_degrees or settings.POI_BUCKET_DEGREES
+        self.buckets = {}
+        self.count = 0
+        for poi in pois:
+            self.add(*poi)
+
+    def __len__(self):
+        return self.count
+
+    def _bucket(self, lat, lng):
+        return math.floor(lat / self.bucket_degrees), math.floor(lng / self.bucket_degrees)
+
+    def add(self, lat, lng, name, kind=DEFAULT_KIND):
+        self.buckets.setdefault(self._bucket(lat, lng), []).append((lat, lng, name, kind or DEFAULT_KIND))
+        self.count += 1
+
+    def nearest(self, lat, lng, max_meters, kinds=None):
+        """Closest POI within ``max_meters`` (of one of ``kinds`` if given) as a dict, or None."""
+        if not self.buckets:
+            return None
+        lat_span = max_meters / METERS_PER_DEGREE
+        # Longitude degrees shrink towards the poles; clamp so the scan stays bounded near them
+        lng_span = lat_span / max(math.cos(math.radians(min(abs(lat) + lat_span, 89.0))), 0.01)
+        row_min, col_min = self._bucket(lat - lat_span, lng - lng_span)
+        row_max, col_max = self._bucket(lat + lat_span, lng + lng_span)
+        best = None
+        best_meters = max_meters
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                for poi in self.buckets.get((row, col), ()):
+                    if kinds and poi[3] not in kinds:
+                        continue
+                    meters = _haversine_meters(lat, lng, poi[0], poi[1])
+                    if meters <= best_meters:
+                        best, best_meters = poi, meters
+        if best is None:
+            return None
+        return {
+            'name': best[2],
+            'kind': best[3],
+            'lat': best[0],
+            'lng': best[1],
+            'distance_meters': round(best_meters),
+        }
+
+
+def _read_csv(handle):
+    for row in csv.DictReader(handle):
+        yield float(row['lat']), float(row['lng']), row.get('name') or '', row.get('kind') or DEFAULT_KIND
+
+
+def _read_geojson(handle):
+    for feature in json.load(handle).get('features') or []:
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') != 'Point':
+            continue
+        lng, lat = geometry['coordinates'][:2]
+        properties = feature.get('properties') or {}
+        yield float(lat), float(lng), properties.get('name') or '', properties.get('kind') or DEFAULT_KIND
+
+
+def load_poi_index(path, bucket_degrees=None):
+    """Build a ``PoiIndex`` from a CSV or GeoJSON file."""
+    reader = _read_csv if path.lower().endswith('.csv') else _read_geojson
+    with open(path, newline='', encoding='utf-8') as handle:
+        index = PoiIndex(reader(handle), bucket_degrees)
+    logger.info(f"Loaded {len(index)} truck stop POIs from {path}")
+    return index
+
+
+_poi_index = None
+_poi_lock = threading.Lock()
+
+
+def get_poi_index():
+    """Return the process-wide POI index, loading ``TRUCK_STOP_POI_FILE`` on first use.
+
+    With no file configured, or one that can't be read, the index is empty
+    and trips keep their unsnapped stops.
+    """
+    global _poi_index
+    if _poi_index is None:
+        with _poi_lock:
+            if _poi_index is None:
+                index = PoiIndex()
+                if settings.TRUCK_STOP_POI_FILE:
+                    try:
+                        index = load_poi_index(settings.TRUCK_STOP_POI_FILE)
+                    except Exception as e:
+                        logger.error(f"Could not load truck stop POIs from {settings.TRUCK_STOP_POI_FILE}: {str(e)}")
+                _poi_index = index
+    return _poi_index
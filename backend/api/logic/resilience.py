@@ -0,0 +1,433 @@
+"""Quota-aware rate limiting and circuit breaking for ORS calls.
+
+``RateLimiter`` enforces the ORS plan quotas (requests per minute / per day
+and endpoint) with token buckets in a Django cache, so every worker sharing
+that backend draws from the same allowance. ``CircuitBreaker`` stops calling an
+endpoint whose recent calls mostly failed, for a cool-down period, instead
+of letting every request wait out its own timeout. Both raise
+``OrsUnavailable`` so callers fail fast (or fall back to cached data).
+"""
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+import requests
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'min': 60, 'minute': 60, 'h': 3600, 'hour': 3600, 'day': 86400}
+
+
+class OrsUnavailable(requests.exceptions.RequestException):
+    """ORS was not called: the quota is exhausted or the endpoint's circuit is open."""
+
+
+def parse_rate_limits(spec):
+    """Parse ``"directions=40/min,directions=2000/day,geocode=100/min"`` into ``{endpoint: [(count, seconds)]}``."""
+    limits = {}
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            endpoint, rate = item.split('=')
+            count, period = rate.split('/')
+            limits.setdefault(endpoint.strip(), []).append((int(count), PERIODS[period.strip().lower()]))
+        except (ValueError, KeyError):
+            raise ValueError(f"Invalid ORS rate limit '{item}'; expected endpoint=count/period (period: s, min, hour, day).")
+    return limits
+
+
+class RateLimiter:
+    """Shared per-endpoint request quotas.
+
+    Each limit is a token bucket holding up to ``count`` tokens, refilled
+    evenly over ``seconds``, so no window boundary lets a double burst
+    through. A bucket's token count and last refill time live together under
+    one cache key and are updated under a short cache lock, so every worker
+    sharing that backend draws from the same allowance. A caller that finds a
+    bucket empty reserves the next token and waits for it if that is at most
+    ``max_wait`` seconds away, otherwise it is refused with ``OrsUnavailable``.
+    """
+
+    key_prefix = 'ors-rate:'
+    # Seconds a bucket lock is held at most (should its holder die) and waited for
+    lock_timeout = 2
+
+    def __init__(self, limits, alias='default', max_wait=2.0):
+        self.limits = limits
+        self.alias = alias
+        self.max_wait = max_wait
+
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _key(self, endpoint, seconds):
+        return f"{self.key_prefix}{endpoint}:{seconds}"
+
+    def _tokens(self, state, count, seconds, now):
+        """Tokens in a bucket at ``now``, from its stored ``(tokens, refilled_at)``; a missing bucket is full."""
+        if state is None:
+            return float(count)
+        tokens, refilled_at = state
+        return min(float(count), tokens + max(0.0, now - refilled_at) * count / seconds)
+
+    def _spend(self, endpoint, count, seconds, tokens, now):
+        """Take one token; returns the bucket's new state and the seconds until that token exists."""
+        wait = (1 - tokens) * seconds / count if tokens < 1 else 0.0
+        if wait > self.max_wait:
+            metrics.inc('ors_rate_limited_total', endpoint=endpoint)
+            raise OrsUnavailable(f"ORS {endpoint} quota of {count} per {seconds}s is used up")
+        # The token is reserved even when the caller has to wait for it, so waiters queue in turn
+        return (tokens - 1, now), wait
+
+    def _take(self, cache, endpoint, count, seconds):
+        key = self._key(endpoint, seconds)
+        lock = f"{key}:lock"
+        deadline = time.monotonic() + self.lock_timeout
+        while not cache.add(lock, 1, timeout=self.lock_timeout):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"bucket {key} stayed locked")
+            time.sleep(0.001)
+        try:
+            now = time.time()
+            state, wait = self._spend(endpoint, count, seconds, self._tokens(cache.get(key), count, seconds, now), now)
+            # An idle bucket refills completely within ``seconds``, so it may expire after that
+            cache.set(key, state, timeout=seconds + 60)
+        finally:
+            cache.delete(lock)
+        return wait
+
+    async def _atake(self, cache, endpoint, count, seconds):
+        key = self._key(endpoint, seconds)
+        lock = f"{key}:lock"
+        deadline = time.monotonic() + self.lock_timeout
+        while not await cache.aadd(lock, 1, timeout=self.lock_timeout):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"bucket {key} stayed locked")
+            await asyncio.sleep(0.001)
+        try:
+            now = time.time()
+            state, wait = self._spend(endpoint, count, seconds, self._tokens(await cache.aget(key), count, seconds, now), now)
+            await cache.aset(key, state, timeout=seconds + 60)
+        finally:
+            await cache.adelete(lock)
+        return wait
+
+    def acquire(self, endpoint):
+        """Take one request from every quota of ``endpoint``, waiting briefly if needed."""
+        limits = self.limits.get(endpoint)
+        if not limits:
+            return
+        cache = self._cache()
+        for count, seconds in limits:
+            try:
+                wait = self._take(cache, endpoint, count, seconds)
+            except OrsUnavailable:
+                raise
+            except Exception as e:
+                # A broken cache must not take ORS access down with it
+                logger.warning(f"ORS rate limiter unavailable: {str(e)}")
+                return
+            if wait:
+                time.sleep(wait)
+
+    async def aacquire(self, endpoint):
+        limits = self.limits.get(endpoint)
+        if not limits:
+            return
+        cache = self._cache()
+        for count, seconds in limits:
+            try:
+                wait = await self._atake(cache, endpoint, count, seconds)
+            except OrsUnavailable:
+                raise
+            except Exception as e:
+                logger.warning(f"ORS rate limiter unavailable: {str(e)}")
+                return
+            if wait:
+                await asyncio.sleep(wait)
+
+    def remaining(self):
+        """``[(labels, remaining)]`` whole tokens left in every quota's bucket, for the metrics gauge."""
+        cache = self._cache()
+        samples = []
+        now = time.time()
+        for endpoint, limits in self.limits.items():
+            for count, seconds in limits:
+                tokens = self._tokens(cache.get(self._key(endpoint, seconds)), count, seconds, now)
+                samples.append(({'endpoint': endpoint, 'window': f"{seconds}s"}, max(0, int(tokens))))
+        return samples
+
+
+class CircuitBreaker:
+    """Per-endpoint circuit breaker.
+
+    Closed: calls flow and their outcomes are kept for ``window`` seconds.
+    Once at least ``min_calls`` were seen and the failure ratio reaches
+    ``failure_rate``, the breaker opens. Calls are then refused for
+    ``cooldown`` seconds, after which a single probe is let through
+    (half-open). Its success closes the breaker, its failure reopens it.
+    With a cache ``alias``, opening is broadcast, so other workers stop
+    calling too. Workers read the broadcast at most every
+    ``shared_check_interval`` seconds, so a healthy endpoint doesn't cost a
+    cache round trip per call; ``aallow`` reads it without blocking the loop.
+    """
+
+    CLOSED = 'closed'
+    HALF_OPEN = 'half_open'
+    OPEN = 'open'
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    key_prefix = 'ors-breaker:'
+    shared_check_interval = 1.0
+
+    def __init__(self, name, failure_rate=0.5, min_calls=10, window=30.0, cooldown=30.0, alias=None):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self.alias = alias
+        self.state = self.CLOSED
+        self._outcomes = deque()
+        self._failures = 0
+        self._opened_until = 0.0
+        self._probe_in_flight = False
+        self._shared_checked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _shared(self):
+        if not self.alias:
+            return None
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _transition(self, state):
+        if state != self.state:
+            self.state = state
+            metrics.inc('ors_circuit_transitions_total', endpoint=self.name, state=state)
+            log = logger.warning if state == self.OPEN else logger.info
+            log(f"ORS circuit for {self.name} is now {state}")
+
+    def _open(self, now, until=None):
+        self._opened_until = until or now + self.cooldown
+        self._outcomes.clear()
+        self._failures = 0
+        self._probe_in_flight = False
+        self._transition(self.OPEN)
+
+    def _key(self):
+        return f"{self.key_prefix}{self.name}"
+
+    def _remaining(self, expires):
+        """Seconds left of a broadcast open state; expiry is wall-clock, as monotonic clocks differ across workers."""
+        if expires is None:
+            return None
+        remaining = float(expires) - time.time()
+        return remaining if remaining > 0 else None
+
+    def _open_elsewhere(self):
+        """Seconds until the open state another worker broadcast ends, or None."""
+        try:
+            return self._remaining(self._shared().get(self._key()))
+        except Exception:
+            return None
+
+    async def _aopen_elsewhere(self):
+        try:
+            return self._remaining(await self._shared().aget(self._key()))
+        except Exception:
+            return None
+
+    def _allow_locally(self, now):
+        """``allow`` from this worker's own state: True/False, or None when the broadcast is due a check."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if now < self._opened_until:
+                    return self._reject()
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    return self._reject()
+                self._probe_in_flight = True
+                return True
+            if not self.alias or now < self._shared_checked_until:
+                return True
+            self._shared_checked_until = now + self.shared_check_interval
+        return None
+
+    def _follow(self, now, remaining):
+        if not remaining:
+            return True
+        with self._lock:
+            if self.state == self.CLOSED:
+                self._open(now, now + min(remaining, self.cooldown))
+        return self._reject()
+
+    def allow(self):
+        """Return True if a call may go ahead; a True in half-open state reserves the probe."""
+        now = time.monotonic()
+        allowed = self._allow_locally(now)
+        if allowed is not None:
+            return allowed
+        return self._follow(now, self._open_elsewhere())
+
+    async def aallow(self):
+        """``allow`` for async callers: the shared state is read without blocking the event loop."""
+        now = time.monotonic()
+        allowed = self._allow_locally(now)
+        if allowed is not None:
+            return allowed
+        return self._follow(now, await self._aopen_elsewhere())
+
+    def _reject(self):
+        metrics.inc('ors_circuit_rejections_total', endpoint=self.name)
+        return False
+
+    def release(self):
+        """Give back a reserved probe whose call never happened."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _record(self, ok):
+        """Count an outcome; returns True if it opened the breaker."""
+        now = time.monotonic()
+        opened = False
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if ok:
+                    self._outcomes.clear()
+                    self._failures = 0
+                    self._transition(self.CLOSED)
+                else:
+                    self._open(now)
+                    opened = True
+            elif self.state == self.CLOSED:
+                self._outcomes.append((now, ok))
+                if not ok:
+                    self._failures += 1
+                while self._outcomes and self._outcomes[0][0] < now - self.window:
+                    if not self._outcomes.popleft()[1]:
+                        self._failures -= 1
+                if len(self._outcomes) >= self.min_calls and self._failures / len(self._outcomes) >= self.failure_rate:
+                    self._open(now)
+                    opened = True
+        return opened
+
+    def record(self, ok):
+        if self._record(ok) and self.alias:
+            try:
+                self._shared().set(self._key(), time.time() + self.cooldown, timeout=self.cooldown)
+            except Exception:
+                pass
+
+    async def arecord(self, ok):
+        if self._record(ok) and self.alias:
+            try:
+                await self._shared().aset(self._key(), time.time() + self.cooldown, timeout=self.cooldown)
+            except Exception:
+                pass
+
+    def state_value(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() >= self._opened_until:
+                return self.STATE_VALUES[self.HALF_OPEN]
+            return self.STATE_VALUES[self.state]
+
+
+class OrsGuard:
+    """Rate limiter plus one circuit breaker per endpoint, applied around every ORS call."""
+
+    def __init__(self, limiter=None, breaker_factory=None):
+        self.limiter = limiter
+        self.breaker_factory = breaker_factory
+        self.breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, endpoint):
+        breaker = self.breakers.get(endpoint)
+        if breaker is None and self.breaker_factory is not None:
+            with self._lock:
+                breaker = self.breakers.get(endpoint)
+                if breaker is None:
+                    breaker = self.breakers[endpoint] = self.breaker_factory(endpoint)
+        return breaker
+
+    def before(self, endpoint):
+        breaker = self.breaker(endpoint)
+        if breaker is not None and not breaker.allow():
+            raise OrsUnavailable(f"ORS {endpoint} circuit is open")
+        if self.limiter is not None:
+            try:
+                self.limiter.acquire(endpoint)
+            except OrsUnavailable:
+                if breaker is not None:
+                    breaker.release()
+                raise
+
+    async def abefore(self, endpoint):
+        breaker = self.breaker(endpoint)
+        if breaker is not None and not await breaker.aallow():
+            raise OrsUnavailable(f"ORS {endpoint} circuit is open")
+        if self.limiter is not None:
+            try:
+                await self.limiter.aacquire(endpoint)
+            except OrsUnavailable:
+                if breaker is not None:
+                    breaker.release()
+                raise
+
+    def after(self, endpoint, ok):
+        breaker = self.breaker(endpoint)
+        if breaker is not None:
+            breaker.record(ok)
+
+    async def aafter(self, endpoint, ok):
+        breaker = self.breaker(endpoint)
+        if breaker is not None:
+            await breaker.arecord(ok)
+
+    def circuit_states(self):
+        return [({'endpoint': name}, breaker.state_value()) for name, breaker in sorted(self.breakers.items())]
+
+
+_guard = None
+_guard_lock = threading.Lock()
+
+
+def get_ors_guard():
+    """Return the process-wide ORS guard, configured from settings on first use."""
+    global _guard
+    if _guard is None:
+        with _guard_lock:
+            if _guard is None:
+                limits = parse_rate_limits(settings.ORS_RATE_LIMITS)
+                limiter = RateLimiter(
+                    limits, alias=settings.ORS_RATE_LIMIT_CACHE_ALIAS, max_wait=settings.ORS_RATE_LIMIT_MAX_WAIT,
+                ) if limits else None
+                breaker_factory = None
+                if settings.ORS_BREAKER_ENABLED:
+                    def breaker_factory(endpoint):
+                        return CircuitBreaker(
+                            endpoint,
+                            failure_rate=settings.ORS_BREAKER_FAILURE_RATE,
+                            min_calls=settings.ORS_BREAKER_MIN_CALLS,
+                            window=settings.ORS_BREAKER_WINDOW,
+                            cooldown=settings.ORS_BREAKER_COOLDOWN,
+                            alias=settings.ORS_BREAKER_CACHE_ALIAS or None,
+                        )
+                _guard = OrsGuard(limiter, breaker_factory)
+    return _guard
+
+
+def set_ors_guard(guard):
+    """Replace the process-wide guard (e.g. in tests); pass None to rebuild it from settings."""
+    global _guard
+    _guard = guard
@@ -0,0 +1,107 @@
+"""Position lookups along a routed trip.
+
+``RouteIndex`` holds the cumulative distance and driving time at every
+point of the trip's geometry, so "where is the truck after T seconds of
+driving" or "how long until mile M" is a bisect plus one interpolation.
+ORS only reports distance and duration per leg, so within a leg both are
+spread over the geometry in proportion to segment length (constant speed
+per leg); leg ends line up with the ORS figures exactly.
+"""
+import math
+import operator
+from bisect import bisect_right
+from itertools import accumulate
+
+METERS_PER_MILE = 1609.34
+
+
+def _cumulative_lengths(lngs, lats):
+    """Running length along a polyline, equirectangular (plenty for apportioning a leg's totals)."""
+    cos_lats = [math.cos(math.radians(lat)) for lat in lats]
+    dxs = map(lambda a, b, ca, cb: (b - a) * (ca + cb) * 0.5, lngs, lngs[1:], cos_lats, cos_lats[1:])
+    dys = map(operator.sub, lats[1:], lats)
+    return list(accumulate(map(math.hypot, dxs, dys), initial=0.0))
+
+
+class RouteIndex:
+    def __init__(self, legs):
+        """Build from ``_get_route`` legs in driving order (``geometry``, ``distance_meters``, ``duration_seconds``)."""
+        self.lats = []
+        self.lngs = []
+        self.distances = []
+        self.times = []
+        distance = 0.0
+        elapsed = 0.0
+        for leg in legs:
+            geometry = leg['geometry']
+            leg_distance = leg['distance_meters']
+            leg_duration = leg['duration_seconds']
+            if geometry:
+                lngs = [point[0] for point in geometry]
+                lats = [point[1] for point in geometry]
+                along = _cumulative_lengths(lngs, lats)
+                total = along[-1]
+                if not total:
+                    # All points coincide: spread the leg evenly over them
+                    along = [float(i) for i in range(len(geometry))] if len(geometry) > 1 else [1.0]
+                    total = along[-1]
+                distance_scale = leg_distance / total
+                time_scale = leg_duration / total
+                self.lngs += lngs
+                self.lats += lats
+                self.distances += [distance + length * distance_scale for length in along]
+                self.times += [elapsed + length * time_scale for length in along]
+            distance += leg_distance
+            elapsed += leg_duration
+        self.total_distance = distance
+        self.total_time = elapsed
+
+    def _locate(self, marks, value):
+        """``(i, share)``: ``value`` lies ``share`` of the way from point ``i`` to point ``i + 1``."""
+        if not marks:
+            return None
+        if value <= marks[0]:
+            return 0, 0.0
+        if value >= marks[-1]:
+            return len(marks) - 1, 0.0
+        i = bisect_right(marks, value)
+        span = marks[i] - marks[i - 1]
+        return i - 1, (value - marks[i - 1]) / span if span else 1.0
+
+    def _position(self, found):
+        if found is None:
+            return None
+        i, share = found
+        if not share:
+            return self.lats[i], self.lngs[i]
+        return (
+            self.lats[i] + (self.lats[i + 1] - self.lats[i]) * share,
+            self.lngs[i] + (self.lngs[i + 1] - self.lngs[i]) * share,
+        )
+
+    def position_at_time(self, seconds):
+        """``(lat, lng)`` after ``seconds`` of driving, or None for an empty route."""
+        return self._position(self._locate(self.times, seconds))
+
+    def position_at_distance(self, meters):
+        return self._position(self._locate(self.distances, meters))
+
+    def time_at_distance(self, meters):
+        """Driving seconds needed to cover the first ``meters`` of the route."""
+        found = self._locate(self.distances, meters)
+        if found is None:
+            return meters / self.total_distance * self.total_time if self.total_distance else 0.0
+        i, share = found
+        if not share:
+            return self.times[i]
+        return self.times[i] + (self.times[i + 1] - self.times[i]) * share
+
+    def milestone_times(self, every_miles):
+        """Driving seconds at every ``every_miles`` along the route, short of the destination."""
+        step = every_miles * METERS_PER_MILE
+        count = int(self.total_distance / step)
+        return [
+            self.time_at_distance(k * step)
+            for k in range(1, count + 1)
+            if k * step < self.total_distance
+        ]
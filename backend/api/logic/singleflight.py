@@ -0,0 +1,264 @@
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import weakref
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into one execution per process.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is in flight wait and receive the same result, or the
+    same exception. Nothing is remembered once the call completes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = weakref.WeakKeyDictionary()
+
+    def do(self, key, fn):
+        """Run ``fn()`` once for all concurrent callers of ``key``; returns ``(value, shared)``."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = fn()
+            return call.value, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def ado(self, key, fn):
+        """Async ``do``: ``fn()`` returns an awaitable, awaited once per event loop for all callers.
+
+        The work runs in its own task, so a leader whose request is cancelled
+        doesn't cancel it for the callers waiting on the same key.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            calls = self._async_calls.setdefault(loop, {})
+        task = calls.get(key)
+        shared = task is not None
+        if not shared:
+            task = calls[key] = loop.create_task(fn())
+            task.add_done_callback(lambda done: calls.pop(key, None) if calls.get(key) is done else None)
+        return await asyncio.shield(task), shared
+
+
+class SharedFlight:
+    """Cross-process single flight through a Django cache.
+
+    The leader claims ``lock:<key>`` with ``cache.add`` and publishes its
+    result under a key unique to that flight. Other workers poll for that
+    result. If the leader vanishes or ``wait`` runs out, they compute the
+    value themselves, so coalescing never makes a request fail.
+    """
+
+    key_prefix = 'trip-flight:'
+
+    def __init__(self, alias, wait=30.0, poll_interval=0.05, lock_ttl=60, result_ttl=30):
+        self.alias = alias
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _lock_key(self, key):
+        return f"{self.key_prefix}lock:{key}"
+
+    def _result_key(self, key, token):
+        return f"{self.key_prefix}result:{key}:{token}"
+
+    def do(self, key, fn):
+        cache = self._cache()
+        token = uuid.uuid4().hex
+        try:
+            leader = cache.add(self._lock_key(key), token, timeout=self.lock_ttl)
+        except Exception as e:
+            logger.warning(f"Shared single-flight unavailable: {str(e)}")
+            return fn(), False
+
+        if leader:
+            try:
+                value = fn()
+                try:
+                    cache.set(self._result_key(key, token), value, timeout=self.result_ttl)
+                except Exception as e:
+                    logger.warning(f"Could not publish shared single-flight result: {str(e)}")
+                return value, False
+            finally:
+                try:
+                    cache.delete(self._lock_key(key))
+                except Exception:
+                    pass
+
+        deadline = time.monotonic() + self.wait
+        try:
+            leader_token = cache.get(self._lock_key(key))
+            while time.monotonic() < deadline:
+                if leader_token:
+                    value = cache.get(self._result_key(key, leader_token))
+                    if value is not None:
+                        return value, True
+                current = cache.get(self._lock_key(key))
+                if current is None:
+                    # Leader finished (its result may have landed just now) or gave up
+                    if leader_token:
+                        value = cache.get(self._result_key(key, leader_token))
+                        if value is not None:
+                            return value, True
+                    break
+                leader_token = current
+                time.sleep(self.poll_interval)
+        except Exception as e:
+            logger.warning(f"Shared single-flight unavailable: {str(e)}")
+        return fn(), False
+
+    async def ado(self, key, fn):
+        cache = self._cache()
+        token = uuid.uuid4().hex
+        try:
+            leader = await cache.aadd(self._lock_key(key), token, timeout=self.lock_ttl)
+        except Exception as e:
+            logger.warning(f"Shared single-flight unavailable: {str(e)}")
+            return await fn(), False
+
+        if leader:
+            try:
+                value = await fn()
+                try:
+                    await cache.aset(self._result_key(key, token), value, timeout=self.result_ttl)
+                except Exception as e:
+                    logger.warning(f"Could not publish shared single-flight result: {str(e)}")
+                return value, False
+            finally:
+                try:
+                    await cache.adelete(self._lock_key(key))
+                except Exception:
+                    pass
+
+        deadline = time.monotonic() + self.wait
+        try:
+            leader_token = await cache.aget(self._lock_key(key))
+            while time.monotonic() < deadline:
+                if leader_token:
+                    value = await cache.aget(self._result_key(key, leader_token))
+                    if value is not None:
+                        return value, True
+                current = await cache.aget(self._lock_key(key))
+                if current is None:
+                    if leader_token:
+                        value = await cache.aget(self._result_key(key, leader_token))
+                        if value is not None:
+                            return value, True
+                    break
+                leader_token = current
+                await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            logger.warning(f"Shared single-flight unavailable: {str(e)}")
+        return await fn(), False
+
+
+class TripCoalescer:
+    """In-process single flight, optionally backed by a ``SharedFlight`` across workers.
+
+    Only the local leader takes part in the shared flight, so each process
+    polls the cache at most once per key.
+    """
+
+    def __init__(self, shared=None):
+        self.local = SingleFlight()
+        self.shared = shared
+
+    def do(self, key, fn):
+        shared_hit = []
+
+        def run():
+            if self.shared is None:
+                return fn()
+            value, was_shared = self.shared.do(key, fn)
+            if was_shared:
+                shared_hit.append(True)
+            return value
+
+        value, local_hit = self.local.do(key, run)
+        self._count(local_hit, shared_hit)
+        return value
+
+    async def ado(self, key, fn):
+        shared_hit = []
+
+        async def run():
+            if self.shared is None:
+                return await fn()
+            value, was_shared = await self.shared.ado(key, fn)
+            if was_shared:
+                shared_hit.append(True)
+            return value
+
+        value, local_hit = await self.local.ado(key, run)
+        self._count(local_hit, shared_hit)
+        return value
+
+    def _count(self, local_hit, shared_hit):
+        if local_hit:
+            metrics.inc('trip_coalesced_total', scope='local')
+        elif shared_hit:
+            metrics.inc('trip_coalesced_total', scope='shared')
+
+
+_trip_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_trip_coalescer():
+    """Return the process-wide trip coalescer, configured from settings on first use."""
+    global _trip_coalescer
+    if _trip_coalescer is None:
+        with _coalescer_lock:
+            if _trip_coalescer is None:
+                shared = None
+                if settings.TRIP_COALESCE_SHARED:
+                    shared = SharedFlight(
+                        settings.TRIP_COALESCE_CACHE_ALIAS,
+                        wait=settings.TRIP_COALESCE_WAIT,
+                        poll_interval=settings.TRIP_COALESCE_POLL_INTERVAL,
+                        lock_ttl=settings.TRIP_COALESCE_LOCK_TTL,
+                        result_ttl=settings.TRIP_COALESCE_RESULT_TTL,
+                    )
+                _trip_coalescer = TripCoalescer(shared)
+    return _trip_coalescer
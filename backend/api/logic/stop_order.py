@@ -0,0 +1,100 @@
+"""Stop ordering for multi-stop trips.
+
+The route starts at node 0 (the truck) and visits every other node of a
+travel-time matrix once, ending wherever the last stop is. ``before`` maps a
+node to the nodes that must be visited ahead of it, e.g. a shipment's pickup
+ahead of its dropoff. The order comes from nearest insertion followed by
+2-opt and or-opt moves, all of which only ever consider orders that
+respect ``before``. For the 5-20 stops of a run this takes milliseconds and
+lands within a few percent of optimal.
+"""
+UNREACHABLE = float('inf')
+
+
+def path_cost(matrix, order):
+    return sum(matrix[a][b] for a, b in zip(order, order[1:]))
+
+
+def _feasible(order, before):
+    position = {node: i for i, node in enumerate(order)}
+    return all(
+        position[required] < position[node]
+        for node, requirements in before.items() if node in position
+        for required in requirements if required in position
+    )
+
+
+def _insert(matrix, order, node, earliest):
+    """Cheapest place for ``node`` at index ``earliest`` or later; returns ``(index, added_cost)``."""
+    best_index, best_cost = None, UNREACHABLE
+    for index in range(max(earliest, 1), len(order) + 1):
+        previous = order[index - 1]
+        if index == len(order):
+            added = matrix[previous][node]
+        else:
+            following = order[index]
+            added = matrix[previous][node] + matrix[node][following] - matrix[previous][following]
+        if added < best_cost:
+            best_index, best_cost = index, added
+    return best_index, best_cost
+
+
+def nearest_insertion(matrix, before=None):
+    """Build a route by repeatedly inserting the unrouted stop closest to it, where it adds least."""
+    before = before or {}
+    order = [0]
+    pending = set(range(1, len(matrix)))
+    while pending:
+        routed = set(order)
+        ready = [node for node in pending if all(required in routed for required in before.get(node, ()))]
+        if not ready:
+            raise ValueError("Stop precedence constraints form a cycle.")
+        # Nearest: the smallest travel time between the stop and any routed node (either way)
+        node = min(ready, key=lambda n: (min(min(matrix[r][n], matrix[n][r]) for r in order), n))
+        position = {routed_node: i for i, routed_node in enumerate(order)}
+        earliest = max((position[required] + 1 for required in before.get(node, ())), default=1)
+        index, _ = _insert(matrix, order, node, earliest)
+        order.insert(len(order) if index is None else index, node)
+        pending.remove(node)
+    return order
+
+
+def two_opt(matrix, order, before=None, max_moves=500):
+    """Improve ``order`` while any move shortens it and keeps every ``before`` constraint.
+
+    Moves are 2-opt segment reversals plus relocating runs of one to three
+    stops (or-opt), which get past orders where precedence blocks every
+    useful reversal.
+    """
+    before = before or {}
+    order = list(order)
+    best = path_cost(matrix, order)
+    for _ in range(max_moves):
+        improved = False
+        for candidate in _neighbours(order):
+            cost = path_cost(matrix, candidate)
+            if cost < best - 1e-9 and _feasible(candidate, before):
+                order, best, improved = candidate, cost, True
+                break
+        if not improved:
+            break
+    return order
+
+
+def _neighbours(order):
+    for i in range(1, len(order) - 1):
+        for j in range(i + 1, len(order)):
+            yield order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+    for length in (1, 2, 3):
+        for i in range(1, len(order) - length + 1):
+            segment = order[i:i + length]
+            rest = order[:i] + order[i + length:]
+            for j in range(1, len(rest) + 1):
+                if j != i:
+                    yield rest[:j] + segment + rest[j:]
+
+
+def order_stops(matrix, before=None):
+    """Visiting order (node indices, starting with 0) for a travel-time ``matrix``."""
+    order = nearest_insertion(matrix, before)
+    return two_opt(matrix, order, before)
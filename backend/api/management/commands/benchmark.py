@@ -0,0 +1,73 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import HISTORY_ROWS, compare_results, run_benchmarks
+
+
+def _format_seconds(value):
+    if value is None:
+        return '-'
+    if value < 1e-3:
+        return f"{value * 1e6:.1f}us"
+    if value < 1:
+        return f"{value * 1e3:.2f}ms"
+    return f"{value:.3f}s"
+
+
+class Command(BaseCommand):
+    help = "Benchmark the HOS engine and trip API with ORS mocked; writes JSON results for cross-commit comparison."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help='Write the results document to this JSON file.')
+        parser.add_argument('--compare', help='Compare against a results file from an earlier run.')
+        parser.add_argument('--threshold', type=float, default=10.0, help='Percent change in median counted as a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit non-zero if --compare finds a regression.')
+        parser.add_argument('--filter', dest='name_filter', help='Only run benchmarks whose name contains this text.')
+        parser.add_argument('--engine', choices=['loop', 'closed_form'], help='Schedule engine (default: HOS_SCHEDULE_ENGINE).')
+        parser.add_argument('--quick', action='store_true', help='Fewer iterations, for a fast sanity run.')
+        parser.add_argument('--repeat', type=int, help='Timing rounds per benchmark.')
+        parser.add_argument('--history-rows', type=int, default=HISTORY_ROWS)
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as fh:
+                    baseline = json.load(fh)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline {options['compare']}: {str(e)}")
+            if options['name_filter']:
+                # Only compare what this run measures
+                baseline['benchmarks'] = {
+                    name: stats for name, stats in baseline.get('benchmarks', {}).items() if options['name_filter'] in name
+                }
+
+        def progress(name, stats):
+            self.stdout.write(f"{name:<50} median {_format_seconds(stats['median']):>10}  p95 {_format_seconds(stats['p95']):>10}")
+
+        results = run_benchmarks(
+            engine=options['engine'],
+            name_filter=options['name_filter'],
+            quick=options['quick'],
+            history_rows=options['history_rows'],
+            repeat=options['repeat'],
+            progress=progress,
+        )
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is None:
+            return
+
+        rows = compare_results(baseline, results, threshold=options['threshold'])
+        self.stdout.write(f"\nCompared with {baseline.get('meta', {}).get('revision') or options['compare']}:")
+        for name, before, after, change, verdict in rows:
+            change_text = f"{change:+.1f}%" if change is not None else ''
+            self.stdout.write(f"{name:<50} {_format_seconds(before):>10} -> {_format_seconds(after):>10} {change_text:>8}  {verdict}")
+        regressions = [row for row in rows if row[4] == 'regression']
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} benchmark(s) regressed by more than {options['threshold']}%")
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from api.logic.ors_standin import make_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local OpenRouteService stand-in (geocode search/reverse and directions) "
+        "for offline benchmarking. Point ORS_BASE_URL at it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--fixtures', help='Directory of recorded responses to replay (and to record into).')
+        parser.add_argument('--record-from', help='Forward fixture misses to this ORS base URL and save the answers.')
+        parser.add_argument('--record-key', help='API key used when recording from the real service.')
+        parser.add_argument('--strict', action='store_true', help='Answer fixture misses with 404 instead of synthesizing.')
+        parser.add_argument('--latency', type=float, default=0.0, help='Added latency per response, in milliseconds.')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Uniform +/- jitter on the latency, in milliseconds.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests (0-1) answered with --error-status.')
+        parser.add_argument('--error-status', type=int, default=503)
+        parser.add_argument('--seed', type=int, default=0, help='Seed for reproducible latency and error sequences.')
+
+    def handle(self, *args, **options):
+        server = make_server(
+            options['host'],
+            options['port'],
+            fixtures=options['fixtures'],
+            record_from=options['record_from'],
+            record_key=options['record_key'],
+            strict=options['strict'],
+            latency=options['latency'] / 1000.0,
+            jitter=options['jitter'] / 1000.0,
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            seed=options['seed'],
+        )
+        host, port = server.server_address[:2]
+        self.stdout.write(f"ORS stand-in listening on http://{host}:{port} (set ORS_BASE_URL to this)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(str(server.RequestHandlerClass.standin.stats))
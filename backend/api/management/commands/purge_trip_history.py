@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.retention import (
+    expired_plans, finished_jobs, purge_expired_plans, purge_finished_jobs, purge_history, purge_queryset, retention_policy,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete trip history beyond the retention policy (HISTORY_RETENTION_DAYS / "
+        "HISTORY_RETENTION_MAX_ROWS), trip plans older than TRIP_PLAN_TTL and jobs finished more than "
+        "TRIP_JOB_RETENTION_DAYS ago in small batches. "
+        "Safe to run from cron while the API is serving."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Delete entries older than this many days.')
+        parser.add_argument('--max-rows', type=int, help='Keep only the newest this many entries.')
+        parser.add_argument('--all', action='store_true', help='Delete every entry.')
+        parser.add_argument('--batch-size', type=int, default=settings.HISTORY_PURGE_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=settings.HISTORY_PURGE_BATCH_PAUSE,
+                            help='Seconds to sleep between batches.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many entries would be deleted.')
+
+    def handle(self, *args, **options):
+        queryset = None
+        if options['all']:
+            queryset = purge_queryset()
+        else:
+            days, max_rows = retention_policy()
+            if options['days'] is not None:
+                days = options['days']
+            if options['max_rows'] is not None:
+                max_rows = options['max_rows']
+            if (days is not None and days < 0) or (max_rows is not None and max_rows < 0):
+                raise CommandError("--days and --max-rows must not be negative.")
+            if days is None and max_rows is None:
+                # Expired plans and old jobs are still deleted, so the command can run from cron either way
+                self.stdout.write(
+                    "No retention limit configured (--days, --max-rows, --all or HISTORY_RETENTION_DAYS / "
+                    "HISTORY_RETENTION_MAX_ROWS); trip history is kept"
+                )
+            else:
+                queryset = purge_queryset(older_than_days=days, keep_rows=max_rows)
+
+        if options['dry_run']:
+            if queryset is not None:
+                self.stdout.write(f"{queryset.count()} trip history entries would be deleted")
+            self.stdout.write(f"{expired_plans().count()} expired trip plans would be deleted")
+            self.stdout.write(f"{finished_jobs().count()} finished trip jobs would be deleted")
+            return
+
+        def progress(deleted, estimate):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Deleted {deleted} of ~{estimate}")
+
+        if queryset is not None:
+            deleted = purge_history(queryset, batch_size=options['batch_size'], pause=options['pause'], progress=progress)
+            self.stdout.write(f"Deleted {deleted} trip history entries")
+        deleted = purge_expired_plans(batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(f"Deleted {deleted} expired trip plans")
+        deleted = purge_finished_jobs(batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(f"Deleted {deleted} finished trip jobs")
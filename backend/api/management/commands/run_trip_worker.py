@@ -0,0 +1,59 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.jobs import process_job, requeue_stale_jobs, worker_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued trip jobs from /api/jobs/. Start any number of these, on any host sharing the "
+        "database, and set TRIP_JOB_EXECUTOR=external so web processes only queue jobs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.TRIP_JOB_WORKERS,
+                            help='Jobs run at the same time by this process.')
+        parser.add_argument('--poll-interval', type=float, default=settings.TRIP_JOB_POLL_INTERVAL,
+                            help='Seconds to wait before checking an empty queue again.')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        poll_interval = options['poll_interval']
+
+        def work():
+            name = worker_name()
+            while not stop.is_set():
+                try:
+                    job = process_job(worker=name)
+                except Exception as e:
+                    self.stderr.write(f"Trip worker {name} error: {str(e)}")
+                    job = None
+                if job is not None:
+                    self.stdout.write(f"Job {job.id}: {job.status}")
+                elif options['once']:
+                    return
+                else:
+                    stop.wait(poll_interval)
+
+        threads = [
+            threading.Thread(target=work, name=f"trip-worker-{i}", daemon=True)
+            for i in range(max(1, options['concurrency']))
+        ]
+        requeue_stale_jobs()
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Trip worker running {len(threads)} job(s) at a time")
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=poll_interval)
+                if not options['once']:
+                    requeue_stale_jobs()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping after the running jobs finish")
+            stop.set()
+            for thread in threads:
+                thread.join()
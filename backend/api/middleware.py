@@ -0,0 +1,58 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .logic import metrics
+
+
+class ServerTimingMiddleware:
+    """Trace every request: collect phase spans, record latency metrics and add a ``Server-Timing`` header.
+
+    Works under both WSGI and ASGI. DRF responses are rendered after the view
+    returns, so their render time is reported separately as ``serialize``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings, token = metrics.begin_request()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self._finish(request, response, timings, started)
+
+    async def __acall__(self, request):
+        timings, token = metrics.begin_request()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self._finish(request, response, timings, started)
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+        response.add_post_render_callback(lambda rendered: metrics.record_phase('serialize', time.perf_counter() - started))
+        return response
+
+    def _finish(self, request, response, timings, started):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        metrics.inc('http_requests_total', view=view, status=response.status_code)
+        metrics.observe('http_request_seconds', elapsed, view=view)
+        if settings.SERVER_TIMING_ENABLED:
+            response['Server-Timing'] = metrics.server_timing_header(timings, elapsed)
+        return response
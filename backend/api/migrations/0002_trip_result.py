@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='triphistory',
+            name='result_data',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='triphistory',
+            name='result_encoding',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:49
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_trip_result'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=16)),
+                ('start_location', models.CharField(max_length=255)),
+                ('pickup_location', models.CharField(max_length=255)),
+                ('dropoff_location', models.CharField(max_length=255)),
+                ('cycle_hours_used', models.FloatField()),
+                ('request_data', models.JSONField(blank=True, default=dict)),
+                ('callback_url', models.URLField(blank=True, default='', max_length=500)),
+                ('callback_status', models.CharField(blank=True, default='', max_length=64)),
+                ('result_data', models.BinaryField(blank=True, null=True)),
+                ('result_encoding', models.CharField(blank=True, default='', max_length=16)),
+                ('error', models.TextField(blank=True, default='')),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('worker', models.CharField(blank=True, default='', max_length=128)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('history_entry', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.triphistory')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='api_tripjob_status_created')],
+            },
+        ),
+    ]
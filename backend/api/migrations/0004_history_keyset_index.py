@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_tripjob'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='triphistory',
+            options={'ordering': ['-created_at', '-id'], 'verbose_name_plural': 'Trip Histories'},
+        ),
+        migrations.AddIndex(
+            model_name='triphistory',
+            index=models.Index(fields=['created_at', 'id'], name='api_triphistory_created_id'),
+        ),
+    ]
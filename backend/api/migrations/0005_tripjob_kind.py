@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_history_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tripjob',
+            name='kind',
+            field=models.CharField(choices=[('trip', 'Trip calculation'), ('history_purge', 'History purge')], default='trip', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='tripjob',
+            name='progress',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:13
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_tripjob_kind'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripPlan',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('start_location', models.CharField(max_length=255)),
+                ('pickup_location', models.CharField(max_length=255)),
+                ('dropoff_location', models.CharField(max_length=255)),
+                ('plan_data', models.BinaryField()),
+                ('plan_encoding', models.CharField(blank=True, default='', max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='api_tripplan_created')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_tripplan'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tripjob',
+            name='cycle_hours_used',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='tripjob',
+            name='dropoff_location',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='tripjob',
+            name='pickup_location',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='tripjob',
+            name='start_location',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
@@ -1,15 +1,136 @@
+import json
+import uuid
+import zlib
+
+from django.conf import settings
 from django.db import models
 
+RESULT_ENCODING_JSON = 'json'
+RESULT_ENCODING_JSON_ZLIB = 'json+zlib'
+
+
+def encode_result(result):
+    """Serialize a calculate_trip result to compact JSON, zlib-compressed unless disabled."""
+    data = json.dumps(result, separators=(',', ':')).encode('utf-8')
+    if settings.TRIP_RESULT_COMPRESSION:
+        return zlib.compress(data, settings.TRIP_RESULT_COMPRESSION_LEVEL), RESULT_ENCODING_JSON_ZLIB
+    return data, RESULT_ENCODING_JSON
+
+
+def decode_result(data, encoding):
+    data = bytes(data)
+    if encoding == RESULT_ENCODING_JSON_ZLIB:
+        data = zlib.decompress(data)
+    return json.loads(data)
+
+
 class TripHistory(models.Model):
     start_location = models.CharField(max_length=255)
     pickup_location = models.CharField(max_length=255)
     dropoff_location = models.CharField(max_length=255)
     cycle_hours_used = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
+    # Computed calculate_trip result, so history reads don't re-run geocoding and routing
+    result_data = models.BinaryField(null=True, blank=True, editable=False)
+    result_encoding = models.CharField(max_length=16, blank=True, default='')
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
         verbose_name_plural = 'Trip Histories'
+        # Serves the keyset-paginated history list (see api/pagination.py)
+        indexes = [models.Index(fields=['created_at', 'id'], name='api_triphistory_created_id')]
     
     def __str__(self):
         return f"{self.start_location} → {self.pickup_location} → {self.dropoff_location} ({self.created_at.strftime('%Y-%m-%d %H:%M')})"
+
+    def store_result(self, result):
+        self.result_data, self.result_encoding = encode_result(result)
+
+    def load_result(self):
+        """Return the stored result, or None for entries saved before results were kept."""
+        if not self.result_data:
+            return None
+        return decode_result(self.result_data, self.result_encoding)
+
+
+class TripJob(models.Model):
+    """Background work run by a worker (see ``api/jobs.py``): a trip calculation or a history purge."""
+    KIND_TRIP = 'trip'
+    KIND_HISTORY_PURGE = 'history_purge'
+    KIND_CHOICES = [(KIND_TRIP, 'Trip calculation'), (KIND_HISTORY_PURGE, 'History purge')]
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_CANCELLED, 'Cancelled'),
+    ]
+    FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES, default=KIND_TRIP)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    # The trip to calculate; left empty by history purges
+    start_location = models.CharField(max_length=255, blank=True, default='')
+    pickup_location = models.CharField(max_length=255, blank=True, default='')
+    dropoff_location = models.CharField(max_length=255, blank=True, default='')
+    cycle_hours_used = models.FloatField(null=True, blank=True)
+    # Submitted payload: the trip request (echoed back as log_info) or the purge parameters
+    request_data = models.JSONField(default=dict, blank=True)
+    progress = models.JSONField(default=dict, blank=True)
+    callback_url = models.URLField(max_length=500, blank=True, default='')
+    callback_status = models.CharField(max_length=64, blank=True, default='')
+    result_data = models.BinaryField(null=True, blank=True, editable=False)
+    result_encoding = models.CharField(max_length=16, blank=True, default='')
+    # Raw calculate_trip error; mapped to a client-facing message when read
+    error = models.TextField(blank=True, default='')
+    history_entry = models.ForeignKey(TripHistory, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=128, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'], name='api_tripjob_status_created')]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
+
+    def store_result(self, result):
+        self.result_data, self.result_encoding = encode_result(result)
+
+    def load_result(self):
+        if not self.result_data:
+            return None
+        return decode_result(self.result_data, self.result_encoding)
+
+
+class TripPlan(models.Model):
+    """A trip's resolved locations and route legs (``HosCalculator.plan_trip``), kept for what-if re-scheduling."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    start_location = models.CharField(max_length=255)
+    pickup_location = models.CharField(max_length=255)
+    dropoff_location = models.CharField(max_length=255)
+    plan_data = models.BinaryField(editable=False)
+    plan_encoding = models.CharField(max_length=16, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['created_at'], name='api_tripplan_created')]
+
+    def __str__(self):
+        return f"Plan {self.id}: {self.start_location} → {self.pickup_location} → {self.dropoff_location}"
+
+    def store_plan(self, plan):
+        self.plan_data, self.plan_encoding = encode_result(plan)
+
+    def load_plan(self):
+        return decode_result(self.plan_data, self.plan_encoding)
@@ -0,0 +1,74 @@
+"""Keyset (cursor) pagination for the trip history list.
+
+Pages are ordered by ``(created_at, id)`` descending and a cursor is the
+position of the last row served, so fetching any page is an index range
+scan on ``api_triphistory_created_id`` however deep the client has paged.
+OFFSET paging would instead read and discard every earlier row.
+"""
+import json
+import base64
+import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def encode_cursor(created_at, pk):
+    raw = json.dumps([created_at.isoformat(), pk], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, id)``; raises ValueError for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, pk = json.loads(raw)
+        created_at = datetime.datetime.fromisoformat(created_at)
+        if timezone.is_naive(created_at) or not isinstance(pk, int):
+            raise ValueError
+        return created_at, pk
+    except (TypeError, ValueError, json.JSONDecodeError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor.')
+
+
+def parse_timestamp(value, name):
+    """Parse an ISO date or datetime query parameter as an aware datetime (naive values are UTC)."""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'{name} must be an ISO 8601 date or datetime.')
+        parsed = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+    return parsed
+
+
+def filter_history(queryset, params):
+    """Apply the ``q``, ``created_after`` (inclusive) and ``created_before`` (exclusive) filters."""
+    query = (params.get('q') or '').strip()
+    if query:
+        queryset = queryset.filter(
+            Q(start_location__icontains=query)
+            | Q(pickup_location__icontains=query)
+            | Q(dropoff_location__icontains=query)
+        )
+    if params.get('created_after'):
+        queryset = queryset.filter(created_at__gte=parse_timestamp(params['created_after'], 'created_after'))
+    if params.get('created_before'):
+        queryset = queryset.filter(created_at__lt=parse_timestamp(params['created_before'], 'created_before'))
+    return queryset
+
+
+def keyset_page(queryset, cursor, limit):
+    """Return ``(rows, next_cursor)`` for the page after ``cursor``; ``queryset`` yields dicts with created_at and id."""
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
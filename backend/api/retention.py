@@ -0,0 +1,124 @@
+"""Batched deletion of trip history.
+
+Rows are deleted oldest first in batches of ``HISTORY_PURGE_BATCH_SIZE``,
+each in its own short transaction with a pause in between. A purge of any
+size therefore never holds long locks, and concurrent history writes from
+trip calculations keep going while it runs. ``purge_trip_history`` applies
+the configured retention policy and deletes expired trip plans and old
+finished jobs;
+``DELETE /api/history/`` and ``POST /api/history/purge/`` run a purge as a
+background job.
+"""
+import time
+import datetime
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .logic import metrics
+from .models import TripHistory, TripJob, TripPlan
+
+logger = logging.getLogger(__name__)
+
+
+def purge_queryset(older_than_days=None, keep_rows=None, before=None):
+    """History rows selected for deletion; rows outside every given bound are kept.
+
+    ``older_than_days`` and ``keep_rows`` (keep only the newest N) come from the
+    retention policy; ``before`` caps the purge at a point in time, so a purge
+    of everything leaves rows written after it was requested.
+    """
+    conditions = []
+    if older_than_days is not None:
+        conditions.append(Q(created_at__lt=timezone.now() - datetime.timedelta(days=older_than_days)))
+    if keep_rows is not None:
+        boundary = (
+            TripHistory.objects.order_by('-created_at', '-id').values('created_at', 'id')[keep_rows:keep_rows + 1]
+        )
+        boundary = boundary[0] if boundary else None
+        if boundary is None:
+            conditions.append(Q(pk__in=[]))
+        else:
+            conditions.append(
+                Q(created_at__lt=boundary['created_at'])
+                | Q(created_at=boundary['created_at'], id__lte=boundary['id'])
+            )
+    queryset = TripHistory.objects.all()
+    if conditions:
+        either = conditions[0]
+        for condition in conditions[1:]:
+            either |= condition
+        queryset = queryset.filter(either)
+    if before is not None:
+        queryset = queryset.filter(created_at__lte=before)
+    return queryset
+
+
+def _delete_in_batches(queryset, counter, batch_size=None, pause=None, progress=None):
+    batch_size = batch_size or settings.HISTORY_PURGE_BATCH_SIZE
+    pause = settings.HISTORY_PURGE_BATCH_PAUSE if pause is None else pause
+    model = queryset.model
+    estimate = queryset.count()
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('created_at', 'id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            count = model.objects.filter(id__in=ids).delete()[1].get(model._meta.label, 0)
+        deleted += count
+        metrics.inc(counter, count)
+        if progress:
+            progress(deleted, max(estimate, deleted))
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def purge_history(queryset, batch_size=None, pause=None, progress=None):
+    """Delete ``queryset`` in bounded batches; calls ``progress(deleted, estimate)`` after each.
+
+    Returns the number of history rows deleted.
+    """
+    deleted = _delete_in_batches(queryset, 'history_rows_purged_total', batch_size, pause, progress)
+    logger.info(f"Purged {deleted} trip history rows")
+    return deleted
+
+
+def expired_plans():
+    """Trip plans older than ``TRIP_PLAN_TTL``; they can no longer be re-scheduled."""
+    return TripPlan.objects.filter(created_at__lt=timezone.now() - datetime.timedelta(seconds=settings.TRIP_PLAN_TTL))
+
+
+def purge_expired_plans(batch_size=None, pause=None):
+    """Delete expired trip plans in bounded batches; returns how many were deleted."""
+    deleted = _delete_in_batches(expired_plans(), 'trip_plans_purged_total', batch_size, pause)
+    logger.info(f"Purged {deleted} expired trip plans")
+    return deleted
+
+
+def finished_jobs():
+    """Jobs that finished more than ``TRIP_JOB_RETENTION_DAYS`` ago; none when that is 0."""
+    if not settings.TRIP_JOB_RETENTION_DAYS:
+        return TripJob.objects.none()
+    return TripJob.objects.filter(
+        status__in=TripJob.FINISHED_STATUSES,
+        finished_at__lt=timezone.now() - datetime.timedelta(days=settings.TRIP_JOB_RETENTION_DAYS),
+    )
+
+
+def purge_finished_jobs(batch_size=None, pause=None):
+    """Delete old finished jobs in bounded batches; returns how many were deleted."""
+    deleted = _delete_in_batches(finished_jobs(), 'trip_jobs_purged_total', batch_size, pause)
+    logger.info(f"Purged {deleted} finished trip jobs")
+    return deleted
+
+
+def retention_policy():
+    """``(older_than_days, keep_rows)`` from settings; None where that limit is off."""
+    return (settings.HISTORY_RETENTION_DAYS or None, settings.HISTORY_RETENTION_MAX_ROWS or None)
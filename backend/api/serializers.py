@@ -1,3 +1,4 @@
+from django.utils import timezone
 from rest_framework import serializers
 from .models import TripHistory
 
@@ -15,4 +16,30 @@ class TripHistorySerializer(serializers.ModelSerializer):
         fields = ['id', 'start_location', 'pickup_location', 'dropoff_location', 'cycle_hours_used', 'created_at', 'formatted_date']
     
     def get_formatted_date(self, obj):
-        return obj.created_at.strftime('%Y-%m-%d %H:%M')
\ No newline at end of file
+        return obj.created_at.strftime('%Y-%m-%d %H:%M')
+
+HISTORY_LIST_FIELDS = ('id', 'start_location', 'pickup_location', 'dropoff_location', 'cycle_hours_used', 'created_at')
+
+
+def serialize_history_rows(rows):
+    """Render ``.values(*HISTORY_LIST_FIELDS)`` rows exactly as ``TripHistorySerializer`` would.
+
+    Skips building model instances and per-field serializer calls, which
+    dominate the cost of listing history.
+    """
+    data = []
+    for row in rows:
+        created_at = row['created_at'].astimezone(timezone.get_current_timezone())
+        iso = created_at.isoformat()
+        if iso.endswith('+00:00'):
+            iso = iso[:-6] + 'Z'
+        data.append({
+            'id': row['id'],
+            'start_location': row['start_location'],
+            'pickup_location': row['pickup_location'],
+            'dropoff_location': row['dropoff_location'],
+            'cycle_hours_used': row['cycle_hours_used'],
+            'created_at': iso,
+            'formatted_date': f"{iso[:10]} {iso[11:16]}",
+        })
+    return data
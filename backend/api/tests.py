@@ -1,3 +1,1340 @@
-from django.test import TestCase
+import io
+import os
+import json
+import math
+import random
+import shutil
+import asyncio
+import contextvars
+import socket
+import time
+import datetime
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+import httpx
+import requests
+from requests import Response
+from requests.adapters import HTTPAdapter
+
+from .jobs import claim_job, deliver_callback, process_job
+from .logic import metrics
+from .logic.batch_schedule import schedule_batch
+from .logic.cache import NOT_FOUND, GeocodeCache, LRUCache, PlaceCache, RouteCache
+from .logic.concurrency import run_concurrently
+from .logic.duty_log import STATUS_NAMES
+from .logic.geometry import apply_geometry_options, encode_polyline, parse_geometry_options, simplify
+from .logic.hos_calculator import SPLIT_LEG_METERS, HosCalculator
+from .logic.metrics import MetricsRegistry
+from .logic.ors_client import AsyncOrsClient, OrsClient, get_async_ors_client, get_ors_client, set_async_ors_client, set_ors_client
+from .logic.ors_standin import DETOUR_FACTOR, KNOWN_PLACES, PROFILE_SPEEDS, US_BOUNDS, OrsStandIn, StandInClient
+from .logic.poi_index import PoiIndex, load_poi_index
+from .logic.resilience import CircuitBreaker, OrsGuard, OrsUnavailable, RateLimiter, set_ors_guard
+from .logic.route_index import METERS_PER_MILE, RouteIndex
+from .logic.singleflight import SharedFlight, SingleFlight
+from .logic.stop_order import order_stops, path_cost
+from .models import TripHistory, TripJob, TripPlan
+from .pagination import decode_cursor, encode_cursor
+from .retention import finished_jobs, purge_expired_plans, purge_history, purge_queryset
+from .views import validate_callback_url
+
+
+def _location(name):
+    return {'coordinates': '0,0', 'lat': 0, 'lng': 0, 'name': name, 'formatted_name': name}
+
+
+class ClosedFormEngineTests(SimpleTestCase):
+    """Differential tests: the closed-form engine must reproduce the reference loop exactly."""
+
+    start_times = [
+        datetime.datetime(2025, 3, 9, 6, 0),
+        datetime.datetime(2025, 3, 9, 17, 45),
+        datetime.datetime(2025, 3, 9, 23, 30),
+    ]
+
+    def setUp(self):
+        self.calculator = HosCalculator('test-key', ors_client=object())
+
+    def cases(self):
+        hour = 3600
+        for start_to_pickup in [0, 1800, 3 * hour, 8 * hour, 11 * hour, 12345.6]:
+            for pickup_to_dropoff in [100.5, 2.5 * hour, 8 * hour, 20 * hour, 45 * hour]:
+                total = start_to_pickup + pickup_to_dropoff
+                for cycle_hours_used in [0, 10, 55.5, 69, 70]:
+                    for fuel_stop_times in [
+                        [],
+                        [total / 3, total * 2 / 3],
+                        # Stops landing on the pickup and on break/reset boundaries
+                        [t for t in (start_to_pickup, 8 * hour, 11 * hour, 19 * hour, 30 * hour) if 0 < t < total],
+                    ]:
+                        yield start_to_pickup, pickup_to_dropoff, fuel_stop_times, cycle_hours_used
+        rnd = random.Random(7)
+        for _ in range(400):
+            start_to_pickup = rnd.choice([0, rnd.uniform(0, 30 * hour)])
+            pickup_to_dropoff = rnd.uniform(60, 120 * hour)
+            total = start_to_pickup + pickup_to_dropoff
+            yield (
+                start_to_pickup,
+                pickup_to_dropoff,
+                sorted(rnd.uniform(0, total) for _ in range(rnd.randint(0, 6))),
+                rnd.choice([0, 70, rnd.uniform(0, 70)]),
+            )
+
+    def assertSameLogs(self, *args):
+        start, pickup, dropoff = _location('Start'), _location('Pickup'), _location('Dropoff')
+        start_to_pickup, pickup_to_dropoff, *rest = args
+        locations, legs = [start, pickup, dropoff], [start_to_pickup, pickup_to_dropoff]
+        expected = self.calculator._schedule_trip_loop(locations, legs, ['Pickup Stop'], *rest).render()
+        actual = self.calculator._schedule_trip_closed_form(locations, legs, ['Pickup Stop'], *rest).render()
+        # Compare serialized output so int/float differences would also be caught
+        self.assertEqual(json.dumps(actual), json.dumps(expected), msg=f"inputs={args}")
+
+    def test_matches_loop_engine(self):
+        for start_time in self.start_times:
+            for start_to_pickup, pickup_to_dropoff, fuel_stop_times, cycle_hours_used in self.cases():
+                self.assertSameLogs(start_to_pickup, pickup_to_dropoff, fuel_stop_times, cycle_hours_used, start_time)
+
+    def test_regular_days_are_emitted_whole(self):
+        events = self.calculator._plan_closed_form(['Start', 'Pickup', 'Dropoff'], [3600, 200 * 3600], ['Pickup Stop'], [], 0)
+        pattern = [STATUS_NAMES[event[0]] for event in events]
+        self.assertIn(['Driving', 'Off Duty', 'Driving', 'Sleeper Berth'] * 3, [pattern[i:i + 12] for i in range(len(pattern))])
+        self.assertIn('34-hour Restart', [event[2] for event in events])
+
+    def test_multi_stop_matches_loop_engine(self):
+        rnd = random.Random(11)
+        for _ in range(150):
+            count = rnd.randint(2, 8)
+            legs = [rnd.choice([0, rnd.uniform(60, 30 * 3600)]) for _ in range(count)]
+            locations = [_location(f'Stop {i}') for i in range(count + 1)]
+            descriptions = [rnd.choice(['Pickup Stop', 'Dropoff Stop']) for _ in range(count - 1)]
+            fuel_stop_times = sorted(rnd.uniform(0, sum(legs)) for _ in range(rnd.randint(0, 4)))
+            args = (locations, legs, descriptions, fuel_stop_times, rnd.uniform(0, 70), self.start_times[0])
+            expected = self.calculator._schedule_trip_loop(*args).render()
+            actual = self.calculator._schedule_trip_closed_form(*args).render()
+            self.assertEqual(json.dumps(actual), json.dumps(expected), msg=f"legs={legs}")
+
+
+class StopOrderTests(SimpleTestCase):
+    def test_respects_precedence_and_finds_short_route(self):
+        # Stops on a line; 3 must come after 4 even though it is nearer the start
+        positions = [0, 40, 10, 20, 30]
+        matrix = [[abs(a - b) for b in positions] for a in positions]
+        order = order_stops(matrix, {3: [4]})
+        self.assertEqual(order[0], 0)
+        self.assertLess(order.index(4), order.index(3))
+        self.assertEqual(path_cost(matrix, order), path_cost(matrix, [0, 2, 4, 1, 3]))
+
+
+class BatchScheduleTests(SimpleTestCase):
+    """Differential test: the vectorized batch engine must summarize the loop engine's logs exactly."""
+
+    def test_matches_loop_engine(self):
+        calculator = HosCalculator('test-key', ors_client=object())
+        rnd = random.Random(5)
+        trips = []
+        for _ in range(300):
+            legs = [rnd.choice([0, rnd.uniform(0, 30 * 3600), rnd.randint(0, 40) * 1800]),
+                    rnd.choice([rnd.uniform(60, 120 * 3600), rnd.randint(1, 200) * 1800])]
+            fuel_stop_times = sorted(rnd.uniform(0, sum(legs)) for _ in range(rnd.randint(0, 4)))
+            trips.append((
+                legs, rnd.choice([0, 70, rnd.uniform(0, 70)]),
+                datetime.datetime(2025, 3, 9, rnd.randint(0, 23), rnd.choice([0, 30, 17])), fuel_stop_times,
+            ))
+        result = schedule_batch(
+            [trip[0] for trip in trips], [trip[1] for trip in trips], [trip[2] for trip in trips],
+            [trip[3] + [float('nan')] * (4 - len(trip[3])) for trip in trips],
+        )
+        for i, (legs, cycle_hours_used, start_time, fuel_stop_times) in enumerate(trips):
+            locations = [_location('Start'), _location('Pickup'), _location('Dropoff')]
+            logs = calculator._schedule_trip_loop(locations, legs, ['Pickup Stop'], fuel_stop_times, cycle_hours_used, start_time).render()
+            events = [event for day_log in logs for event in day_log['events'] if event['start_time']]
+            arrival = datetime.datetime.fromisoformat(events[-1]['start_time']) + datetime.timedelta(seconds=events[-1]['duration'])
+            descriptions = [event['description'] for event in events]
+            expected = (
+                len(logs), arrival,
+                descriptions.count('10-hour Reset') + descriptions.count('10-hour Reset (Part 1)'),
+                descriptions.count('34-hour Restart') + descriptions.count('34-hour Restart (Part 1)'),
+            )
+            actual = (
+                int(result['total_days'][i]), result['arrival_time'][i].astype(datetime.datetime),
+                int(result['resets'][i]), int(result['restarts'][i]),
+            )
+            self.assertEqual(actual, expected, msg=f"trip={trips[i]}")
+
+
+class GeocodeCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_unknown_locations_expire_sooner(self):
+        cache = GeocodeCache(max_entries=10, ttl=3600, negative_ttl=60, alias='')
+        denver = {'coordinates': '-104.99,39.74', 'lat': 39.74, 'lng': -104.99}
+        cache.set('Denver, CO', denver)
+        cache.set('Nowhere', NOT_FOUND)
+        self.assertIs(cache.get('nowhere'), NOT_FOUND)
+        with mock.patch('api.logic.cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get('Nowhere'))
+            self.assertEqual(cache.get('  denver,   co '), denver)
+
+    def test_shared_tier_serves_other_workers(self):
+        denver = {'coordinates': '-104.99,39.74', 'lat': 39.74, 'lng': -104.99}
+        GeocodeCache(max_entries=10, alias='default').set('Denver, CO', denver)
+        GeocodeCache(max_entries=10, alias='default').set('Nowhere', NOT_FOUND)
+        other = GeocodeCache(max_entries=10, alias='default')
+        self.assertEqual(other.get('denver, co'), denver)
+        self.assertIs(other.get('Nowhere'), NOT_FOUND)
+        self.assertEqual(other.get('Boise, ID'), None)
+        self.assertEqual((other.stats['shared_hits'], other.stats['misses']), (1, 1))
+        # Promoted to the local tier
+        other.get('Denver, CO')
+        self.assertEqual(other.stats['local_hits'], 1)
+
+
+def _route(points, meters=1000.0):
+    return {'distance_meters': meters, 'duration_seconds': meters / 20, 'geometry': [[-100 + i / 1000, 40.0] for i in range(points)]}
+
+
+class RouteCacheTests(SimpleTestCase):
+    def test_lru_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_round_trip_and_lane_rounding(self):
+        cache = RouteCache(max_bytes=10 ** 6, ttl=3600, precision=4, max_entries=100)
+        lane = cache.lane_key('-104.990001,39.739999', [-105.0, 40.0])
+        self.assertEqual(lane, cache.lane_key([-104.99, 39.74], '-105.00002,40.00001'))
+        route = _route(50)
+        cache.set(lane, 'driving-hgv', route)
+        self.assertEqual(cache.get(lane, 'driving-hgv'), route)
+        self.assertIsNone(cache.get(lane, 'driving-car'))
+
+    def test_byte_budget_evicts_oldest_routes(self):
+        probe = RouteCache(max_bytes=10 ** 6, ttl=3600, precision=4, max_entries=100)
+        probe.set((0, 0, 0, 1), 'driving-hgv', _route(1000))
+        size = probe.routes.current_bytes
+        cache = RouteCache(max_bytes=int(size * 2.5), ttl=3600, precision=4, max_entries=100)
+        for i in range(3):
+            cache.set((0, 0, 0, i), 'driving-hgv', _route(1000))
+        self.assertEqual(len(cache.routes), 2)
+        self.assertLessEqual(cache.routes.current_bytes, cache.routes.max_bytes)
+        self.assertIsNone(cache.get((0, 0, 0, 0), 'driving-hgv'))
+        self.assertIsNotNone(cache.get((0, 0, 0, 2), 'driving-hgv'))
+
+    def test_expired_routes_only_served_stale(self):
+        cache = RouteCache(max_bytes=10 ** 6, ttl=60, precision=4, max_entries=100)
+        cache.set((0, 0, 0, 1), 'driving-hgv', _route(10))
+        with mock.patch('api.logic.cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(cache.get((0, 0, 0, 1), 'driving-hgv'))
+            self.assertEqual(cache.get((0, 0, 0, 1), 'driving-hgv', allow_stale=True), _route(10))
+
+
+class ConcurrencyTests(SimpleTestCase):
+    def test_calls_overlap_and_keep_their_order(self):
+        # Each call waits for the other two, so this only returns if all three run at once
+        barrier = threading.Barrier(3, timeout=5)
+
+        def call(value):
+            barrier.wait()
+            return value
+
+        self.assertEqual(run_concurrently([(call, 'start'), (call, 'pickup'), (call, 'dropoff')]), ['start', 'pickup', 'dropoff'])
+
+    def test_earliest_failure_is_raised(self):
+        def fail(message, delay):
+            time.sleep(delay)
+            raise ValueError(message)
+
+        for concurrent in (True, False):
+            with self.assertRaisesMessage(ValueError, 'start'):
+                run_concurrently([(fail, 'start', 0.05), (fail, 'pickup', 0)], concurrent=concurrent)
+
+    def test_workers_close_their_db_connections(self):
+        with mock.patch('api.logic.concurrency.connections') as connections:
+            threads = run_concurrently([(threading.get_ident,), (threading.get_ident,)])
+            self.assertNotIn(threading.get_ident(), threads)
+            self.assertEqual(connections.close_all.call_count, 2)
+            run_concurrently([(threading.get_ident,), (threading.get_ident,)], concurrent=False)
+            self.assertEqual(connections.close_all.call_count, 2)
+
+    def test_calls_share_one_pool_and_nested_calls_run_inline(self):
+        def outer():
+            return threading.current_thread(), run_concurrently([(threading.current_thread,), (threading.current_thread,)])
+
+        (first, nested), (second, _) = run_concurrently([(outer,), (outer,)])
+        self.assertEqual(nested, [first, first])
+        self.assertTrue(first.name.startswith('ors-call') and second.name.startswith('ors-call'))
+        pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ors-call')
+        self.addCleanup(pool.shutdown)
+        with mock.patch('api.logic.concurrency._pool', pool):
+            # A full pool still finishes: the nested calls don't wait for a free thread
+            self.assertEqual(len(run_concurrently([(outer,)] * 4)), 4)
+
+    def test_calls_see_the_callers_context(self):
+        request_id = contextvars.ContextVar('request_id')
+        request_id.set('abc')
+        self.assertEqual(run_concurrently([(request_id.get,), (request_id.get,)]), ['abc', 'abc'])
+
+
+def _ok(adapter, request, **kwargs):
+    response = Response()
+    response.status_code = 200
+    response._content = b'{}'
+    response.request = request
+    return response
+
+
+class OrsClientTests(SimpleTestCase):
+    def test_shared_client_reuses_its_pooled_session(self):
+        client = get_ors_client('test-key')
+        self.assertIs(get_ors_client('test-key'), client)
+        self.assertIsNot(get_ors_client('other-key'), client)
+        with mock.patch.object(HTTPAdapter, 'send', autospec=True, side_effect=_ok) as send:
+            client.geocode_search('Denver')
+            client.directions('driving-hgv', '-105.0,40.0', '-104.0,39.0')
+        # Both calls went through the one adapter, and so its connection pool
+        self.assertIs(send.call_args_list[0].args[0], send.call_args_list[1].args[0])
+        self.assertIs(send.call_args_list[0].args[0], client.session.get_adapter('https://'))
+
+    def test_endpoint_timeouts_and_gzip(self):
+        client = OrsClient('test-key', base_url='https://ors.test', timeouts={'geocode': 3, 'directions': 20})
+        with mock.patch.object(HTTPAdapter, 'send', autospec=True, side_effect=_ok) as send:
+            client.geocode_search('Denver')
+            client.geocode_reverse(39.74, -104.99)
+            client.directions('driving-hgv', '-105.0,40.0', '-104.0,39.0')
+        timeouts = [call.kwargs['timeout'] for call in send.call_args_list]
+        self.assertEqual(timeouts, [3, client.timeouts['reverse'], 20])
+        for call in send.call_args_list:
+            self.assertEqual(call.args[1].headers['Accept-Encoding'], 'gzip, deflate')
+
+
+@override_settings(ORS_API_KEY='test-key', TRIP_RESULT_COMPRESSION=True)
+class HistoryDetailTests(TestCase):
+    stored = {'trip_summary': {'total_days': 3}}
+    fresh = {'trip_summary': {'total_days': 4}}
+
+    def entry(self, result=None):
+        entry = TripHistory(start_location='Chicago, IL', pickup_location='Denver, CO', dropoff_location='Los Angeles, CA', cycle_hours_used=10)
+        if result is not None:
+            entry.store_result(result)
+        entry.save()
+        return entry
+
+    def get(self, entry, query=''):
+        with mock.patch('api.views.HosCalculator.calculate_trip', return_value=self.fresh) as calculate:
+            response = self.client.get(f'/api/history/{entry.id}/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json(), calculate
+
+    def test_serves_the_stored_result(self):
+        entry = self.entry(self.stored)
+        self.assertEqual(entry.result_encoding, 'json+zlib')
+        body, calculate = self.get(entry)
+        calculate.assert_not_called()
+        self.assertEqual(body['trip_summary'], self.stored['trip_summary'])
+        self.assertEqual(body['history_entry']['id'], entry.id)
+
+    def test_recompute_replaces_the_stored_result(self):
+        entry = self.entry(self.stored)
+        body, calculate = self.get(entry, '?recompute=1')
+        calculate.assert_called_once_with('Chicago, IL', 'Denver, CO', 'Los Angeles, CA', 10)
+        self.assertEqual(body['trip_summary'], self.fresh['trip_summary'])
+        self.assertEqual(TripHistory.objects.get(pk=entry.pk).load_result(), self.fresh)
+
+    def test_legacy_entries_are_calculated_and_stored(self):
+        entry = self.entry()
+        self.assertIsNone(entry.load_result())
+        body, calculate = self.get(entry)
+        calculate.assert_called_once()
+        self.assertEqual(body['trip_summary'], self.fresh['trip_summary'])
+        self.assertEqual(TripHistory.objects.get(pk=entry.pk).load_result(), self.fresh)
+        # Served from storage from now on
+        self.assertEqual(self.get(entry)[1].call_count, 0)
+
+
+class GeometryTests(SimpleTestCase):
+    def test_encode_polyline(self):
+        # The reference example from Google's encoded polyline documentation
+        points = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+        self.assertEqual(encode_polyline(points), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        self.assertEqual(encode_polyline([]), '')
+
+    def test_simplify(self):
+        line = [[-100 + i * 0.01, 40.0] for i in range(101)]
+        self.assertEqual(simplify(line, 0.001), [line[0], line[-1]])
+        # A 0.05 degree spike survives a smaller tolerance and is dropped under a larger one
+        spiked = line[:50] + [[-99.5, 40.05]] + line[51:]
+        self.assertEqual(simplify(spiked, 0.01), [line[0], line[49], [-99.5, 40.05], line[51], line[-1]])
+        self.assertEqual(simplify(spiked, 0.1), [line[0], line[-1]])
+        self.assertEqual(simplify(line[:2], 1), line[:2])
+
+    def test_per_leg_polyline_leaves_result_untouched(self):
+        result = {
+            'route_geometry': [[-100.0, 40.0], [-99.0, 40.0], [-98.0, 40.0]],
+            'route_legs': [{'name': 'start_to_pickup', 'point_count': 2}, {'name': 'pickup_to_dropoff', 'point_count': 1}],
+        }
+        options, error = parse_geometry_options({'geometry_format': 'polyline', 'per_leg': 'true'})
+        self.assertIsNone(error)
+        shaped = apply_geometry_options(result, options)
+        self.assertNotIn('route_geometry', shaped)
+        self.assertEqual([leg['geometry'] for leg in shaped['route_legs']], [
+            encode_polyline(result['route_geometry'][:2]), encode_polyline(result['route_geometry'][2:]),
+        ])
+        self.assertEqual(len(result['route_geometry']), 3)
+        self.assertEqual(parse_geometry_options({'zoom': 23})[1], 'zoom must be between 0 and 22.')
+
+
+class AsyncOrsClientTests(SimpleTestCase):
+    def test_client_is_shared_per_loop_and_closed_with_it(self):
+        async def clients():
+            return await get_async_ors_client('test-key'), await get_async_ors_client('test-key')
+
+        first, again = asyncio.run(clients())
+        self.assertIs(first, again)
+        self.assertTrue(first.client.is_closed)
+        self.assertIsNot(asyncio.run(clients())[0], first)
+
+
+class OrsStandInTests(SimpleTestCase):
+    def test_recorded_fixtures_replay_without_the_api_key(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        recorder = OrsStandIn(fixtures=directory, record_from='https://ors.test', record_key='secret-key')
+        with mock.patch('api.logic.ors_standin.requests.get') as get:
+            get.return_value = mock.Mock(status_code=200, json=lambda: {'features': ['recorded']})
+            self.assertEqual(recorder.handle('/geocode/search', {'text': 'Denver', 'api_key': 'secret-key'})[:2], (200, {'features': ['recorded']}))
+        self.assertEqual(get.call_args.kwargs['params'], {'text': 'Denver', 'api_key': 'secret-key'})
+        for name in os.listdir(directory):
+            with open(os.path.join(directory, name)) as handle:
+                self.assertNotIn('secret-key', handle.read())
+
+        replay = OrsStandIn(fixtures=directory, strict=True)
+        self.assertEqual(replay.handle('/geocode/search', {'text': 'Denver', 'api_key': 'other-key'})[:2], (200, {'features': ['recorded']}))
+        self.assertEqual(replay.handle('/geocode/search', {'text': 'Boise'})[0], 404)
+        self.assertEqual((replay.stats['fixture_hits'], replay.stats['synthetic']), (1, 0))
+
+    def test_synthetic_responses(self):
+        client = StandInClient()
+        denver = client.geocode_search('Denver, CO').json()['features'][0]['geometry']['coordinates']
+        self.assertEqual(denver, list(KNOWN_PLACES['denver']))
+        self.assertEqual(client.geocode_search('Nowhere, ND').json()['features'], [])
+        # Unknown places hash to the same spot in the lower 48 every time
+        somewhere = client.geocode_search('Smallville, KS').json()['features'][0]['geometry']['coordinates']
+        self.assertEqual(StandInClient().geocode_search('smallville ks').json()['features'][0]['geometry']['coordinates'], somewhere)
+        min_lng, min_lat, max_lng, max_lat = US_BOUNDS
+        self.assertTrue(min_lng <= somewhere[0] <= max_lng and min_lat <= somewhere[1] <= max_lat)
+
+        summary = client.directions('driving-hgv', '-104.99,39.739', '-87.63,41.878').json()['features'][0]['properties']['summary']
+        straight = HosCalculator('test-key', ors_client=client)._haversine_meters(39.739, -104.99, 41.878, -87.63)
+        self.assertAlmostEqual(summary['distance'], straight * DETOUR_FACTOR, delta=0.1)
+        self.assertAlmostEqual(summary['duration'], summary['distance'] / PROFILE_SPEEDS['driving-hgv'], delta=0.1)
+        route = client.directions_route('driving-hgv', [[-104.99, 39.739], [-94.579, 39.1], [-87.63, 41.878]]).json()
+        properties = route['features'][0]['properties']
+        self.assertEqual(len(properties['segments']), 2)
+        self.assertEqual(properties['way_points'][-1], len(route['features'][0]['geometry']['coordinates']) - 1)
+        matrix = client.matrix('driving-hgv', [[-104.99, 39.739], [-87.63, 41.878]]).json()
+        self.assertEqual(matrix['distances'][0][1], matrix['distances'][1][0])
+
+    def test_injected_errors_follow_the_seed(self):
+        def statuses(seed):
+            standin = OrsStandIn(error_rate=0.3, seed=seed)
+            return [standin.handle('/geocode/search', {'text': 'Denver'})[0] for _ in range(50)]
+
+        first = statuses(7)
+        self.assertEqual(statuses(7), first)
+        self.assertNotEqual(statuses(8), first)
+        self.assertEqual(set(first), {200, 503})
+        self.assertEqual(OrsStandIn(error_rate=1, error_status=429).handle('/geocode/search', {'text': 'Denver'})[:2],
+                         (429, {'error': {'code': 429, 'message': 'Injected error'}}))
+
+
+class MetricsTests(TestCase):
+    def test_registry_renders_counters_and_histograms(self):
+        registry = MetricsRegistry(buckets=(0.1, 1))
+        registry.inc('http_requests_total', view='trip-history', status=200)
+        registry.inc('http_requests_total', 2, view='trip-history', status=200)
+        registry.observe('http_request_seconds', 0.5, view='trip-history')
+        registry.register_gauge('queue_depth', lambda: [({'kind': 'trip'}, 3)], 'Queued jobs.')
+        self.assertEqual(registry.counter_value('http_requests_total', view='trip-history', status=200), 3)
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP http_requests_total API requests by view and response status.',
+            '# TYPE http_requests_total counter',
+            'http_requests_total{status="200",view="trip-history"} 3',
+            '# HELP http_request_seconds API request latency by view.',
+            '# TYPE http_request_seconds histogram',
+            'http_request_seconds_bucket{view="trip-history",le="0.1"} 0',
+            'http_request_seconds_bucket{view="trip-history",le="1"} 1',
+            'http_request_seconds_bucket{view="trip-history",le="+Inf"} 1',
+            'http_request_seconds_sum{view="trip-history"} 0.5',
+            'http_request_seconds_count{view="trip-history"} 1',
+            '# HELP queue_depth Queued jobs.',
+            '# TYPE queue_depth gauge',
+            'queue_depth{kind="trip"} 3',
+        ])
+
+    def test_server_timing_header(self):
+        self.assertEqual(
+            metrics.server_timing_header([('geocode', 0.01), ('route', 0.2), ('geocode', 0.02)], 0.25),
+            'geocode;dur=30.0;desc="x2", route;dur=200.0, total;dur=250.0',
+        )
+        response = self.client.get('/api/history/')
+        phases = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertEqual(phases[-2:], ['serialize', 'total'])
+        with override_settings(SERVER_TIMING_ENABLED=False):
+            self.assertNotIn('Server-Timing', self.client.get('/api/history/'))
+
+    def test_metrics_view_needs_a_token_outside_debug(self):
+        metrics.inc('http_requests_total', view='metrics-test', status=200)
+        with override_settings(DEBUG=True, METRICS_ENABLED=True, METRICS_TOKEN=None):
+            response = self.client.get('/metrics')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('http_requests_total{status="200",view="metrics-test"}', response.content.decode())
+        with override_settings(DEBUG=False, METRICS_ENABLED=True, METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with override_settings(DEBUG=False, METRICS_ENABLED=True, METRICS_TOKEN='scrape'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+        with override_settings(DEBUG=True, METRICS_ENABLED=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def run_followers(self, flight, key, fn, count=4):
+        """Start ``count`` threads calling ``flight.do(key, fn)``; returns their ``(value, shared)`` or exception."""
+        outcomes = [None] * count
+
+        def call(i):
+            try:
+                outcomes[i] = flight.do(key, fn)
+            except Exception as e:
+                outcomes[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, outcomes
+
+    def test_concurrent_calls_share_one_run(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            release.wait(5)
+            return {'days': 3}
+
+        threads, outcomes = self.run_followers(flight, 'trip', work)
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in outcomes), [False, True, True, True])
+        self.assertTrue(all(value is outcomes[0][0] for value, _ in outcomes))
+        # Nothing is remembered afterwards
+        self.assertEqual(flight.do('trip', lambda: 'again'), ('again', False))
+
+    def test_followers_get_the_leaders_error(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def fail():
+            release.wait(5)
+            raise ValueError('No route found')
+
+        threads, outcomes = self.run_followers(flight, 'trip', fail, count=3)
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(isinstance(outcome, ValueError) for outcome in outcomes))
+
+    def test_async_calls_share_one_task(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'result'
+
+        async def main():
+            return await asyncio.gather(*(flight.ado('trip', work) for _ in range(5)))
+
+        outcomes = asyncio.run(main())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(outcomes), [('result', False)] + [('result', True)] * 4)
+
+
+class SharedFlightTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_other_worker_waits_for_the_leaders_result(self):
+        started, release = threading.Event(), threading.Event()
+        leader_outcome = []
+
+        def lead():
+            def work():
+                started.set()
+                release.wait(5)
+                return {'days': 3}
+            leader_outcome.append(SharedFlight('default', poll_interval=0.01).do('trip', work))
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait(5)
+        threading.Timer(0.05, release.set).start()
+        value, shared = SharedFlight('default', poll_interval=0.01).do('trip', lambda: self.fail('computed twice'))
+        leader.join()
+        self.assertEqual((value, shared), ({'days': 3}, True))
+        self.assertEqual(leader_outcome, [({'days': 3}, False)])
+
+    def test_computes_itself_when_the_leader_vanishes(self):
+        flight = SharedFlight('default', poll_interval=0.01, wait=0.2)
+        caches['default'].add(flight._lock_key('trip'), 'gone', timeout=60)
+        threading.Timer(0.05, caches['default'].delete, args=[flight._lock_key('trip')]).start()
+        self.assertEqual(flight.do('trip', lambda: 'own'), ('own', False))
+        # A lock that never clears is waited out
+        caches['default'].add(flight._lock_key('stuck'), 'gone', timeout=60)
+        started = time.monotonic()
+        self.assertEqual(flight.do('stuck', lambda: 'own'), ('own', False))
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+
+class FakeClock:
+    """Stands in for the ``time`` module in ``api.logic.resilience``; ``sleep`` moves the clock on."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def patch(self):
+        return mock.patch('api.logic.resilience.time', SimpleNamespace(time=self.time, monotonic=self.monotonic, sleep=self.sleep))
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_bucket_bursts_then_waits_briefly_or_refuses(self):
+        limiter = RateLimiter({'directions': [(2, 60)]}, alias='default', max_wait=2.0)
+        clock = FakeClock(600000.0 + 10)
+        with clock.patch():
+            limiter.acquire('directions')
+            limiter.acquire('directions')
+            limiter.acquire('geocode')  # no quota configured
+            with self.assertRaises(OrsUnavailable):
+                limiter.acquire('directions')
+            self.assertEqual(limiter.remaining(), [({'endpoint': 'directions', 'window': '60s'}, 0)])
+            # A token comes back every 30s; one second short of it the caller waits instead
+            clock.now += 29
+            limiter.acquire('directions')
+            self.assertEqual(clock.now, 600000.0 + 40)
+            with self.assertRaises(OrsUnavailable):
+                limiter.acquire('directions')
+
+    def test_no_double_burst_across_a_minute_boundary(self):
+        limiter = RateLimiter({'directions': [(4, 60)]}, alias='default', max_wait=0)
+        clock = FakeClock(600000.0 + 59)
+        with clock.patch():
+            for _ in range(4):
+                limiter.acquire('directions')
+            clock.now += 2
+            with self.assertRaises(OrsUnavailable):
+                limiter.acquire('directions')
+            clock.now += 58
+            self.assertEqual(limiter.remaining(), [({'endpoint': 'directions', 'window': '60s'}, 4)])
+
+    def test_async_callers_share_the_bucket(self):
+        limiter = RateLimiter({'directions': [(2, 60)]}, alias='default', max_wait=0)
+        clock = FakeClock(600000.0)
+        with clock.patch():
+            limiter.acquire('directions')
+            asyncio.run(limiter.aacquire('directions'))
+            with self.assertRaises(OrsUnavailable):
+                asyncio.run(limiter.aacquire('directions'))
+
+    def test_broken_cache_lets_calls_through(self):
+        limiter = RateLimiter({'directions': [(1, 60)]}, alias='default')
+        with mock.patch.object(limiter, '_cache', return_value=mock.Mock(add=mock.Mock(side_effect=ConnectionError))):
+            limiter.acquire('directions')
+            limiter.acquire('directions')
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_opens_probes_and_closes(self):
+        breaker = CircuitBreaker('directions', failure_rate=0.5, min_calls=4, window=30, cooldown=30)
+        clock = FakeClock(1000.0)
+        with clock.patch():
+            for ok in (True, False, True):
+                breaker.record(ok)
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+            breaker.record(False)
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+            self.assertFalse(breaker.allow())
+
+            clock.now += 31
+            self.assertTrue(breaker.allow())  # the half-open probe
+            self.assertFalse(breaker.allow())
+            breaker.record(False)
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+            clock.now += 31
+            self.assertTrue(breaker.allow())
+            breaker.record(True)
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+            self.assertTrue(breaker.allow())
+
+    def test_old_outcomes_leave_the_window(self):
+        breaker = CircuitBreaker('directions', failure_rate=0.5, min_calls=4, window=30, cooldown=30)
+        clock = FakeClock(1000.0)
+        with clock.patch():
+            breaker.record(False)
+            breaker.record(False)
+            clock.now += 31
+            breaker.record(True)
+            breaker.record(True)
+            breaker.record(False)
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_other_workers_open_only_for_what_is_left(self):
+        first = CircuitBreaker('directions', min_calls=2, cooldown=30, alias='default')
+        second = CircuitBreaker('directions', min_calls=2, cooldown=30, alias='default')
+        clock = FakeClock(1000.0)
+        with clock.patch():
+            first.record(False)
+            first.record(False)
+            clock.now += 29
+            self.assertFalse(second.allow())
+            self.assertEqual(second.state, CircuitBreaker.OPEN)
+            clock.now += 1.5
+            self.assertTrue(second.allow())
+            self.assertEqual(second.state, CircuitBreaker.HALF_OPEN)
+
+    def test_shared_state_is_read_once_per_interval(self):
+        breaker = CircuitBreaker('directions', alias='default')
+        clock = FakeClock(1000.0)
+        with clock.patch(), mock.patch.object(caches['default'], 'get', wraps=caches['default'].get) as get:
+            for _ in range(5):
+                self.assertTrue(breaker.allow())
+            self.assertEqual(get.call_count, 1)
+            clock.now += CircuitBreaker.shared_check_interval
+            self.assertTrue(breaker.allow())
+            self.assertEqual(get.call_count, 2)
+
+    def test_async_callers_follow_other_workers(self):
+        first = CircuitBreaker('directions', min_calls=2, cooldown=30, alias='default')
+        second = CircuitBreaker('directions', min_calls=2, cooldown=30, alias='default')
+        clock = FakeClock(1000.0)
+        with clock.patch():
+            self.assertTrue(asyncio.run(second.aallow()))
+            asyncio.run(first.arecord(False))
+            asyncio.run(first.arecord(False))
+            # Within the check interval the broadcast isn't read yet
+            self.assertTrue(asyncio.run(second.aallow()))
+            clock.now += CircuitBreaker.shared_check_interval
+            self.assertFalse(asyncio.run(second.aallow()))
+            self.assertEqual(second.state, CircuitBreaker.OPEN)
+
+
+class OrsClientRetryTests(SimpleTestCase):
+    def setUp(self):
+        self.limiter = mock.Mock()
+        self.guard = OrsGuard(self.limiter, lambda endpoint: CircuitBreaker(endpoint, min_calls=100))
+        set_ors_guard(self.guard)
+        self.client = OrsClient('test-key', base_url='http://ors.test', retries=2, backoff_factor=0.1)
+        self.client.session.request = mock.Mock()
+
+    def tearDown(self):
+        set_ors_guard(None)
+
+    def responses(self, *statuses, retry_after=None):
+        headers = {'Retry-After': retry_after} if retry_after else {}
+        self.client.session.request.side_effect = [mock.Mock(status_code=code, headers=headers) for code in statuses]
+
+    def test_each_attempt_passes_the_guard(self):
+        self.responses(503, 502, 200)
+        with mock.patch('api.logic.ors_client.time.sleep') as sleep:
+            res = self.client.geocode_search('Denver')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.limiter.acquire.call_count, 3)
+        self.assertEqual([outcome for _, outcome in self.guard.breaker('geocode')._outcomes], [False, False, True])
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.1, 0.2])
+
+    def test_long_retry_after_fails_fast(self):
+        self.responses(429, retry_after='120')
+        with mock.patch('api.logic.ors_client.time.sleep') as sleep:
+            res = self.client.geocode_search('Denver')
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(self.client.session.request.call_count, 1)
+        sleep.assert_not_called()
+
+
+TRIP = {'start_location': 'Chicago, IL', 'pickup_location': 'Denver, CO', 'dropoff_location': 'Los Angeles, CA', 'cycle_hours_used': 10}
+
+
+class StandInTestCase(TestCase):
+    """View-level tests against the in-process ORS stand-in."""
+
+    def setUp(self):
+        set_ors_client(StandInClient())
+        self.addCleanup(set_ors_client, None)
+
+    def post_json(self, url, body):
+        return self.client.post(url, json.dumps(body), content_type='application/json')
+
+
+@override_settings(ORS_API_KEY='test-key', TRIP_JOB_EXECUTOR='external', EVENT_PLACE_NAMES=False, TRIP_JOB_CALLBACK_HOSTS=[])
+class TripJobTests(StandInTestCase):
+    def make_job(self):
+        return TripJob.objects.create(**TRIP)
+
+    def test_only_one_worker_claims_a_job(self):
+        first, second = self.make_job(), self.make_job()
+        claimed = claim_job(first.id, 'worker-1')
+        self.assertEqual((claimed.status, claimed.worker, claimed.attempts), (TripJob.STATUS_RUNNING, 'worker-1', 1))
+        self.assertIsNone(claim_job(first.id, 'worker-2'))
+        # Without an id the oldest job still queued is taken
+        self.assertEqual(claim_job(worker='worker-2').id, second.id)
+        self.assertIsNone(claim_job(worker='worker-3'))
+
+    def test_claims_race_on_the_status_update(self):
+        job = self.make_job()
+        # Another worker takes the job between this one listing candidates and updating
+        original = TripJob.objects.filter
+
+        def claimed_meanwhile(*args, **kwargs):
+            if kwargs.get('status') == TripJob.STATUS_QUEUED and 'pk' in kwargs:
+                original(pk=job.pk).update(status=TripJob.STATUS_RUNNING, worker='worker-2')
+            return original(*args, **kwargs)
+
+        with mock.patch.object(TripJob.objects, 'filter', side_effect=claimed_meanwhile):
+            self.assertIsNone(claim_job(worker='worker-1'))
+        self.assertEqual(TripJob.objects.get(pk=job.pk).worker, 'worker-2')
+
+    def test_job_runs_and_serves_the_trip(self):
+        response = self.post_json('/api/jobs/', {**TRIP, 'geometry_format': 'polyline'})
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()['status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], TripJob.STATUS_QUEUED)
+
+        job = process_job(response.json()['id'], worker='worker-1')
+        self.assertEqual(job.status, TripJob.STATUS_SUCCEEDED)
+        body = self.client.get(status_url).json()
+        self.assertEqual(body['history_id'], TripHistory.objects.get().id)
+        self.assertIsInstance(body['result']['route_geometry'], str)
+        self.assertEqual(body['result']['trip_summary'], self.post_json('/api/calculate-trip/', TRIP).json()['trip_summary'])
+
+    def test_failed_job_reports_a_client_message(self):
+        response = self.post_json('/api/jobs/', {**TRIP, 'start_location': 'nowhere 1'})
+        job = process_job(response.json()['id'], worker='worker-1')
+        self.assertEqual(job.status, TripJob.STATUS_FAILED)
+        body = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(body['error_status'], 400)
+        self.assertFalse(TripHistory.objects.exists())
+
+    def test_invalid_callback_url_is_rejected(self):
+        response = self.post_json('/api/jobs/', {**TRIP, 'callback_url': 'ftp://hooks.example.com/done'})
+        self.assertEqual(response.json(), {'error': 'Callback URL must be a valid http(s) URL.'})
+        response = self.post_json('/api/jobs/', {**TRIP, 'callback_url': 'http://127.0.0.1:8000/admin/'})
+        self.assertEqual(response.json(), {'error': 'Callback URL host is not allowed.'})
+        self.assertFalse(TripJob.objects.exists())
+
+
+def _resolves_to(*addresses):
+    return mock.patch('api.jobs.socket.getaddrinfo', return_value=[
+        (socket.AF_INET6 if ':' in address else socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (address, 443))
+        for address in addresses
+    ])
+
+
+class CallbackUrlTests(TestCase):
+    @override_settings(TRIP_JOB_CALLBACK_HOSTS=['hooks.example.com'])
+    def test_allowlist(self):
+        self.assertIsNone(validate_callback_url('https://hooks.example.com/done'))
+        self.assertEqual(validate_callback_url('https://other.example.com/done'), 'Callback URL host is not allowed.')
+
+    @override_settings(TRIP_JOB_CALLBACK_HOSTS=[])
+    def test_without_allowlist_only_public_addresses(self):
+        with _resolves_to('93.184.216.34', '2606:2800:220:1::'):
+            self.assertIsNone(validate_callback_url('https://hooks.example.com/done'))
+        for address in ['127.0.0.1', '10.1.2.3', '192.168.0.7', '169.254.169.254', '100.64.0.1', '::1', 'fd00::1', '::ffff:127.0.0.1']:
+            with _resolves_to('93.184.216.34', address):
+                self.assertEqual(validate_callback_url('https://hooks.example.com/done'), 'Callback URL host is not allowed.', msg=address)
+        with mock.patch('api.jobs.socket.getaddrinfo', side_effect=socket.gaierror):
+            self.assertEqual(validate_callback_url('https://nowhere.invalid/done'), 'Callback URL host is not allowed.')
+
+    @override_settings(TRIP_JOB_CALLBACK_HOSTS=[])
+    def test_delivery_rechecks_host(self):
+        job = TripJob.objects.create(
+            start_location='A', pickup_location='B', dropoff_location='C', cycle_hours_used=0,
+            status=TripJob.STATUS_SUCCEEDED, callback_url='https://hooks.example.com/done',
+        )
+        with _resolves_to('169.254.169.254'), mock.patch('api.jobs.requests.post') as post:
+            deliver_callback(job)
+        post.assert_not_called()
+        self.assertEqual(TripJob.objects.get(pk=job.pk).callback_status, 'refused')
+
+        with _resolves_to('93.184.216.34'), mock.patch('api.jobs.requests.post') as post:
+            post.return_value.status_code = 204
+            deliver_callback(job)
+        self.assertFalse(post.call_args.kwargs['allow_redirects'])
+        self.assertEqual(TripJob.objects.get(pk=job.pk).callback_status, '204')
+
+
+def _history(count, start=datetime.datetime(2025, 3, 1, tzinfo=datetime.timezone.utc), step=datetime.timedelta(hours=1)):
+    """``count`` history rows; pairs share a timestamp so the id tie-break matters."""
+    rows = [TripHistory.objects.create(
+        start_location=f'Start {i}', pickup_location='Denver, CO', dropoff_location='Los Angeles, CA', cycle_hours_used=0,
+    ) for i in range(count)]
+    for i, row in enumerate(rows):
+        TripHistory.objects.filter(pk=row.pk).update(created_at=start + step * (i // 2))
+    return rows
+
+
+class HistoryPaginationTests(TestCase):
+    def test_cursor_round_trip(self):
+        created_at = datetime.datetime(2025, 3, 1, 12, 30, 15, 250, tzinfo=datetime.timezone.utc)
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+        for cursor in ['', 'not-a-cursor', encode_cursor(created_at.replace(tzinfo=None), 42), encode_cursor(created_at, '42')]:
+            with self.assertRaisesMessage(ValueError, 'Invalid cursor.'):
+                decode_cursor(cursor)
+
+    def test_pages_cover_every_row_once(self):
+        _history(7)
+        expected = list(TripHistory.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        seen, url = [], '/api/history/?limit=3'
+        while True:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [entry['id'] for entry in response.json()]
+            cursor = response.get('X-Next-Cursor')
+            if not cursor:
+                break
+            self.assertIn(f'cursor={cursor}', response['Link'])
+            url = f'/api/history/?limit=3&cursor={cursor}'
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_is_a_client_error(self):
+        response = self.client.get('/api/history/?cursor=bm90LWpzb24')
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid cursor.'}))
+
+
+class HistoryRetentionTests(TestCase):
+    def aged(self, *days):
+        rows = _history(len(days))
+        for row, age in zip(rows, days):
+            TripHistory.objects.filter(pk=row.pk).update(created_at=timezone.now() - datetime.timedelta(days=age))
+        return [row.id for row in rows]
+
+    def test_older_than_days(self):
+        ids = self.aged(0.5, 1.5, 2.5, 3.5)
+        self.assertEqual(set(purge_queryset(older_than_days=2).values_list('id', flat=True)), set(ids[2:]))
+        self.assertEqual(purge_queryset(older_than_days=5).count(), 0)
+
+    def test_keep_rows_breaks_timestamp_ties_by_id(self):
+        _history(7)
+        newest = list(TripHistory.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        for keep in (0, 3, 4, 7, 10):
+            kept = set(newest) - set(purge_queryset(keep_rows=keep).values_list('id', flat=True))
+            self.assertEqual(kept, set(newest[:keep]), msg=f"keep_rows={keep}")
+
+    def test_limits_combine_and_before_caps_the_purge(self):
+        ids = self.aged(0.5, 1.5, 2.5, 3.5)
+        # Either limit selects a row for deletion
+        self.assertEqual(set(purge_queryset(older_than_days=3, keep_rows=2).values_list('id', flat=True)), set(ids[2:]))
+        before = timezone.now() - datetime.timedelta(days=1)
+        self.assertEqual(set(purge_queryset(before=before).values_list('id', flat=True)), set(ids[1:]))
+
+    def test_purges_in_batches(self):
+        ids = self.aged(0.5, 1.5, 2.5, 3.5, 4.5)
+        progress = []
+        deleted = purge_history(purge_queryset(older_than_days=1), batch_size=2, pause=0, progress=lambda *p: progress.append(p))
+        self.assertEqual(deleted, 4)
+        self.assertEqual(progress, [(2, 4), (4, 4)])
+        self.assertEqual(list(TripHistory.objects.values_list('id', flat=True)), ids[:1])
+
+    @override_settings(TRIP_JOB_EXECUTOR='external')
+    def test_clearing_history_runs_as_a_purge_job(self):
+        _history(3)
+        response = self.client.delete('/api/history/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Location'], response.json()['status_url'])
+        job = TripJob.objects.get(pk=response.json()['id'])
+        self.assertEqual(job.kind, TripJob.KIND_HISTORY_PURGE)
+        self.assertEqual((job.start_location, job.cycle_hours_used), ('', None))
+
+        process_job(job.id, worker='worker-1')
+        self.assertEqual(TripHistory.objects.count(), 0)
+        body = self.client.get(response['Location']).json()
+        self.assertEqual((body['status'], body['progress']), (TripJob.STATUS_SUCCEEDED, {'deleted': 3, 'estimated_total': 3}))
+
+    @override_settings(TRIP_JOB_RETENTION_DAYS=7)
+    def test_old_finished_jobs_are_purged(self):
+        def job(status, age_days):
+            job = TripJob.objects.create(**TRIP, status=status)
+            TripJob.objects.filter(pk=job.pk).update(finished_at=timezone.now() - datetime.timedelta(days=age_days))
+            return job.pk
+
+        kept = [job(TripJob.STATUS_SUCCEEDED, 1), job(TripJob.STATUS_RUNNING, 30)]
+        job(TripJob.STATUS_SUCCEEDED, 8)
+        job(TripJob.STATUS_FAILED, 30)
+        with override_settings(TRIP_JOB_RETENTION_DAYS=0):
+            self.assertEqual(finished_jobs().count(), 0)
+        out = io.StringIO()
+        call_command('purge_trip_history', '--dry-run', stdout=out)
+        self.assertIn('2 finished trip jobs would be deleted', out.getvalue())
+        call_command('purge_trip_history', '--pause', '0', stdout=out)
+        self.assertIn('Deleted 2 finished trip jobs', out.getvalue())
+        self.assertEqual(set(TripJob.objects.values_list('pk', flat=True)), set(kept))
+
+
+class RouteIndexTests(SimpleTestCase):
+    def setUp(self):
+        # On the equator, so lengths go with longitude; the second leg is driven slower
+        self.index = RouteIndex([
+            {'geometry': [[0, 0], [1, 0], [3, 0]], 'distance_meters': 1.5 * METERS_PER_MILE, 'duration_seconds': 300},
+            {'geometry': [[3, 0], [4, 0]], 'distance_meters': 1.0 * METERS_PER_MILE, 'duration_seconds': 200},
+        ])
+
+    def assertPosition(self, actual, lat, lng):
+        self.assertAlmostEqual(actual[0], lat)
+        self.assertAlmostEqual(actual[1], lng)
+
+    def test_position_at_time_interpolates_within_legs(self):
+        self.assertPosition(self.index.position_at_time(100), 0, 1)
+        self.assertPosition(self.index.position_at_time(150), 0, 1.5)
+        self.assertPosition(self.index.position_at_time(300), 0, 3)
+        self.assertPosition(self.index.position_at_time(400), 0, 3.5)
+        self.assertPosition(self.index.position_at_time(-5), 0, 0)
+        self.assertPosition(self.index.position_at_time(10 ** 6), 0, 4)
+        self.assertIsNone(RouteIndex([]).position_at_time(10))
+
+    def test_time_at_distance_and_milestones(self):
+        self.assertAlmostEqual(self.index.time_at_distance(1.5 * METERS_PER_MILE), 300)
+        self.assertAlmostEqual(self.index.time_at_distance(2 * METERS_PER_MILE), 400)
+        milestones = self.index.milestone_times(1)
+        self.assertEqual(len(milestones), 2)
+        self.assertAlmostEqual(milestones[0], 200)
+        self.assertAlmostEqual(milestones[1], 400)
+        # A milestone falling on the destination is not a stop
+        self.assertEqual(len(self.index.milestone_times(1.25)), 1)
+
+    def test_coincident_points_share_the_leg_evenly(self):
+        index = RouteIndex([{'geometry': [[5, 5], [5, 5], [5, 5]], 'distance_meters': 100, 'duration_seconds': 10}])
+        self.assertEqual(index.distances, [0.0, 50.0, 100.0])
+        self.assertEqual(index.total_time, 10)
+
+
+@override_settings(EVENT_PLACE_NAMES=True, PLACE_LOOKUPS_PER_REQUEST=8)
+class PlaceNameTests(SimpleTestCase):
+    def setUp(self):
+        self.ors = StandInClient()
+        self.calculator = HosCalculator(
+            'test-key', ors_client=self.ors, place_cache=PlaceCache(grid=0.5, alias=''), concurrent=False,
+        )
+
+    def trip(self, *points):
+        stop = {'formatted_name': 'Denver, CO'}
+        events = [{'location': 'Denver, CO', 'lat': 39.74, 'lng': -104.99}]
+        events += [{'location': 'En route', 'lat': lat, 'lng': lng} for lat, lng in points]
+        return {'start_location': stop, 'pickup_location': stop, 'dropoff_location': stop, 'logs': [{'events': events}]}
+
+    def name_places(self, *results):
+        with mock.patch.object(self.ors, 'geocode_reverse', wraps=self.ors.geocode_reverse) as reverse:
+            self.calculator._name_event_places(list(results))
+        return reverse.call_count
+
+    def places(self, result):
+        return [event.get('place') for event in result['logs'][0]['events']]
+
+    def test_events_in_a_cell_share_one_lookup(self):
+        first = self.trip((40.01, -100.01), (40.1, -100.1), (40.2, -99.9), (41.0, -100.0))
+        self.assertEqual(self.name_places(first), 2)
+        places = self.places(first)
+        self.assertEqual(places[0], 'Denver, CO')
+        self.assertEqual(len(set(places[1:4])), 1)
+        self.assertNotEqual(places[4], places[1])
+        # A second trip through the same cells is named from the cache
+        again = self.trip((39.9, -100.2), (41.1, -99.8))
+        self.assertEqual(self.name_places(again), 0)
+        self.assertEqual(self.places(again)[1:], [places[1], places[4]])
+
+    @override_settings(PLACE_LOOKUPS_PER_REQUEST=3)
+    def test_lookups_are_capped_per_request_not_per_trip(self):
+        trips = [self.trip(*[(30 + i, -100 + j) for i in range(2)]) for j in range(3)]
+        self.assertEqual(self.name_places(*trips), 3)
+        named = [place for trip in trips for place in self.places(trip)[1:] if place]
+        self.assertEqual(len(named), 3)
+
+    def test_failed_lookups_leave_events_unnamed_and_uncached(self):
+        result = self.trip((40.0, -100.0), (42.0, -100.0))
+        failing = {'lat': 42.0}
+
+        def reverse(lat, lng):
+            if lat == failing['lat']:
+                raise requests.exceptions.ConnectionError('unreachable')
+            return StandInClient().geocode_reverse(lat, lng)
+
+        with mock.patch.object(self.ors, 'geocode_reverse', side_effect=reverse):
+            self.calculator._name_event_places([result])
+        self.assertIsNotNone(self.places(result)[1])
+        self.assertIsNone(self.places(result)[2])
+        # The failed cell is looked up again next time
+        retry = self.trip((42.0, -100.0))
+        self.assertEqual(self.name_places(retry), 1)
+        self.assertIsNotNone(self.places(retry)[1])
+
+        # Any other failure is logged and the trip goes unnamed rather than failing
+        untouched = self.trip((44.0, -100.0))
+        with mock.patch.object(self.calculator.place_cache, 'get', side_effect=RuntimeError('cache down')):
+            self.assertEqual(self.name_places(untouched), 0)
+        self.assertIsNone(self.places(untouched)[1])
+
+    @override_settings(EVENT_PLACE_NAMES=False)
+    def test_off_unless_enabled(self):
+        result = self.trip((40.0, -100.0))
+        self.assertEqual(self.name_places(result), 0)
+        self.assertNotIn('place', result['logs'][0]['events'][1])
+
+
+class PoiIndexTests(SimpleTestCase):
+    def test_nearest_looks_across_bucket_edges(self):
+        index = PoiIndex([
+            (40.09, -104.95, 'Same cell', 'truck_stop'),
+            (39.99, -104.95, 'Cell below', 'truck_stop'),
+            (40.05, -105.02, 'Cell to the west', 'fuel'),
+        ], bucket_degrees=0.1)
+        found = index.nearest(40.01, -104.95, 8000)
+        self.assertEqual((found['name'], found['kind'], found['distance_meters']), ('Cell below', 'truck_stop', 2224))
+        self.assertEqual(index.nearest(40.05, -105.001, 8000)['name'], 'Cell to the west')
+        self.assertIsNone(index.nearest(40.01, -104.95, 1000))
+        self.assertIsNone(PoiIndex(bucket_degrees=0.1).nearest(40.0, -105.0, 8000))
+
+    def test_kind_filter(self):
+        index = PoiIndex([
+            (40.0, -105.0, 'Fuel only', 'fuel'),
+            (40.03, -105.0, 'Rest area', 'rest_area'),
+        ], bucket_degrees=0.1)
+        self.assertEqual(index.nearest(40.0, -105.0, 8000)['name'], 'Fuel only')
+        self.assertEqual(index.nearest(40.0, -105.0, 8000, kinds=('truck_stop', 'rest_area'))['name'], 'Rest area')
+        self.assertIsNone(index.nearest(40.0, -105.0, 8000, kinds=('truck_stop',)))
+
+    def test_loads_csv_with_default_kind(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write('name,lat,lng,kind\nPilot,40.0,-105.0,\nRest,40.1,-105.1,rest_area\n')
+        self.addCleanup(os.remove, handle.name)
+        index = load_poi_index(handle.name, bucket_degrees=0.1)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.nearest(40.0, -105.0, 100)['kind'], 'truck_stop')
+
+
+@override_settings(TRIP_PLAN_TTL=3600, ORS_API_KEY='test-key')
+class TripPlanExpiryTests(TestCase):
+    def make_plan(self, age_seconds):
+        plan = TripPlan(start_location='A', pickup_location='B', dropoff_location='C')
+        plan.store_plan({})
+        plan.save()
+        TripPlan.objects.filter(pk=plan.pk).update(created_at=timezone.now() - datetime.timedelta(seconds=age_seconds))
+        return plan
+
+    def test_expired_plans_are_refused_and_purged(self):
+        fresh, expired = self.make_plan(60), self.make_plan(7200)
+        response = self.client.post(reverse('trip-plan-schedule', args=[expired.id]), json.dumps({'cycle_hours_used': 10}), content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(purge_expired_plans(batch_size=1, pause=0), 1)
+        self.assertEqual(list(TripPlan.objects.values_list('id', flat=True)), [fresh.id])
+
+
+@override_settings(ORS_API_KEY='test-key', EVENT_PLACE_NAMES=False)
+class TripPlanTests(StandInTestCase):
+    def test_plan_is_rescheduled_without_routing(self):
+        created = self.post_json(reverse('trip-plans'), TRIP)
+        self.assertEqual(created.status_code, 201)
+        plan = created.json()
+        direct = self.post_json(reverse('calculate-trip'), TRIP).json()
+        self.assertEqual(plan['trip_summary'], direct['trip_summary'])
+        self.assertEqual(plan['logs'], direct['logs'])
+
+        ors = StandInClient()
+        set_ors_client(ors)
+        with mock.patch.object(ors.standin, 'handle', wraps=ors.standin.handle) as handle:
+            same = self.post_json(plan['schedule_url'], {'cycle_hours_used': TRIP['cycle_hours_used']}).json()
+            near_limit = self.post_json(plan['schedule_url'], {'cycle_hours_used': 69}).json()
+        handle.assert_not_called()
+        self.assertEqual((same['plan_id'], same['logs']), (plan['plan_id'], plan['logs']))
+        self.assertEqual(near_limit['trip_summary']['total_distance_miles'], plan['trip_summary']['total_distance_miles'])
+        self.assertIn('34-hour Restart', json.dumps(near_limit['logs']))
+        self.assertNotIn('34-hour Restart', json.dumps(plan['logs']))
+
+    def test_schedule_validates_input_and_configuration(self):
+        plan_id = self.post_json(reverse('trip-plans'), TRIP).json()['plan_id']
+        url = reverse('trip-plan-schedule', args=[plan_id])
+        response = self.post_json(url, {})
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Missing required fields: cycle_hours_used'}))
+        with override_settings(ORS_API_KEY=None):
+            response = self.post_json(url, {'cycle_hours_used': 10})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json(), {'error': 'Map service configuration error. Please contact support.'})
+
+
+@override_settings(ORS_API_KEY='test-key', EVENT_PLACE_NAMES=False)
+class TripBatchCalculatorTests(StandInTestCase):
+    def setUp(self):
+        super().setUp()
+        ors = StandInClient()
+        set_ors_client(ors)
+        self.handle = mock.patch.object(ors.standin, 'handle', wraps=ors.standin.handle).start()
+        self.addCleanup(mock.patch.stopall)
+        # Fresh caches, so every lookup the batch makes reaches the stand-in
+        mock.patch('api.logic.hos_calculator.get_geocode_cache', return_value=GeocodeCache(alias='')).start()
+        mock.patch('api.logic.hos_calculator.get_route_cache', return_value=RouteCache()).start()
+
+    def paths(self, prefix):
+        return [call.args[0] for call in self.handle.call_args_list if call.args[0].startswith(prefix)]
+
+    def test_locations_and_lanes_are_resolved_once_per_batch(self):
+        trips = [
+            TRIP,
+            {**TRIP, 'start_location': ' chicago,  IL', 'cycle_hours_used': 30},
+            {**TRIP, 'dropoff_location': 'Phoenix, AZ'},
+        ]
+        response = self.post_json(reverse('calculate-trips'), {'trips': trips})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['summary'], {'total': 3, 'succeeded': 3, 'failed': 0})
+        self.assertEqual([result['index'] for result in body['results']], [0, 1, 2])
+        # Chicago (in both spellings), Denver, Los Angeles and Phoenix
+        self.assertEqual(len(self.paths('/geocode/search')), 4)
+        # Chicago-Denver, Denver-Los Angeles and Denver-Phoenix
+        self.assertEqual(len(self.paths('/v2/directions/')), 3)
+        self.assertEqual(body['results'][0]['logs'], self.post_json(reverse('calculate-trip'), TRIP).json()['logs'])
+
+    def test_history_is_written_in_one_insert_and_failures_are_reported_per_trip(self):
+        trips = [TRIP, {**TRIP, 'pickup_location': 'Nowhere, ND'}, {'start_location': 'Chicago, IL'}, {**TRIP, 'cycle_hours_used': 5}]
+        with mock.patch.object(TripHistory.objects, 'bulk_create', wraps=TripHistory.objects.bulk_create) as bulk_create:
+            body = self.post_json(reverse('calculate-trips'), {'trips': trips}).json()
+        self.assertEqual(body['summary'], {'total': 4, 'succeeded': 2, 'failed': 2})
+        self.assertEqual([result['status'] for result in body['results']], [200, 400, 400, 200])
+        bulk_create.assert_called_once()
+        self.assertEqual(
+            list(TripHistory.objects.order_by('id').values_list('cycle_hours_used', flat=True)), [10, 5],
+        )
+
+    def test_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(self.post_json(reverse('calculate-trips'), {'trips': []}).status_code, 400)
+        with override_settings(BATCH_MAX_TRIPS=1):
+            response = self.post_json(reverse('calculate-trips'), {'trips': [TRIP, TRIP]})
+        self.assertEqual(response.json(), {'error': 'A batch may contain at most 1 trips.'})
+
+
+@override_settings(ORS_API_KEY='test-key', EVENT_PLACE_NAMES=False)
+class AsyncTripCalculatorTests(StandInTestCase):
+    def setUp(self):
+        super().setUp()
+        standin = OrsStandIn()
+
+        def answer(request):
+            status, body, _ = standin.handle(request.url.path, dict(request.url.params))
+            return httpx.Response(status, json=body)
+
+        client = AsyncOrsClient('test-key', base_url='http://ors.test')
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(answer))
+        set_async_ors_client(client)
+        self.addCleanup(set_async_ors_client, None)
+
+    def test_matches_the_sync_view_and_schedules_off_the_event_loop(self):
+        build = HosCalculator._build_trip_result
+        loops = []
+
+        def tracked(calculator, *args):
+            try:
+                loops.append(asyncio.get_running_loop())
+            except RuntimeError:
+                loops.append(None)
+            return build(calculator, *args)
+
+        with mock.patch.object(HosCalculator, '_build_trip_result', tracked):
+            response = self.post_json(reverse('calculate-trip-async'), TRIP)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(loops, [None])
+        direct = self.post_json(reverse('calculate-trip'), TRIP).json()
+        self.assertEqual(response.json()['trip_summary'], direct['trip_summary'])
+        self.assertEqual(response.json()['logs'], direct['logs'])
+        self.assertEqual(TripHistory.objects.count(), 2)
+
+    def test_rejects_bad_input(self):
+        response = self.client.post(reverse('calculate-trip-async'), b'[', content_type='application/json')
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Request body must be valid JSON.'}))
+        response = self.post_json(reverse('calculate-trip-async'), {**TRIP, 'cycle_hours_used': 'many'})
+        self.assertEqual(response.status_code, 400)
+
+
+def _point(lat, lng):
+    return {'coordinates': f'{lng},{lat}', 'lat': lat, 'lng': lng}
+
+
+class SplitLegTests(SimpleTestCase):
+    miami, anchorage = _point(25.7617, -80.1918), _point(61.2181, -149.9003)
+
+    def setUp(self):
+        self.ors = StandInClient()
+        self.calculator = HosCalculator(
+            'test-key', ors_client=self.ors, geocode_cache=GeocodeCache(alias=''), route_cache=RouteCache(),
+            place_cache=PlaceCache(alias=''), concurrent=False,
+        )
+
+    def test_stitch_legs_joins_shared_points_once(self):
+        leg = self.calculator._stitch_legs([
+            {'distance_meters': 100, 'duration_seconds': 10, 'geometry': [[0, 0], [1, 0]]},
+            {'distance_meters': 50, 'duration_seconds': 6, 'geometry': [[1, 0], [2, 0]]},
+            {'distance_meters': 25, 'duration_seconds': 3, 'geometry': [[2.1, 0], [3, 0]]},
+        ])
+        self.assertEqual(leg, {
+            'distance_meters': 175, 'duration_seconds': 19, 'geometry': [[0, 0], [1, 0], [2, 0], [2.1, 0], [3, 0]],
+        })
+
+    def test_split_waypoints_stay_under_the_margin(self):
+        with mock.patch.object(self.calculator, '_reverse_geocode_snap', side_effect=lambda lat, lng: (lat, lng, None)):
+            waypoints = self.calculator._split_waypoints(self.miami, self.anchorage)
+        meters = self.calculator._haversine_meters(self.miami['lat'], self.miami['lng'], self.anchorage['lat'], self.anchorage['lng'])
+        self.assertEqual(len(waypoints) - 1, math.ceil(meters / SPLIT_LEG_METERS))
+        self.assertEqual((waypoints[0], waypoints[-1]), (self.miami['coordinates'], self.anchorage['coordinates']))
+        points = [[float(value) for value in waypoint.split(',')] for waypoint in waypoints]
+        for (lng1, lat1), (lng2, lat2) in zip(points, points[1:]):
+            self.assertLessEqual(self.calculator._haversine_meters(lat1, lng1, lat2, lng2), SPLIT_LEG_METERS)
+
+    def test_long_leg_is_routed_in_parts_and_cached_whole(self):
+        with mock.patch.object(self.ors, 'directions', wraps=self.ors.directions) as directions:
+            leg = self.calculator._route_lane(self.miami, self.anchorage)
+            parts = directions.call_count
+            self.assertEqual(self.calculator._route_lane(self.miami, self.anchorage), leg)
+        self.assertGreaterEqual(parts, 2)
+        self.assertEqual(directions.call_count, parts)
+        self.assertEqual(leg['geometry'][0], [self.miami['lng'], self.miami['lat']])
+        self.assertEqual(leg['geometry'][-1], [self.anchorage['lng'], self.anchorage['lat']])
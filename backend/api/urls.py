@@ -1,8 +1,16 @@
 from django.urls import path
-from .views import TripCalculatorView, TripHistoryView, TripHistoryDetailView
+from .views import TripCalculatorView, AsyncTripCalculatorView, MultiStopTripView, TripBatchCalculatorView, TripPlanView, TripPlanScheduleView, TripJobView, TripJobDetailView, TripHistoryView, HistoryPurgeView, TripHistoryDetailView
 
 urlpatterns = [
     path('calculate-trip/', TripCalculatorView.as_view(), name='calculate-trip'),
+    path('calculate-trip/async/', AsyncTripCalculatorView.as_view(), name='calculate-trip-async'),
+    path('calculate-trip/multi-stop/', MultiStopTripView.as_view(), name='calculate-multi-stop-trip'),
+    path('calculate-trips/', TripBatchCalculatorView.as_view(), name='calculate-trips'),
+    path('trip-plans/', TripPlanView.as_view(), name='trip-plans'),
+    path('trip-plans/<uuid:plan_id>/schedule/', TripPlanScheduleView.as_view(), name='trip-plan-schedule'),
+    path('jobs/', TripJobView.as_view(), name='trip-jobs'),
+    path('jobs/<uuid:job_id>/', TripJobDetailView.as_view(), name='trip-job-detail'),
     path('history/', TripHistoryView.as_view(), name='trip-history'),
+    path('history/purge/', HistoryPurgeView.as_view(), name='trip-history-purge'),
     path('history/<int:history_id>/', TripHistoryDetailView.as_view(), name='trip-history-detail'),
 ]
\ No newline at end of file
@@ -2,42 +2,172 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
-from .logic.hos_calculator import HosCalculator
-from .models import TripHistory
-from .serializers import TripHistorySerializer
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.http import Http404, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from .jobs import callback_host_allowed, create_purge_job, enqueue_job
+from .logic import metrics
+from .logic.geometry import apply_geometry_options, parse_geometry_options
+from .logic.hos_calculator import STOP_DESCRIPTIONS, HosCalculator
+from .models import TripHistory, TripJob, TripPlan
+from .pagination import filter_history, keyset_page
+from .retention import retention_policy
+from .serializers import HISTORY_LIST_FIELDS, TripHistorySerializer, serialize_history_rows
+import json
 import logging
+import datetime
 
 logger = logging.getLogger(__name__)
 
+
+def validate_cycle_hours(value):
+    """Parse ``cycle_hours_used``; returns ``(hours, None)`` or ``(None, error_message)``."""
+    try:
+        cycle_hours = float(value)
+        if cycle_hours < 0 or cycle_hours > 70:
+            return None, 'Cycle hours used must be between 0 and 70 hours.'
+    except (ValueError, TypeError):
+        return None, 'Cycle hours used must be a valid number.'
+    return cycle_hours, None
+
+
+def validate_trip_input(data):
+    """Validate one trip payload; returns ``(trip_data, None)`` or ``(None, error_message)``."""
+    required_fields = ['start_location', 'pickup_location', 'dropoff_location', 'cycle_hours_used']
+    missing_fields = [field for field in required_fields if not data.get(field)]
+
+    if missing_fields:
+        return None, f'Missing required fields: {", ".join(missing_fields)}'
+
+    cycle_hours, error_message = validate_cycle_hours(data.get('cycle_hours_used', 0))
+    if error_message:
+        return None, error_message
+
+    return {
+        'start_location': data.get('start_location'),
+        'pickup_location': data.get('pickup_location'),
+        'dropoff_location': data.get('dropoff_location'),
+        'cycle_hours_used': cycle_hours
+    }, None
+
+
+def parse_departure_time(data):
+    """Optional ``departure_time`` (ISO datetime); returns ``(datetime or None, None)`` or ``(None, error_message)``.
+
+    A value with a UTC offset keeps it, so the logs read in the driver's local time.
+    """
+    value = data.get('departure_time')
+    if value in (None, ''):
+        return None, None
+    try:
+        departure_time = parse_datetime(str(value))
+    except ValueError:
+        departure_time = None
+    if departure_time is None:
+        return None, 'departure_time must be an ISO 8601 datetime.'
+    return departure_time, None
+
+
+def validate_multi_stop_input(data):
+    """Validate a multi-stop trip payload; returns ``(trip_data, None)`` or ``(None, error_message)``.
+
+    Each stop is ``{"location", "type": "pickup"|"dropoff", "id", "after"}``,
+    where ``after`` lists the ids of stops that must be visited before it.
+    In ``trip_data`` those ids become indices into ``stops``.
+    """
+    missing_fields = [field for field in ('start_location', 'cycle_hours_used') if data.get(field) in (None, '')]
+    if missing_fields:
+        return None, f'Missing required fields: {", ".join(missing_fields)}'
+    cycle_hours, error_message = validate_cycle_hours(data.get('cycle_hours_used'))
+    if error_message:
+        return None, error_message
+
+    stops = data.get('stops')
+    if not isinstance(stops, list) or len(stops) < 2:
+        return None, 'Request body must contain a "stops" list with at least 2 stops.'
+    if len(stops) > settings.MULTI_STOP_MAX_STOPS:
+        return None, f'A trip may contain at most {settings.MULTI_STOP_MAX_STOPS} stops.'
+
+    ids = {}
+    for index, stop in enumerate(stops):
+        if not isinstance(stop, dict) or not str(stop.get('location') or '').strip():
+            return None, f'Stop {index} must have a location.'
+        if stop.get('type', 'dropoff') not in STOP_DESCRIPTIONS:
+            return None, f'Stop {index} type must be "pickup" or "dropoff".'
+        if stop.get('id') is not None:
+            if str(stop['id']) in ids:
+                return None, f'Stop id "{stop["id"]}" is used more than once.'
+            ids[str(stop['id'])] = index
+
+    trip_stops = []
+    for index, stop in enumerate(stops):
+        after = stop.get('after') or []
+        after = after if isinstance(after, list) else [after]
+        unknown = [str(required) for required in after if str(required) not in ids]
+        if unknown:
+            return None, f'Stop {index} must come after unknown stop id "{unknown[0]}".'
+        trip_stops.append({
+            'location': stop['location'],
+            'type': stop.get('type', 'dropoff'),
+            'id': stop.get('id'),
+            'after': sorted({ids[str(required)] for required in after}),
+        })
+
+    # Every stop must be reachable in some order: peel off stops whose predecessors are all placed
+    remaining = {index: set(stop['after']) for index, stop in enumerate(trip_stops)}
+    while remaining:
+        ready = [index for index, after in remaining.items() if not after & remaining.keys()]
+        if not ready:
+            return None, 'Stop "after" constraints must not form a cycle.'
+        for index in ready:
+            del remaining[index]
+
+    return {
+        'start_location': data['start_location'],
+        'stops': trip_stops,
+        'cycle_hours_used': cycle_hours
+    }, None
+
+
+def validate_callback_url(url):
+    """Check an optional job callback URL; returns an error message or None."""
+    if not url:
+        return None
+    try:
+        URLValidator(schemes=['http', 'https'])(url)
+    except ValidationError:
+        return 'Callback URL must be a valid http(s) URL.'
+    if not callback_host_allowed(url):
+        return 'Callback URL host is not allowed.'
+    return None
+
+
+def map_calculation_error(error_message):
+    """Translate a calculate_trip error into a client-facing ``(message, status)`` pair."""
+    if 'Location' in error_message and 'could not be found' in error_message:
+        return 'One or more locations could not be found. Please check the spelling and try again.', status.HTTP_400_BAD_REQUEST
+    elif 'route' in error_message.lower() or 'distance' in error_message.lower():
+        return 'Unable to calculate route between the specified locations. Please verify the addresses and try again.', status.HTTP_400_BAD_REQUEST
+    elif 'API' in error_message or 'service' in error_message:
+        return 'Map service is temporarily unavailable. Please try again in a few minutes.', status.HTTP_503_SERVICE_UNAVAILABLE
+    else:
+        return 'Unable to calculate route. Please check your input and try again.', status.HTTP_400_BAD_REQUEST
+
+
 class TripCalculatorView(APIView):
     def post(self, request, *args, **kwargs):
         try:
-            required_fields = ['start_location', 'pickup_location', 'dropoff_location', 'cycle_hours_used']
-            missing_fields = [field for field in required_fields if not request.data.get(field)]
-            
-            if missing_fields:
-                return Response({
-                    'error': f'Missing required fields: {", ".join(missing_fields)}'
-                }, status=status.HTTP_400_BAD_REQUEST)
-
-            cycle_hours = request.data.get('cycle_hours_used', 0)
-            try:
-                cycle_hours = float(cycle_hours)
-                if cycle_hours < 0 or cycle_hours > 70:
-                    return Response({
-                        'error': 'Cycle hours used must be between 0 and 70 hours.'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-            except (ValueError, TypeError):
-                return Response({
-                    'error': 'Cycle hours used must be a valid number.'
-                }, status=status.HTTP_400_BAD_REQUEST)
-
-            trip_data = {
-                'start_location': request.data.get('start_location'),
-                'pickup_location': request.data.get('pickup_location'),
-                'dropoff_location': request.data.get('dropoff_location'),
-                'cycle_hours_used': cycle_hours
-            }
+            trip_data, error_message = validate_trip_input(request.data)
+            if not error_message:
+                geometry_options, error_message = parse_geometry_options(request.data)
+            if error_message:
+                return Response({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
 
             log_info = request.data
 
@@ -59,35 +189,23 @@ class TripCalculatorView(APIView):
             if 'error' in result:
                 logger.error(f"Trip calculation error: {result['error']}")
                 
-                error_message = result['error']
-                if 'Location' in error_message and 'could not be found' in error_message:
-                    return Response({
-                        'error': 'One or more locations could not be found. Please check the spelling and try again.'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-                elif 'route' in error_message.lower() or 'distance' in error_message.lower():
-                    return Response({
-                        'error': 'Unable to calculate route between the specified locations. Please verify the addresses and try again.'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-                elif 'API' in error_message or 'service' in error_message:
-                    return Response({
-                        'error': 'Map service is temporarily unavailable. Please try again in a few minutes.'
-                    }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-                else:
-                    return Response({
-                        'error': 'Unable to calculate route. Please check your input and try again.'
-                    }, status=status.HTTP_400_BAD_REQUEST)
+                error_message, error_status = map_calculation_error(result['error'])
+                return Response({'error': error_message}, status=error_status)
 
             try:
-                TripHistory.objects.create(
+                history_entry = TripHistory(
                     start_location=trip_data['start_location'],
                     pickup_location=trip_data['pickup_location'],
                     dropoff_location=trip_data['dropoff_location'],
                     cycle_hours_used=trip_data['cycle_hours_used']
                 )
+                with metrics.span('db_write'):
+                    history_entry.store_result(result)
+                    history_entry.save()
             except Exception as e:
                 logger.error(f"Error saving trip history: {str(e)}")
 
-            final_response = {**result, "log_info": log_info}
+            final_response = {**apply_geometry_options(result, geometry_options), "log_info": log_info}
 
             return Response(final_response, status=status.HTTP_200_OK)
 
@@ -98,56 +216,536 @@ class TripCalculatorView(APIView):
                 'error': 'An unexpected error occurred. Please try again later.'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class TripHistoryView(APIView):
-    def get(self, request, *args, **kwargs):
+class TripPlanView(APIView):
+    """Route a trip once and keep it as a plan that ``TripPlanScheduleView`` can re-schedule."""
+
+    def post(self, request, *args, **kwargs):
+        """Same body as ``/api/calculate-trip/`` (plus optional ``departure_time``); returns the trip and its ``plan_id``."""
         try:
-            history = TripHistory.objects.all()[:50]  # Limit to last 50 entries
-            serializer = TripHistorySerializer(history, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            trip_data, error_message = validate_trip_input(request.data)
+            if not error_message:
+                departure_time, error_message = parse_departure_time(request.data)
+            if not error_message:
+                geometry_options, error_message = parse_geometry_options(request.data)
+            if error_message:
+                return Response({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+            if not settings.ORS_API_KEY:
+                logger.error("ORS_API_KEY not configured")
+                return Response({
+                    'error': 'Map service configuration error. Please contact support.'
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            calculator = HosCalculator(api_key=settings.ORS_API_KEY)
+            plan_data = calculator.plan_trip(
+                trip_data['start_location'],
+                trip_data['pickup_location'],
+                trip_data['dropoff_location']
+            )
+            result = plan_data if 'error' in plan_data else calculator.schedule_plan(
+                plan_data, trip_data['cycle_hours_used'], departure_time,
+            )
+            if 'error' in result:
+                logger.error(f"Trip plan error: {result['error']}")
+                error_message, error_status = map_calculation_error(result['error'])
+                return Response({'error': error_message}, status=error_status)
+
+            with metrics.span('db_write'):
+                plan = TripPlan(
+                    start_location=trip_data['start_location'],
+                    pickup_location=trip_data['pickup_location'],
+                    dropoff_location=trip_data['dropoff_location'],
+                )
+                plan.store_plan(plan_data)
+                plan.save()
+
+            return Response({
+                'plan_id': str(plan.id),
+                'schedule_url': reverse('trip-plan-schedule', args=[plan.id]),
+                **apply_geometry_options(result, geometry_options),
+                'log_info': request.data,
+            }, status=status.HTTP_201_CREATED)
+
         except Exception as e:
-            logger.error(f"Error retrieving trip history: {str(e)}")
+            logger.error(f"Unexpected error creating trip plan: {str(e)}", exc_info=True)
             return Response({
-                'error': 'Unable to retrieve trip history.'
+                'error': 'An unexpected error occurred. Please try again later.'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def delete(self, request, *args, **kwargs):
+
+def trip_plan_cutoff():
+    # Expired plans are only deleted by purge_trip_history, so reads must skip them
+    return timezone.now() - datetime.timedelta(seconds=settings.TRIP_PLAN_TTL)
+
+
+class TripPlanScheduleView(APIView):
+    def post(self, request, plan_id, *args, **kwargs):
+        """Re-run only HOS scheduling for a stored plan with new ``cycle_hours_used`` / ``departure_time``."""
         try:
-            TripHistory.objects.all().delete()
+            data = request.data if isinstance(request.data, dict) else {}
+            if data.get('cycle_hours_used') in (None, ''):
+                return Response({'error': 'Missing required fields: cycle_hours_used'}, status=status.HTTP_400_BAD_REQUEST)
+            cycle_hours, error_message = validate_cycle_hours(data['cycle_hours_used'])
+            if not error_message:
+                departure_time, error_message = parse_departure_time(data)
+            if not error_message:
+                geometry_options, error_message = parse_geometry_options(data)
+            if error_message:
+                return Response({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Scheduling names event places through ORS reverse geocoding
+            if not settings.ORS_API_KEY:
+                logger.error("ORS_API_KEY not configured")
+                return Response({
+                    'error': 'Map service configuration error. Please contact support.'
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            with metrics.span('db_read'):
+                plan = TripPlan.objects.get(id=plan_id, created_at__gte=trip_plan_cutoff())
+                plan_data = plan.load_plan()
+
+            calculator = HosCalculator(api_key=settings.ORS_API_KEY)
+            result = calculator.schedule_plan(plan_data, cycle_hours, departure_time)
+            if 'error' in result:
+                logger.error(f"Trip plan scheduling error: {result['error']}")
+                error_message, error_status = map_calculation_error(result['error'])
+                return Response({'error': error_message}, status=error_status)
+
             return Response({
-                'message': 'All trip history entries deleted successfully.'
+                'plan_id': str(plan.id),
+                **apply_geometry_options(result, geometry_options),
+                'log_info': data,
             }, status=status.HTTP_200_OK)
+
+        except TripPlan.DoesNotExist:
+            return Response({
+                'error': 'Trip plan not found or expired.'
+            }, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
-            logger.error(f"Error deleting all trip history entries: {str(e)}")
+            logger.error(f"Unexpected error scheduling trip plan: {str(e)}", exc_info=True)
             return Response({
-                'error': 'Unable to delete all trip history entries.'
+                'error': 'An unexpected error occurred. Please try again later.'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class TripHistoryDetailView(APIView):
-    def get(self, request, history_id, *args, **kwargs):
+
+class MultiStopTripView(APIView):
+    """Plan one trip through many pickups and dropoffs (``{"start_location", "stops": [...]}``).
+
+    Stops are visited in the order ``calculate_multi_stop_trip`` finds best
+    under the ``after`` constraints; ``stop_order`` in the response gives it.
+    """
+
+    def post(self, request, *args, **kwargs):
         try:
-            history_entry = TripHistory.objects.get(id=history_id)
-            
+            data = request.data if isinstance(request.data, dict) else {}
+            trip_data, error_message = validate_multi_stop_input(data)
+            if not error_message:
+                geometry_options, error_message = parse_geometry_options(data)
+            if error_message:
+                return Response({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
+
             if not settings.ORS_API_KEY:
+                logger.error("ORS_API_KEY not configured")
                 return Response({
                     'error': 'Map service configuration error. Please contact support.'
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
             calculator = HosCalculator(api_key=settings.ORS_API_KEY)
-            
-            result = calculator.calculate_trip(
-                history_entry.start_location,
-                history_entry.pickup_location,
-                history_entry.dropoff_location,
-                history_entry.cycle_hours_used
+            result = calculator.calculate_multi_stop_trip(
+                trip_data['start_location'],
+                trip_data['stops'],
+                trip_data['cycle_hours_used']
             )
 
             if 'error' in result:
+                logger.error(f"Multi-stop trip calculation error: {result['error']}")
+                error_message, error_status = map_calculation_error(result['error'])
+                return Response({'error': error_message}, status=error_status)
+
+            final_response = {**apply_geometry_options(result, geometry_options), "log_info": data}
+            return Response(final_response, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            logger.error(f"Unexpected error in multi-stop trip calculation: {str(e)}", exc_info=True)
+
+            return Response({
+                'error': 'An unexpected error occurred. Please try again later.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncTripCalculatorView(View):
+    """Native async variant of ``TripCalculatorView`` for ASGI deployments.
+
+    ORS calls are awaited on the event loop instead of holding a worker
+    thread, so a single ASGI process can keep many calculations in flight.
+    Request and response bodies match ``TripCalculatorView``.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError:
+                return JsonResponse({'error': 'Request body must be valid JSON.'}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(data, dict):
+                data = {}
+
+            trip_data, error_message = validate_trip_input(data)
+            if not error_message:
+                geometry_options, error_message = parse_geometry_options(data)
+            if error_message:
+                return JsonResponse({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+            if not settings.ORS_API_KEY:
+                logger.error("ORS_API_KEY not configured")
+                return JsonResponse({
+                    'error': 'Map service configuration error. Please contact support.'
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            calculator = HosCalculator(api_key=settings.ORS_API_KEY)
+
+            result = await calculator.acalculate_trip(
+                trip_data['start_location'],
+                trip_data['pickup_location'],
+                trip_data['dropoff_location'],
+                trip_data['cycle_hours_used']
+            )
+
+            if 'error' in result:
+                logger.error(f"Trip calculation error: {result['error']}")
+
+                error_message, error_status = map_calculation_error(result['error'])
+                return JsonResponse({'error': error_message}, status=error_status)
+
+            try:
+                history_entry = TripHistory(
+                    start_location=trip_data['start_location'],
+                    pickup_location=trip_data['pickup_location'],
+                    dropoff_location=trip_data['dropoff_location'],
+                    cycle_hours_used=trip_data['cycle_hours_used']
+                )
+                with metrics.span('db_write'):
+                    history_entry.store_result(result)
+                    await history_entry.asave()
+            except Exception as e:
+                logger.error(f"Error saving trip history: {str(e)}")
+
+            final_response = {**apply_geometry_options(result, geometry_options), "log_info": data}
+
+            with metrics.span('serialize'):
+                return JsonResponse(final_response, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            logger.error(f"Unexpected error in trip calculation: {str(e)}", exc_info=True)
+
+            return JsonResponse({
+                'error': 'An unexpected error occurred. Please try again later.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class TripBatchCalculatorView(APIView):
+    """Calculate a list of trips in one request (``{"trips": [...]}``) for fleet-wide planning."""
+
+    def post(self, request, *args, **kwargs):
+        try:
+            trips = request.data.get('trips') if isinstance(request.data, dict) else request.data
+            if not isinstance(trips, list) or not trips:
                 return Response({
-                    'error': result['error']
+                    'error': 'Request body must contain a non-empty "trips" list.'
                 }, status=status.HTTP_400_BAD_REQUEST)
+            if len(trips) > settings.BATCH_MAX_TRIPS:
+                return Response({
+                    'error': f'A batch may contain at most {settings.BATCH_MAX_TRIPS} trips.'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            geometry_options, error_message = parse_geometry_options(request.data if isinstance(request.data, dict) else {})
+            if error_message:
+                return Response({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+            if not settings.ORS_API_KEY:
+                logger.error("ORS_API_KEY not configured")
+                return Response({
+                    'error': 'Map service configuration error. Please contact support.'
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            results = [None] * len(trips)
+            valid = []
+            for index, trip in enumerate(trips):
+                trip_data, error_message = validate_trip_input(trip if isinstance(trip, dict) else {})
+                if error_message:
+                    results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'error': error_message}
+                else:
+                    valid.append((index, trip_data))
+
+            calculator = HosCalculator(api_key=settings.ORS_API_KEY)
+            calculated = calculator.calculate_trips([trip_data for _, trip_data in valid])
+
+            history_rows = []
+            for (index, trip_data), result in zip(valid, calculated):
+                if 'error' in result:
+                    error_message, error_status = map_calculation_error(result['error'])
+                    results[index] = {'index': index, 'status': error_status, 'error': error_message}
+                    continue
+                results[index] = {
+                    'index': index,
+                    'status': status.HTTP_200_OK,
+                    **apply_geometry_options(result, geometry_options),
+                    'log_info': trips[index],
+                }
+                history_rows.append((trip_data, result))
+
+            try:
+                with metrics.span('db_write'):
+                    entries = []
+                    for trip_data, result in history_rows:
+                        history_entry = TripHistory(**trip_data)
+                        history_entry.store_result(result)
+                        entries.append(history_entry)
+                    TripHistory.objects.bulk_create(entries, batch_size=500)
+            except Exception as e:
+                logger.error(f"Error saving batch trip history: {str(e)}")
+
+            succeeded = len(history_rows)
+            return Response({
+                'results': results,
+                'summary': {'total': len(trips), 'succeeded': succeeded, 'failed': len(trips) - succeeded}
+            }, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            logger.error(f"Unexpected error in batch trip calculation: {str(e)}", exc_info=True)
+            
+            return Response({
+                'error': 'An unexpected error occurred. Please try again later.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class TripJobView(APIView):
+    """Queue a trip calculation and answer ``202`` with a job id right away.
+
+    Accepts the ``TripCalculatorView`` payload plus an optional
+    ``callback_url`` that is POSTed ``{id, status, status_url}`` once the job
+    finishes. Poll ``status_url`` for the result otherwise.
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            trip_data, error_message = validate_trip_input(request.data)
+            if not error_message:
+                _, error_message = parse_geometry_options(request.data)
+            callback_url = str(request.data.get('callback_url') or '').strip()
+            if not error_message:
+                error_message = validate_callback_url(callback_url)
+            if error_message:
+                return Response({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+            if not settings.ORS_API_KEY:
+                logger.error("ORS_API_KEY not configured")
+                return Response({
+                    'error': 'Map service configuration error. Please contact support.'
+                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            request_data = request.data.dict() if hasattr(request.data, 'dict') else dict(request.data)
+            with metrics.span('db_write'):
+                job = TripJob.objects.create(**trip_data, request_data=request_data, callback_url=callback_url)
+            enqueue_job(job)
+
+            status_url = reverse('trip-job-detail', args=[job.id])
+            return Response({
+                'id': str(job.id),
+                'status': job.status,
+                'status_url': status_url,
+            }, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+
+        except Exception as e:
+            logger.error(f"Unexpected error queueing trip job: {str(e)}", exc_info=True)
+            return Response({
+                'error': 'An unexpected error occurred. Please try again later.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class TripJobDetailView(APIView):
+    def get(self, request, job_id, *args, **kwargs):
+        """Job status; the calculated trip (as ``TripCalculatorView`` returns it) once succeeded."""
+        try:
+            job = TripJob.objects.get(id=job_id)
+            body = {
+                'id': str(job.id),
+                'kind': job.kind,
+                'status': job.status,
+                'created_at': job.created_at,
+                'started_at': job.started_at,
+                'finished_at': job.finished_at,
+            }
+            if job.kind == TripJob.KIND_HISTORY_PURGE:
+                body['progress'] = job.progress
+                if job.status == TripJob.STATUS_FAILED:
+                    body['error'] = 'Unable to delete trip history.'
+            elif job.status == TripJob.STATUS_SUCCEEDED:
+                geometry_options, _ = parse_geometry_options(job.request_data)
+                body['result'] = {**apply_geometry_options(job.load_result(), geometry_options), 'log_info': job.request_data}
+                body['history_id'] = job.history_entry_id
+            elif job.status == TripJob.STATUS_FAILED:
+                body['error'], body['error_status'] = map_calculation_error(job.error)
+            return Response(body, status=status.HTTP_200_OK)
+
+        except TripJob.DoesNotExist:
+            return Response({
+                'error': 'Trip job not found.'
+            }, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"Error retrieving trip job: {str(e)}")
+            return Response({
+                'error': 'An unexpected error occurred. Please try again later.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def delete(self, request, job_id, *args, **kwargs):
+        """Cancel a job that no worker has picked up yet."""
+        try:
+            cancelled = TripJob.objects.filter(id=job_id, status=TripJob.STATUS_QUEUED).update(
+                status=TripJob.STATUS_CANCELLED, finished_at=timezone.now(),
+            )
+            if cancelled:
+                return Response({'message': 'Trip job cancelled.'}, status=status.HTTP_200_OK)
+            if not TripJob.objects.filter(id=job_id).exists():
+                return Response({'error': 'Trip job not found.'}, status=status.HTTP_404_NOT_FOUND)
+            return Response({
+                'error': 'Trip job has already started and can no longer be cancelled.'
+            }, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            logger.error(f"Error cancelling trip job: {str(e)}")
+            return Response({
+                'error': 'An unexpected error occurred. Please try again later.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class TripHistoryView(APIView):
+    def get(self, request, *args, **kwargs):
+        try:
+            try:
+                limit = int(request.query_params.get('limit') or settings.HISTORY_PAGE_SIZE)
+                if limit < 1:
+                    raise ValueError
+            except ValueError:
+                return Response({'error': 'limit must be a positive whole number.'}, status=status.HTTP_400_BAD_REQUEST)
+            limit = min(limit, settings.HISTORY_PAGE_MAX)
+
+            # Keyset pagination: the X-Next-Cursor value is passed back as ?cursor=
+            try:
+                history = filter_history(TripHistory.objects.values(*HISTORY_LIST_FIELDS), request.query_params)
+                rows, next_cursor = keyset_page(history, request.query_params.get('cursor'), limit)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            response = Response(serialize_history_rows(rows), status=status.HTTP_200_OK)
+            if next_cursor:
+                params = request.query_params.copy()
+                params['cursor'] = next_cursor
+                response['X-Next-Cursor'] = next_cursor
+                response['Link'] = f'<{request.build_absolute_uri(request.path)}?{params.urlencode()}>; rel="next"'
+            return response
+        except Exception as e:
+            logger.error(f"Error retrieving trip history: {str(e)}")
+            return Response({
+                'error': 'Unable to retrieve trip history.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def delete(self, request, *args, **kwargs):
+        """Delete all history in the background, in batches; answers 202 with the purge job."""
+        try:
+            job = create_purge_job()
+            status_url = reverse('trip-job-detail', args=[job.id])
+            return Response({
+                'message': 'All trip history entries are being deleted.',
+                'id': str(job.id),
+                'status': job.status,
+                'status_url': status_url,
+            }, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+        except Exception as e:
+            logger.error(f"Error deleting all trip history entries: {str(e)}")
+            return Response({
+                'error': 'Unable to delete all trip history entries.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class HistoryPurgeView(APIView):
+    """Queue a batched purge of old history: ``older_than_days`` and/or ``keep_rows`` (newest N).
+
+    Without either, the configured retention policy applies.
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            limits = {}
+            for name in ('older_than_days', 'keep_rows'):
+                value = request.data.get(name)
+                if value in (None, ''):
+                    continue
+                try:
+                    limits[name] = int(value)
+                    if limits[name] < 0:
+                        raise ValueError
+                except (ValueError, TypeError):
+                    return Response({'error': f'{name} must be a non-negative whole number.'}, status=status.HTTP_400_BAD_REQUEST)
+            if not limits:
+                older_than_days, keep_rows = retention_policy()
+                limits = {'older_than_days': older_than_days, 'keep_rows': keep_rows}
+                if older_than_days is None and keep_rows is None:
+                    return Response({
+                        'error': 'Provide older_than_days or keep_rows; no retention policy is configured.'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+
+            job = create_purge_job(**limits)
+            status_url = reverse('trip-job-detail', args=[job.id])
+            return Response({
+                'id': str(job.id),
+                'status': job.status,
+                'status_url': status_url,
+            }, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+        except Exception as e:
+            logger.error(f"Error queueing trip history purge: {str(e)}")
+            return Response({
+                'error': 'An unexpected error occurred. Please try again later.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class TripHistoryDetailView(APIView):
+    def get(self, request, history_id, *args, **kwargs):
+        try:
+            history_entry = TripHistory.objects.get(id=history_id)
+
+            geometry_options, error_message = parse_geometry_options(request.query_params)
+            if error_message:
+                return Response({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Serve the stored result unless the client explicitly asks for a fresh calculation
+            recompute = request.query_params.get('recompute', '').lower() in ('1', 'true', 'yes')
+            result = None if recompute else history_entry.load_result()
+
+            if result is None:
+                if not settings.ORS_API_KEY:
+                    return Response({
+                        'error': 'Map service configuration error. Please contact support.'
+                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+                calculator = HosCalculator(api_key=settings.ORS_API_KEY)
+                
+                result = calculator.calculate_trip(
+                    history_entry.start_location,
+                    history_entry.pickup_location,
+                    history_entry.dropoff_location,
+                    history_entry.cycle_hours_used
+                )
+
+                if 'error' in result:
+                    return Response({
+                        'error': result['error']
+                    }, status=status.HTTP_400_BAD_REQUEST)
+
+                try:
+                    with metrics.span('db_write'):
+                        history_entry.store_result(result)
+                        history_entry.save(update_fields=['result_data', 'result_encoding'])
+                except Exception as e:
+                    logger.error(f"Error storing recomputed trip result: {str(e)}")
 
             final_response = {
-                **result,
+                **apply_geometry_options(result, geometry_options),
                 "log_info": {
                     'driver_name': 'Mahder Tesfaye Abebe',
                     'driver_license': 'DL123456789',
@@ -194,4 +792,16 @@ class TripHistoryDetailView(APIView):
             logger.error(f"Error deleting trip history entry: {str(e)}")
             return Response({
                 'error': 'An unexpected error occurred while deleting the entry. Please try again later.'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def metrics_view(request):
+    """Prometheus text exposition of this process's metrics (``METRICS_ENABLED``, bearer ``METRICS_TOKEN``).
+
+    Outside DEBUG the endpoint needs a token, so it isn't public by default.
+    """
+    if not settings.METRICS_ENABLED or not (settings.DEBUG or settings.METRICS_TOKEN):
+        raise Http404()
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {settings.METRICS_TOKEN}":
+        return HttpResponse('Unauthorized', status=status.HTTP_401_UNAUTHORIZED, content_type='text/plain')
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -8,6 +8,92 @@ load_dotenv(os.path.join(BASE_DIR, '.env'))
 
 SECRET_KEY = os.getenv('SECRET_KEY')
 ORS_API_KEY = os.getenv('ORS_API_KEY')
+# Issue independent geocoding/routing calls for a trip concurrently
+ORS_CONCURRENT_REQUESTS = os.getenv('ORS_CONCURRENT_REQUESTS', 'True').lower() == 'true'
+# ... on one thread pool per process of at most this many threads; calls made from a pool thread run inline
+ORS_CONCURRENCY_POOL_SIZE = int(os.getenv('ORS_CONCURRENCY_POOL_SIZE', '32'))
+
+# HOS engine: 'loop' (event-by-event reference) or 'closed_form' (whole duty days at a time)
+HOS_SCHEDULE_ENGINE = os.getenv('HOS_SCHEDULE_ENGINE', 'loop')
+
+# Trip results stored with each history entry
+TRIP_RESULT_COMPRESSION = os.getenv('TRIP_RESULT_COMPRESSION', 'True').lower() == 'true'
+TRIP_RESULT_COMPRESSION_LEVEL = int(os.getenv('TRIP_RESULT_COMPRESSION_LEVEL', '6'))
+
+# Trip history list page size (?limit=) and its upper bound
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '50'))
+HISTORY_PAGE_MAX = int(os.getenv('HISTORY_PAGE_MAX', '500'))
+
+# History retention (purge_trip_history): drop entries older than HISTORY_RETENTION_DAYS and/or
+# beyond the newest HISTORY_RETENTION_MAX_ROWS (0 disables either), deleting in small batches
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '0'))
+HISTORY_RETENTION_MAX_ROWS = int(os.getenv('HISTORY_RETENTION_MAX_ROWS', '0'))
+HISTORY_PURGE_BATCH_SIZE = int(os.getenv('HISTORY_PURGE_BATCH_SIZE', '1000'))
+HISTORY_PURGE_BATCH_PAUSE = float(os.getenv('HISTORY_PURGE_BATCH_PAUSE', '0.05'))
+
+# Batch trip calculation (/api/calculate-trips/)
+BATCH_MAX_TRIPS = int(os.getenv('BATCH_MAX_TRIPS', '5000'))
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '8'))
+
+# Identical concurrent trip calculations share one computation (single flight).
+# TRIP_COALESCE_SHARED extends this across workers through the named cache.
+TRIP_COALESCE_ENABLED = os.getenv('TRIP_COALESCE_ENABLED', 'True').lower() == 'true'
+TRIP_COALESCE_SHARED = os.getenv('TRIP_COALESCE_SHARED', 'False').lower() == 'true'
+TRIP_COALESCE_CACHE_ALIAS = os.getenv('TRIP_COALESCE_CACHE_ALIAS', 'default')
+TRIP_COALESCE_WAIT = float(os.getenv('TRIP_COALESCE_WAIT', '30'))
+TRIP_COALESCE_POLL_INTERVAL = float(os.getenv('TRIP_COALESCE_POLL_INTERVAL', '0.05'))
+TRIP_COALESCE_LOCK_TTL = int(os.getenv('TRIP_COALESCE_LOCK_TTL', '60'))
+TRIP_COALESCE_RESULT_TTL = int(os.getenv('TRIP_COALESCE_RESULT_TTL', '30'))
+
+# Background trip jobs (/api/jobs/): 'thread' runs them on a pool in each web process,
+# 'external' leaves them to `manage.py run_trip_worker` processes.
+TRIP_JOB_EXECUTOR = os.getenv('TRIP_JOB_EXECUTOR', 'thread')
+TRIP_JOB_WORKERS = int(os.getenv('TRIP_JOB_WORKERS', '4'))
+TRIP_JOB_POLL_INTERVAL = float(os.getenv('TRIP_JOB_POLL_INTERVAL', '1'))
+# Running jobs not finished after TRIP_JOB_TIMEOUT seconds are retried, up to TRIP_JOB_MAX_ATTEMPTS runs
+TRIP_JOB_TIMEOUT = int(os.getenv('TRIP_JOB_TIMEOUT', '600'))
+TRIP_JOB_MAX_ATTEMPTS = int(os.getenv('TRIP_JOB_MAX_ATTEMPTS', '3'))
+TRIP_JOB_CALLBACK_TIMEOUT = float(os.getenv('TRIP_JOB_CALLBACK_TIMEOUT', '10'))
+# Hosts completion callbacks may be sent to (comma-separated; empty allows any host with only public addresses)
+TRIP_JOB_CALLBACK_HOSTS = [host for host in os.getenv('TRIP_JOB_CALLBACK_HOSTS', '').split(',') if host]
+# Finished jobs (and their stored results) are deleted by purge_trip_history this many days
+# after finishing (0 keeps them)
+TRIP_JOB_RETENTION_DAYS = int(os.getenv('TRIP_JOB_RETENTION_DAYS', '7'))
+
+# Shared OpenRouteService HTTP client
+ORS_BASE_URL = os.getenv('ORS_BASE_URL', 'https://api.openrouteservice.org')
+ORS_POOL_SIZE = int(os.getenv('ORS_POOL_SIZE', '20'))
+ORS_RETRIES = int(os.getenv('ORS_RETRIES', '2'))
+ORS_RETRY_BACKOFF = float(os.getenv('ORS_RETRY_BACKOFF', '0.5'))
+ORS_TIMEOUT_GEOCODE = float(os.getenv('ORS_TIMEOUT_GEOCODE', '10'))
+ORS_TIMEOUT_REVERSE = float(os.getenv('ORS_TIMEOUT_REVERSE', '10'))
+ORS_TIMEOUT_DIRECTIONS = float(os.getenv('ORS_TIMEOUT_DIRECTIONS', '15'))
+ORS_TIMEOUT_MATRIX = float(os.getenv('ORS_TIMEOUT_MATRIX', '15'))
+
+# ORS plan quotas, shared by all workers through the named cache ("" disables).
+# Defaults are the free plan: endpoint=count/period, period one of s, min, hour, day.
+ORS_RATE_LIMITS = os.getenv(
+    'ORS_RATE_LIMITS',
+    'geocode=100/min,geocode=1000/day,reverse=100/min,reverse=1000/day,directions=40/min,directions=2000/day,'
+    'matrix=40/min,matrix=500/day',
+)
+ORS_RATE_LIMIT_CACHE_ALIAS = os.getenv('ORS_RATE_LIMIT_CACHE_ALIAS', 'default')
+ORS_RATE_LIMIT_MAX_WAIT = float(os.getenv('ORS_RATE_LIMIT_MAX_WAIT', '2'))
+
+# Stop calling an ORS endpoint for ORS_BREAKER_COOLDOWN seconds once ORS_BREAKER_FAILURE_RATE
+# of at least ORS_BREAKER_MIN_CALLS calls within ORS_BREAKER_WINDOW seconds failed
+ORS_BREAKER_ENABLED = os.getenv('ORS_BREAKER_ENABLED', 'True').lower() == 'true'
+ORS_BREAKER_FAILURE_RATE = float(os.getenv('ORS_BREAKER_FAILURE_RATE', '0.5'))
+ORS_BREAKER_MIN_CALLS = int(os.getenv('ORS_BREAKER_MIN_CALLS', '10'))
+ORS_BREAKER_WINDOW = float(os.getenv('ORS_BREAKER_WINDOW', '30'))
+ORS_BREAKER_COOLDOWN = float(os.getenv('ORS_BREAKER_COOLDOWN', '30'))
+ORS_BREAKER_CACHE_ALIAS = os.getenv('ORS_BREAKER_CACHE_ALIAS', 'default')
+
+# Observability: Prometheus-style /metrics and a Server-Timing header on every response.
+# With DEBUG off, /metrics is only served when METRICS_TOKEN is set.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'True').lower() == 'true'
 
 DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
@@ -26,6 +112,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -61,6 +148,56 @@ DATABASES = {
     }
 }
 DATABASES['default'] = dj_database_url.parse(os.getenv('DATABASE_URL'))
+
+# Point CACHE_BACKEND at Redis/Memcached/DatabaseCache in production so the
+# shared cache tiers are shared across all gunicorn workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Geocoding cache (in-process LRU in front of the shared Django cache above)
+GEOCODE_CACHE_ALIAS = os.getenv('GEOCODE_CACHE_ALIAS', 'default')
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', str(7 * 24 * 3600)))
+GEOCODE_CACHE_NEGATIVE_TTL = int(os.getenv('GEOCODE_CACHE_NEGATIVE_TTL', '3600'))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', '2048'))
+
+# Route cache (per process, bounded by memory rather than entry count)
+ROUTE_CACHE_TTL = int(os.getenv('ROUTE_CACHE_TTL', str(24 * 3600)))
+ROUTE_CACHE_PRECISION = int(os.getenv('ROUTE_CACHE_PRECISION', '4'))  # decimal places, ~11 m
+ROUTE_CACHE_MAX_ENTRIES = int(os.getenv('ROUTE_CACHE_MAX_ENTRIES', '4096'))
+ROUTE_CACHE_MAX_BYTES = int(os.getenv('ROUTE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Matrix cache: one travel time/distance per ordered location pair, so a matrix
+# request whose pairs are all known skips ORS entirely
+MATRIX_CACHE_TTL = int(os.getenv('MATRIX_CACHE_TTL', str(24 * 3600)))
+MATRIX_CACHE_MAX_ENTRIES = int(os.getenv('MATRIX_CACHE_MAX_ENTRIES', '100000'))
+
+# Trip plans (POST /api/trip-plans/) can be re-scheduled for this long (seconds) after
+# routing; older ones are deleted by purge_trip_history
+TRIP_PLAN_TTL = int(os.getenv('TRIP_PLAN_TTL', '604800'))
+
+# Multi-stop trips (POST /api/calculate-trip/multi-stop/)
+MULTI_STOP_MAX_STOPS = int(os.getenv('MULTI_STOP_MAX_STOPS', '20'))
+
+# Place names for log events (off by default: each name is an ORS reverse geocode).
+# Points are snapped to a grid, deduplicated and reverse geocoded only for cells
+# not already in the place cache, at most PLACE_LOOKUPS_PER_REQUEST per request
+EVENT_PLACE_NAMES = os.getenv('EVENT_PLACE_NAMES', 'False').lower() == 'true'
+PLACE_GRID_DEGREES = float(os.getenv('PLACE_GRID_DEGREES', '0.5'))  # ~55 km cells
+PLACE_LOOKUPS_PER_REQUEST = int(os.getenv('PLACE_LOOKUPS_PER_REQUEST', '8'))
+PLACE_CACHE_ALIAS = os.getenv('PLACE_CACHE_ALIAS', GEOCODE_CACHE_ALIAS)
+PLACE_CACHE_TTL = int(os.getenv('PLACE_CACHE_TTL', str(30 * 24 * 3600)))
+PLACE_CACHE_NEGATIVE_TTL = int(os.getenv('PLACE_CACHE_NEGATIVE_TTL', str(24 * 3600)))
+PLACE_CACHE_MAX_ENTRIES = int(os.getenv('PLACE_CACHE_MAX_ENTRIES', '8192'))
+
+# Truck stop / fuel station POIs (CSV or GeoJSON, loaded once per process) that
+# fuel stops and rest resets snap to when one lies within the corridor
+TRUCK_STOP_POI_FILE = os.getenv('TRUCK_STOP_POI_FILE', '')
+POI_CORRIDOR_METERS = float(os.getenv('POI_CORRIDOR_METERS', '8000'))
+POI_BUCKET_DEGREES = float(os.getenv('POI_BUCKET_DEGREES', '0.1'))
 AUTH_PASSWORD_VALIDATORS = [
     { 'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator', },
     { 'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator', },
@@ -81,6 +218,9 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  
 ]
 
+# Let browser clients read the history pagination cursor
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor', 'Link']
+
 csrf_env = [o.strip() for o in os.getenv('CSRF_TRUSTED_ORIGINS', '').split(',') if o.strip()]
 CSRF_TRUSTED_ORIGINS = csrf_env
 
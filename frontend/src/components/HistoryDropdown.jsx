@@ -30,7 +30,7 @@ const HistoryDropdown = ({ onHistorySelect, isOpen, setIsOpen }) => {
 
   const handleHistoryClick = async (historyId) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/history/${historyId}/`);
+      const response = await fetch(`${API_BASE_URL}/history/${historyId}/?geometry_format=polyline`);
       const data = await response.json();
       
       if (!response.ok) {
@@ -45,6 +45,23 @@ const HistoryDropdown = ({ onHistorySelect, isOpen, setIsOpen }) => {
     }
   };
 
+  const waitForJob = async (jobId) => {
+    for (;;) {
+      await new Promise(resolve => setTimeout(resolve, 1000));
+      const response = await fetch(`${API_BASE_URL}/jobs/${jobId}/`);
+      const data = await response.json().catch(() => ({}));
+      if (!response.ok) {
+        throw new Error(data.error || 'Failed to check job status');
+      }
+      if (data.status === 'succeeded') {
+        return data;
+      }
+      if (data.status === 'failed' || data.status === 'cancelled') {
+        throw new Error(data.error || 'Job did not finish');
+      }
+    }
+  };
+
   const deleteHistory = async (historyId, event) => {
     event.stopPropagation();
     
@@ -127,10 +144,14 @@ const HistoryDropdown = ({ onHistorySelect, isOpen, setIsOpen }) => {
                     setHistory([]);
                     try {
                       const resp = await fetch(`${API_BASE_URL}/history/`, { method: 'DELETE' });
+                      const data = await resp.json().catch(() => ({}));
                       if (!resp.ok) {
-                        const data = await resp.json().catch(() => ({}));
                         throw new Error(data.error || 'Failed to delete all');
                       }
+                      // The rows are deleted by a background job; wait for it to finish
+                      if (resp.status === 202) {
+                        await waitForJob(data.id);
+                      }
                     } catch (err) {
                       console.error('Error deleting all history:', err);
                       setHistory(prev);
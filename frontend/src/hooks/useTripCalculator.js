@@ -1,6 +1,7 @@
 import { useState } from 'react';
 import { getErrorMessage, validateTripDetails } from '../utils/errorUtils';
 import { API_BASE_URL } from '../utils/api';
+import { withDecodedGeometry } from '../utils/tripUtils';
 
 // Default values (not visible on frontend)
 const DEFAULT_VALUES = {
@@ -45,7 +46,8 @@ export const useTripCalculator = () => {
     // Merge with default values before sending to API
     const submissionData = {
       ...DEFAULT_VALUES,
-      ...tripDetails
+      ...tripDetails,
+      geometry_format: 'polyline'
     };
 
     try {
@@ -67,7 +69,7 @@ export const useTripCalculator = () => {
       if (data.error) {
         setError(getErrorMessage(data.error, response.status));
       } else {
-        setRouteData(data);
+        setRouteData(withDecodedGeometry(data));
       }
     } catch (err) {
       console.error('API Error:', err); // Debug log
@@ -95,7 +97,7 @@ export const useTripCalculator = () => {
     });
     
     // Set the route data
-    setRouteData(historyData);
+    setRouteData(withDecodedGeometry(historyData));
     
     // Clear any existing errors
     setError(null);
@@ -123,3 +123,37 @@ const formatDuration = (hours) => {
     return `${minutes}m`;
   }
 };
+
+// Decode a Google encoded polyline (precision 5) into [lng, lat] pairs,
+// the same shape the API uses for uncompressed route geometry.
+export const decodePolyline = (encoded) => {
+  const coordinates = [];
+  let index = 0;
+  let lat = 0;
+  let lng = 0;
+
+  while (index < encoded.length) {
+    const deltas = [];
+    for (let i = 0; i < 2; i++) {
+      let shift = 0;
+      let result = 0;
+      let byte;
+      do {
+        byte = encoded.charCodeAt(index++) - 63;
+        result |= (byte & 0x1f) << shift;
+        shift += 5;
+      } while (byte >= 0x20);
+      deltas.push(result & 1 ? ~(result >> 1) : result >> 1);
+    }
+    lat += deltas[0];
+    lng += deltas[1];
+    coordinates.push([lng / 1e5, lat / 1e5]);
+  }
+  return coordinates;
+};
+
+// The map and itinerary work on [lng, lat] arrays; expand an encoded route once on arrival.
+export const withDecodedGeometry = (routeData) => {
+  if (!routeData || typeof routeData.route_geometry !== 'string') return routeData;
+  return { ...routeData, route_geometry: decodePolyline(routeData.route_geometry) };
+};